@@ -3,4 +3,5 @@ from __future__ import (absolute_import)
 __version__ = "1.0.0"
 
 from .calibrate_qacits import *
-from .run_qacits import *
\ No newline at end of file
+from .run_qacits import *
+from .calibrate_center import *
@@ -0,0 +1,3 @@
+from qacits.cli import main
+
+main()
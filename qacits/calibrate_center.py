@@ -0,0 +1,141 @@
+from qacits.util.psf_flux import get_psf_flux, get_di_weights, resolve_exact
+import numpy as np
+
+
+def calibrate_center(psf_ON, psf_OFF, img_sampling, tt_lamD=None, cx=None, cy=None,
+        coeffs={'inner':1, 'outer':1, 'full':1},
+        radii={'inner':(0,1.7), 'outer':(1.7,2.3), 'full':(0,2.7)},
+        regions=['inner', 'outer'], search_rad=1., npts=21, nrefine=3,
+        ratio=0, sign=1, exact=None, full_output=False, verbose=False, **qacits_params):
+
+    """
+    Calibration function for the vortex center position, based on the
+    differential intensities (DI) measured for a grid of sub-pixel candidate
+    centers. The DI of all candidates are computed in one vectorized pass, and
+    the grid is then refined around the minimum of the DI residual.
+
+    Without known tip-tilt, the residual is the squared norm of the DI
+    averaged over the frames, which is null at the vortex center for a
+    sequence of frames with zero mean pointing error (the DI of each frame is
+    dominated by its tip-tilt, so the mean of the squared DI would not be
+    minimal at the center). With known tip-tilt, the residual is the mean
+    squared difference between the DI of each frame and the DI predicted by
+    the QACITS model (calibrated coefficients).
+
+    Args:
+        psf_ON (float ndarray):
+            cube of on-axis PSFs
+        psf_OFF (float ndarray):
+            off-axis PSF frame
+        img_sampling (float):
+            image sampling in pix per lambda/D
+        tt_lamD (2D float ndarray, optional):
+            true x and y tip-tilt values in lambda/D, defaults to a sequence
+            of zero mean tip-tilt
+        cx (float, optional):
+            x position of the first guess center [pix], defaults to the image center
+        cy (float, optional):
+            y position of the first guess center [pix], defaults to the image center
+        coeffs (dict of float):
+            linear coefficients in the QACITS model
+        regions (list of str):
+            regions used to compute the DI residual
+        search_rad (float):
+            half width [pix] of the first search grid
+        npts (int):
+            number of candidate positions along each axis of the grid
+        nrefine (int):
+            number of grid refinements around the minimum
+        sign (int):
+            sign of the QACITS estimate w.r.t. tt_lamD, as in sweep_selection:
+            1 if the estimate is +tt_lamD (e.g. make_vortex_psfs), -1 for
+            the data cubes of the demo
+        exact (bool, optional):
+            if True, use the exact photometry (photutils), one candidate at a 
+            time; if None, exact when photutils is available (see resolve_exact)
+
+    Return:
+        cx, cy (float):
+            x and y position of the vortex center [pix]; for run_qacits_vlt,
+            vortex_center_yx = (cy, cx)
+        residual (2D float ndarray):
+            DI residual over the first search grid, if full_output is True
+    """
+
+    exact = resolve_exact(exact)
+    # get flux from off-axis PSF frame (photutils aperture photometry)
+    psf_flux = get_psf_flux(psf_OFF, img_sampling/2, cx=cx, cy=cy, exact=exact,
+                            verbose=verbose)
+
+    cube = np.array(psf_ON, ndmin=3)
+    ncube, ny, nx = cube.shape
+    if cx is None :
+        cx = (nx - 1)/2
+    if cy is None :
+        cy = (ny - 1)/2
+
+    # sub-image large enough for all candidates, to keep the weights small
+    rmax = max(radii[region][1] for region in regions)*img_sampling
+    hw = int(np.ceil(rmax + search_rad)) + 2
+    x0 = max(int(np.floor(cx)) - hw, 0)
+    y0 = max(int(np.floor(cy)) - hw, 0)
+    subcube = cube[:, y0:int(np.ceil(cy)) + hw + 1, x0:int(np.ceil(cx)) + hw + 1]
+    subshape = subcube.shape[1:]
+    subcube = subcube.reshape(ncube, -1)
+
+    # DI predicted by the QACITS model for the estimate sign*tt_lamD: the
+    # inner DI is opposite to the estimate (arg + pi, see estimate_from_di)
+    pred = np.zeros((ncube, len(regions), 2))
+    if tt_lamD is not None:
+        tt = sign*np.array(tt_lamD, ndmin=2)
+        tt_mod2 = np.sum(tt**2, axis=1)[:,np.newaxis]
+        for k, region in enumerate(regions):
+            if region == 'inner':
+                pred[:,k] = -coeffs[region]*tt
+            elif region == 'outer':
+                pred[:,k] = coeffs[region]*tt
+            else:
+                pred[:,k] = coeffs[region]*tt_mod2*tt
+
+    needed = list(regions)
+    if 'full' in regions and 'outer' not in regions:
+        needed.append('outer')
+
+    def get_residual(gx, gy):
+        # region weights for all candidate centers: (ncand, nregions, 2, npix)
+        w = {}
+        for region in needed:
+            r0, r1 = radii[region]
+            w[region] = (get_di_weights(subshape, r1*img_sampling, gx, gy, exact=exact) -
+                         get_di_weights(subshape, r0*img_sampling, gx, gy, exact=exact))
+        if 'full' in regions:
+            w['full'] += ratio*w['outer']
+        w = np.stack([w[region] for region in regions], axis=1)
+        w = w.reshape(gx.size*len(regions)*2, -1)
+        di = (subcube @ w.T).reshape(ncube, gx.size, len(regions), 2)/psf_flux
+        if tt_lamD is None:
+            # squared norm of the mean DI (the tip-tilt averages out)
+            return np.sum(np.mean(di, axis=0)**2, axis=(-2,-1))
+        return np.mean(np.sum((di - pred[:,np.newaxis])**2, axis=-1), axis=(0,2))
+
+    # coarse grid, then refined grids around the minimum
+    step = search_rad
+    best_x, best_y = cx - x0, cy - y0
+    for i in range(nrefine + 1):
+        offsets = np.linspace(-step, step, npts)
+        gx, gy = np.meshgrid(best_x + offsets, best_y + offsets)
+        residual = get_residual(gx.ravel(), gy.ravel()).reshape(npts, npts)
+        if i == 0:
+            residual0 = residual
+        iy, ix = np.unravel_index(np.argmin(residual), residual.shape)
+        best_x, best_y = gx[iy, ix], gy[iy, ix]
+        step = 2*step/(npts - 1)
+        if verbose is True:
+            print('center search {0}: cx = {1:.3f}, cy = {2:.3f} (step {3:.3f} pix)'
+                  .format(i, best_x + x0, best_y + y0, step))
+
+    cx, cy = float(best_x + x0), float(best_y + y0)
+    if full_output is True:
+        return cx, cy, residual0
+    else:
+        return cx, cy
@@ -1,67 +1,149 @@
-from qacits.util.bin_images import bin_images
-from qacits.util.psf_flux import get_psf_flux, get_all_di
+from qacits.util.psf_flux import get_cube_di
 import numpy as np
-import matplotlib.pyplot as plt
 
 
-def calibrate_qacits(psf_ON, psf_OFF, img_sampling, tt_lamD, cx=None, cy=None, 
+def calibrate_qacits(psf_ON, psf_OFF, img_sampling, tt_lamD, cx=None, cy=None,
         radii={'inner':(0,1.7),'outer':(1.7,2.3),'full':(0,2.7)},
         tt_fit_lim={'inner':(0,0.1),'outer':(0,0.5),'full':(0.2,0.5)},
         colors={'inner':[0,0.3,0.7],'outer':[0.7,0,0.3],'full':[0,0.7,0.5]},
-        nbin=0, ratio=0, plot_fig=True, verbose=False, **qacits_params):
+        nbin=0, ratio=0, exact=None, dark=None, background=None,
+        bad_pixels=None, saturation_level=None, saturation_mode='clip', lut=False,
+        lut_nodes=50, plot_fig=True, full_output=False, verbose=False, **qacits_params):
 
     """
     Calibration function for computing the linear coefficients in the QACITS model
-    using known tip-tilt offsets, based on the QACITS method for a Vortex 
+    using known tip-tilt offsets, based on the QACITS method for a Vortex
     coronagraph of charge 2.
 
+    A batch of calibration cubes can be given as a 4D array of shape
+    (nbatch, ncube, ny, nx), with tip-tilt values of shape (nbatch, ncube, 2)
+    and one image sampling, center and off-axis PSF frame per cube. The
+    differential intensities of the whole batch are computed at once.
+
+    With plot_fig=False the calibration is headless: only the fit is computed.
+    The fit diagnostics can be returned (full_output=True) and rendered later,
+    or in another process, with plot_calibration.
+
     Args:
         psf_ON (float ndarray):
-            cube of on-axis PSFs
+            cube of on-axis PSFs, or batch of nbatch cubes
         psf_OFF (float ndarray):
-            off-axis PSF frame
-        img_sampling (float):
-            image sampling in pix per lambda/D
-        tt_lamD (2D float ndarray):
+            off-axis PSF frame, or one frame per cube of the batch
+        img_sampling (float or float ndarray):
+            image sampling in pix per lambda/D, one value per cube for a batch
+        tt_lamD (2D or 3D float ndarray):
             true x and y tip-tilt values in lambda/D used to fit the model
-        cx (float, optional):
+        cx (float or float ndarray, optional):
             x position of the sub-image center [pix], defaults to the image center
-        cy (float, optional):
+        cy (float or float ndarray, optional):
             y position of the sub-image center [pix], defaults to the image center
+        dark, background, bad_pixels (optional):
+            pre-processing of the raw frames of psf_ON (see run_qacits)
+        saturation_level (float, optional):
+            raw pixel value of psf_ON above which pixels are saturated (see run_qacits)
+        saturation_mode (str):
+            'clip' or 'mask' the saturated pixels
+        lut (bool):
+            if True, also build a lookup table of the differential intensity
+            modulus vs the true tip-tilt for each region (see build_lut),
+            stored in coeffs['lut'] and inverted by run_qacits instead of
+            the linear and cubic models
+        lut_nodes (int):
+            number of nodes of the lookup tables
+        plot_fig (bool):
+            if True, plot the fit diagnostics (see plot_calibration)
+        full_output (bool):
+            if True, also return the fit diagnostics
 
     Return:
-        coeffs (dict of float):
-            linear coefficients in the QACITS model
+        coeffs (dict of float, or list of dict):
+            linear coefficients in the QACITS model, one dict per cube for a batch
+        diagnostics (dict, or list of dict):
+            fit diagnostics (see fit_qacits_model), if full_output is True
     """
 
-    # get flux from off-axis PSF frame (photutils aperture photometry)
-    psf_flux = get_psf_flux(psf_OFF, img_sampling/2, cx=cx, cy=cy, verbose=verbose)
+    # compute the normalized differential intensities in the 3 regions
+    all_di_mod, _ = get_cube_di(psf_ON, psf_OFF, img_sampling, radii,
+        nbin=nbin, ratio=ratio, cx=cx, cy=cy, exact=exact, dark=dark,
+        background=background, bad_pixels=bad_pixels, saturation_level=saturation_level,
+        saturation_mode=saturation_mode, verbose=verbose)
+
+    tt_lamD = np.asarray(tt_lamD)
+    batch = (tt_lamD.ndim == 3)
+    if batch is False:
+        tt_lamD = tt_lamD[np.newaxis]
+        all_di_mod = {region: all_di_mod[region][np.newaxis] for region in all_di_mod}
+
+    all_coeffs = []
+    all_diagnostics = []
+    for b in range(len(tt_lamD)):
+        # Model calibration mode
+        # ----------------------
+        coeffs, diagnostics = fit_qacits_model(tt_lamD[b],
+            {region: all_di_mod[region][b] for region in all_di_mod},
+            tt_fit_lim=tt_fit_lim)
+        if lut is True:
+            coeffs['lut'] = build_lut(tt_lamD[b],
+                {region: all_di_mod[region][b] for region in all_di_mod},
+                nnodes=lut_nodes)
+        if plot_fig is True:
+            plot_calibration(diagnostics, radii=radii, tt_fit_lim=tt_fit_lim,
+                             colors=colors)
+        if verbose is True:
+            print('\nModel calibration results:'+
+                    '\nInner slope = {0:.3f}\nOuter slope = {1:.3f}\nFull coeff  = {2:.3f}'
+                    .format(*coeffs.values()))
+        all_coeffs.append(coeffs)
+        all_diagnostics.append(diagnostics)
+
+    if batch is False:
+        all_coeffs = all_coeffs[0]
+        all_diagnostics = all_diagnostics[0]
+    if full_output is True:
+        return all_coeffs, all_diagnostics
+    else:
+        return all_coeffs
+
+
+def fit_qacits_model(tt_lamD, all_di_mod,
+        tt_fit_lim={'inner':(0,0.1),'outer':(0,0.5),'full':(0.2,0.5)}):
 
-    # bin + normalize on-axis PSF cube
-    psf_ON = bin_images(psf_ON, nbin)
-    psf_ON /= psf_flux
+    """
+    Fits the QACITS model (linear for the inner and outer regions, cubic for
+    the full region) on the modulus of the normalized differential intensities
+    measured for known tip-tilt offsets.
+
+    Args:
+        tt_lamD (2D float ndarray):
+            true x and y tip-tilt values in lambda/D used to fit the model
+        all_di_mod (dict):
+            dictionary containing the modulus of the differential intensities
+            for each region of interest
+        tt_fit_lim (dict):
+            tip-tilt range in lambda/D used to fit the model in each region
 
-    # compute the differential intensities in the 3 regions
-    all_di_mod, _ = get_all_di(psf_ON, radii, img_sampling, ratio=ratio, cx=cx, cy=cy)
+    Return:
+        coeffs (dict of float):
+            linear coefficients in the QACITS model
+        diagnostics (dict):
+            for each region, a dict of arrays sorted by true tip-tilt: 'tt'
+            (true tip-tilt), 'di' (diff. intensity), 'fit' (fitted model) and
+            'error' (model error in %), and the fitted 'coeff'
+    """
 
-    # Model calibration mode
-    # ----------------------
     tt_calib = np.sqrt(tt_lamD[:,0]**2 + tt_lamD[:,1]**2)
-    if plot_fig is True:
-        plt.figure(num=1, figsize=(12,9))
-        plt.clf()
-        fig, ax = plt.subplots(nrows=3,ncols=2,num=1)
-        fig.subplots_adjust(hspace=0)
+    ind_sort = np.argsort(tt_calib, kind='stable')
+    sorted_tt = tt_calib[ind_sort]
     coeffs = {}
-    for i, region in enumerate(['inner', 'outer', 'full']):
-        yy  = all_di_mod[region]
-        sorted_tt, yy = (np.array(t) for t in zip(*sorted(zip(tt_calib, yy))))
-        ind_x = np.where((sorted_tt>tt_fit_lim[region][0]) & 
+    diagnostics = {}
+    for region in ['inner', 'outer', 'full']:
+        yy = np.asarray(all_di_mod[region])[ind_sort]
+        ind_x = np.where((sorted_tt>tt_fit_lim[region][0]) &
                          (sorted_tt<tt_fit_lim[region][1]))[0]
         x = sorted_tt[ind_x]
         y = yy[ind_x]
         if region == 'full':
-            y  = np.abs(y)**(1/3) # full estimator 
+            y  = np.abs(y)**(1/3) # full estimator
         a, _, _, _ = np.linalg.lstsq(x[:,np.newaxis], y, rcond=None)
         coeff = a[0]
         fit_coeff = sorted_tt*coeff
@@ -69,32 +151,337 @@ def calibrate_qacits(psf_ON, psf_OFF, img_sampling, tt_lamD, cx=None, cy=None,
             coeff **= 3
             fit_coeff **= 3
         error = (yy - fit_coeff)/yy*100
-        #error = ((yy - fit_coeff)/psf_flux)*100
         coeffs[region] = coeff
+        diagnostics[region] = dict(tt=sorted_tt, di=yy, fit=fit_coeff,
+                                   error=error, coeff=coeff)
 
-        if plot_fig is True:
-            ax[i,0].set_xlabel(r'True tip-tilt [$\lambda/D$]')
-            ax[i,0].set_ylabel('Normalized Diff. Intensity')
-            ax[i,0].plot(sorted_tt, yy, 'o', color=colors[region], alpha=.9, markersize=2,
-                       label=region+r' - r = {0:.1f} to {1:.1f} $\lambda/D$'
-                       .format(radii[region][0], radii[region][1]))
-            ax[i,0].plot(sorted_tt, fit_coeff, color=colors[region], alpha=.6, linestyle='--', 
-                       label=r'Fit coeff. [{0:.2f}-{1:.2f}] $\lambda/D$ = {2:.3f}'
-                       .format(tt_fit_lim[region][0],tt_fit_lim[region][1],coeff))
-            ax[i,0].grid(color='.8',linestyle='--')
-            ax[i,0].set_xlim(0.,)
-            ax[i,0].legend()
-            ax[i,1].set_xlabel(r'True tip-tilt [$\lambda/D$]')
-            ax[i,1].set_ylabel('Model Error [%]')
-            ax[i,1].plot(sorted_tt, error, 
-                       'o', markersize=2, color=colors[region], alpha=.6)
-            ax[i,1].set_ylim(-20., 20.)
-            ax[i,1].set_xlim(0.,)
-            ax[i,1].grid(color='.8',linestyle='--')
+    return coeffs, diagnostics
+
+
+def calibration_uncertainty(psf_ON, psf_OFF, img_sampling, tt_lamD, cx=None, cy=None,
+        radii={'inner':(0,1.7),'outer':(1.7,2.3),'full':(0,2.7)},
+        tt_fit_lim={'inner':(0,0.1),'outer':(0,0.5),'full':(0.2,0.5)},
+        nbin=0, ratio=0, exact=None, nboot=200, kfold=5, confidence=0.95,
+        sign=1, seed=None, verbose=False, **qacits_params):
+
+    """
+    Uncertainty of the calibration coefficients, by bootstrap resampling and
+    k-fold cross-validation of the fit of the QACITS model. The differential
+    intensities of the calibration cube are computed once, and the fits of
+    all the bootstrap samples and folds are vectorized: a sample is given by
+    the number of times each frame is drawn (a training fold by 0 or 1), so
+    that the least-squares slope of each region (see fit_qacits_model) is a
+    ratio of two weighted sums, i.e. of two matrix products.
+
+    Args:
+        psf_ON (float ndarray):
+            cube of on-axis PSFs
+        psf_OFF (float ndarray):
+            off-axis PSF frame
+        img_sampling (float):
+            image sampling in pix per lambda/D
+        tt_lamD (2D float ndarray):
+            true x and y tip-tilt values in lambda/D used to fit the model
+        nboot (int):
+            number of bootstrap samples
+        kfold (int):
+            number of folds of the cross-validation
+        confidence (float):
+            confidence level of the intervals
+        sign (int):
+            sign of the QACITS estimate w.r.t. the true tip-tilt, e.g. -1 for
+            the data cubes of the demo
+        seed (int, optional):
+            seed of the random resampling
+        qacits_params:
+            other parameters of run_qacits (pre-processing, force, selection),
+            used for the pointing errors of the cross-validation
+
+    Return:
+        results (dict):
+            'coeffs' fitted on all frames; for each coefficient, 'bootstrap'
+            (values of the bootstrap samples), 'std' and 'interval' (confidence
+            interval); 'cv_coeffs' (coefficients of each fold), 'fit_rms' (RMS
+            pointing error [lambda/D] of the frames with the coefficients fitted
+            on all frames), 'cv_rms' (RMS pointing error of the frames with the
+            coefficients fitted without their fold) and 'inflation' (cv_rms/fit_rms,
+            the predicted pointing-error inflation due to the calibration)
+    """
+
+    from qacits.run_qacits import estimate_from_di
+
+    di_params = {k: qacits_params.pop(k) for k in ['dark', 'background', 'bad_pixels',
+                 'saturation_level', 'saturation_mode'] if k in qacits_params}
+    all_di_mod, all_di_arg = get_cube_di(psf_ON, psf_OFF, img_sampling, radii,
+        nbin=nbin, ratio=ratio, cx=cx, cy=cy, exact=exact, verbose=verbose, **di_params)
+    tt_lamD = np.asarray(tt_lamD)
+    nframes = len(tt_lamD)
+    regions = ['inner', 'outer', 'full']
+
+    def fit(weights):
+        # slopes of fit_qacits_model, for each row of frame weights
+        tt = np.sqrt(tt_lamD[:,0]**2 + tt_lamD[:,1]**2)
+        coeffs = {}
+        for region in regions:
+            x = tt*((tt > tt_fit_lim[region][0]) & (tt < tt_fit_lim[region][1]))
+            y = np.asarray(all_di_mod[region])
+            if region == 'full':
+                y = np.abs(y)**(1/3) # full estimator
+            with np.errstate(invalid='ignore', divide='ignore'):
+                coeffs[region] = (weights @ (x*y))/(weights @ x**2)
+            if region == 'full':
+                coeffs[region] = coeffs[region]**3
+        return coeffs
+
+    def sum_sq_error(coeffs, ind):
+        # sum of the squared pointing errors of the frames ind
+        est = estimate_from_di({region: all_di_mod[region][ind] for region in regions},
+                               {region: all_di_arg[region][ind] for region in regions},
+                               coeffs=coeffs, **qacits_params)
+        return np.sum((sign*est[:,0:2] - tt_lamD[ind])**2)
+
+    rng = np.random.default_rng(seed)
+    # number of draws of each frame in each bootstrap sample
+    boot_weights = rng.multinomial(nframes, np.full(nframes, 1/nframes), size=nboot)
+    folds = np.array_split(rng.permutation(nframes), kfold)
+    train_weights = np.ones((kfold, nframes))
+    for k, fold in enumerate(folds):
+        train_weights[k, fold] = 0
+    boot = fit(boot_weights)
+    cv = fit(train_weights)
+    cv_coeffs = [{region: cv[region][k] for region in regions} for k in range(kfold)]
+    cv_sq = [sum_sq_error(coeffs, fold) for coeffs, fold in zip(cv_coeffs, folds)]
+
+    results = {'coeffs': fit_qacits_model(tt_lamD, all_di_mod, tt_fit_lim=tt_fit_lim)[0],
+               'cv_coeffs': cv_coeffs}
+    results['bootstrap'] = boot
+    alpha = (1 - confidence)/2*100
+    results['std'] = {region: np.nanstd(results['bootstrap'][region]) for region in regions}
+    results['interval'] = {region: tuple(np.nanpercentile(results['bootstrap'][region],
+                           [alpha, 100 - alpha])) for region in regions}
+    results['fit_rms'] = np.sqrt(sum_sq_error(results['coeffs'], np.arange(nframes))/nframes)
+    results['cv_rms'] = np.sqrt(np.sum(cv_sq)/nframes)
+    results['inflation'] = results['cv_rms']/results['fit_rms']
 
     if verbose is True:
-        print('\nModel calibration results:'+
-                '\nInner slope = {0:.3f}\nOuter slope = {1:.3f}\nFull coeff  = {2:.3f}'
-                .format(*coeffs.values()))
-    
-    return coeffs
\ No newline at end of file
+        for region in regions:
+            print('{0:5s} coeff = {1:.4f} +/- {2:.4f}, {3:.0f}% interval [{4:.4f}, {5:.4f}]'
+                  .format(region, results['coeffs'][region], results['std'][region],
+                          confidence*100, *results['interval'][region]))
+        print('RMS pointing error: {0:.4f} l/D (fit), {1:.4f} l/D (cross-validation), '
+              'inflation {2:.3f}'.format(results['fit_rms'], results['cv_rms'],
+                                         results['inflation']))
+
+    return results
+
+
+class OnlineCalibration(object):
+    """
+    Incremental calibration of the QACITS model, e.g. during the night from
+    frames with known tip-tilt offsets (dithering). The fit of
+    fit_qacits_model (least squares of the differential intensity vs the true
+    tip-tilt, through the origin, in the tip-tilt range tt_fit_lim) is
+    recursive: only two sums are kept per region, updated in O(1) per frame,
+    with an optional forgetting factor to follow slow changes. The
+    coefficients can be snapshotted at any time into the coeffs dict used by
+    run_qacits.
+
+    With forgetting=1 and no prior, the coefficients are those of
+    calibrate_qacits on all the frames given so far.
+
+    Args:
+        psf_OFF (float ndarray, optional):
+            off-axis PSF frame, needed by update
+        img_sampling (float, optional):
+            image sampling in pix per lambda/D, needed by update
+        tt_fit_lim (dict):
+            tip-tilt range in lambda/D used to fit the model in each region
+        forgetting (float):
+            forgetting factor (0 to 1) applied per frame: the weight of a
+            frame is forgetting**(number of frames given after it)
+        coeffs (dict of float, optional):
+            prior coefficients, e.g. from calibrate_qacits
+        prior_weight (float):
+            weight of the prior coefficients, as a sum of squared tip-tilts
+            [(lambda/D)**2], e.g. 100 frames at 0.3 lambda/D give 9
+        di_params:
+            other parameters of get_cube_di used by update (radii, cx, cy,
+            ratio, exact, pre-processing)
+    """
+
+    def __init__(self, psf_OFF=None, img_sampling=None,
+                 tt_fit_lim={'inner':(0,0.1),'outer':(0,0.5),'full':(0.2,0.5)},
+                 forgetting=1., coeffs=None, prior_weight=0., **di_params):
+
+        assert 0 < forgetting <= 1, 'forgetting must be in ]0, 1]'
+        self.psf_OFF = psf_OFF
+        self.img_sampling = img_sampling
+        self.tt_fit_lim = tt_fit_lim
+        self.forgetting = forgetting
+        di_params.setdefault('radii', {'inner':(0,1.7),'outer':(1.7,2.3),'full':(0,2.7)})
+        self.di_params = di_params
+        self.count = 0
+        # sums of x**2 and x*y, x being the true tip-tilt and y the
+        # differential intensity (its cubic root for the full region)
+        self.sxx = {}
+        self.sxy = {}
+        for region in ['inner', 'outer', 'full']:
+            self.sxx[region] = 0.
+            self.sxy[region] = 0.
+            if coeffs is not None and prior_weight > 0:
+                slope = coeffs[region]**(1/3) if region == 'full' else coeffs[region]
+                self.sxx[region] = prior_weight
+                self.sxy[region] = prior_weight*slope
+
+    def update(self, psf_ON, tt_lamD):
+        """
+        Measures the differential intensities of new frames with known
+        tip-tilt offsets, and updates the calibration (see update_di).
+        """
+        assert self.psf_OFF is not None and self.img_sampling is not None, \
+            'psf_OFF and img_sampling are needed'
+        params = dict(self.di_params)
+        radii = params.pop('radii')
+        all_di_mod, _ = get_cube_di(psf_ON, self.psf_OFF, self.img_sampling, radii, **params)
+        self.update_di(tt_lamD, all_di_mod)
+
+    def update_di(self, tt_lamD, all_di_mod):
+        """
+        Updates the calibration with new frames, in the order of the frames.
+
+        Args:
+            tt_lamD (2D float ndarray):
+                true x and y tip-tilt values in lambda/D, of shape (n, 2)
+            all_di_mod (dict):
+                dictionary containing the modulus of the normalized
+                differential intensities of the frames for each region
+        """
+        tt_lamD = np.asarray(tt_lamD).reshape(-1, 2)
+        n = len(tt_lamD)
+        x = np.sqrt(tt_lamD[:,0]**2 + tt_lamD[:,1]**2)
+        # weight of each new frame, after the n frames
+        weights = self.forgetting**np.arange(n - 1, -1, -1)
+        for region in ['inner', 'outer', 'full']:
+            y = np.asarray(all_di_mod[region]).ravel()
+            if region == 'full':
+                y = np.abs(y)**(1/3)
+            lim = self.tt_fit_lim[region]
+            w = weights*((x > lim[0]) & (x < lim[1]))
+            self.sxx[region] = self.forgetting**n*self.sxx[region] + np.sum(w*x*x)
+            self.sxy[region] = self.forgetting**n*self.sxy[region] + np.sum(w*x*y)
+        self.count += n
+
+    def get_coeffs(self):
+        """
+        Returns:
+            coeffs (dict of float):
+                current coefficients in the QACITS model (see calibrate_qacits),
+                NaN for a region without frames in its tip-tilt range
+        """
+        coeffs = {}
+        for region in ['inner', 'outer', 'full']:
+            coeff = self.sxy[region]/self.sxx[region] if self.sxx[region] > 0 else np.nan
+            coeffs[region] = coeff**3 if region == 'full' else coeff
+        return coeffs
+
+
+def build_lut(tt_lamD, all_di_mod, nnodes=50):
+
+    """
+    Builds a monotonic lookup table of the modulus of the normalized
+    differential intensity vs the true tip-tilt, for each region, from
+    calibration data. The frames are sorted by true tip-tilt and grouped into
+    nnodes groups of equal size; each node is the mean tip-tilt and the median
+    differential intensity of a group, starting from (0, 0). The table stops
+    at the maximum of the differential intensity (the model cannot be inverted
+    beyond), and nodes breaking the monotonicity (noise) are dropped.
+
+    The estimates are then obtained by linear interpolation in the table
+    (np.interp, i.e. a binary search per frame), and are valid up to the
+    largest calibrated tip-tilt instead of the range of the linear and cubic
+    models.
+
+    Args:
+        tt_lamD (2D float ndarray):
+            true x and y tip-tilt values in lambda/D
+        all_di_mod (dict):
+            dictionary containing the modulus of the differential intensities
+            for each region of interest
+        nnodes (int):
+            maximum number of nodes of each table
+
+    Return:
+        lut (dict of float ndarray):
+            for each region, an array of shape (2, n): increasing differential
+            intensities, and the corresponding tip-tilt values [lambda/D]
+    """
+
+    tt_calib = np.sqrt(tt_lamD[:,0]**2 + tt_lamD[:,1]**2)
+    ind_sort = np.argsort(tt_calib, kind='stable')
+    groups = np.array_split(np.arange(len(tt_calib)), min(nnodes, len(tt_calib)))
+    lut = {}
+    for region in ['inner', 'outer', 'full']:
+        di = np.asarray(all_di_mod[region])[ind_sort]
+        tt_nodes = np.concatenate([[0], [np.mean(tt_calib[ind_sort][g]) for g in groups]])
+        di_nodes = np.concatenate([[0], [np.median(di[g]) for g in groups]])
+        # up to the turnover of the differential intensity
+        imax = np.argmax(di_nodes)
+        tt_nodes = tt_nodes[:imax+1]
+        di_nodes = di_nodes[:imax+1]
+        # strictly increasing nodes
+        keep = np.concatenate([[True], di_nodes[1:] > np.maximum.accumulate(di_nodes)[:-1]])
+        lut[region] = np.array([di_nodes[keep], tt_nodes[keep]])
+
+    return lut
+
+
+def plot_calibration(diagnostics,
+        radii={'inner':(0,1.7),'outer':(1.7,2.3),'full':(0,2.7)},
+        tt_fit_lim={'inner':(0,0.1),'outer':(0,0.5),'full':(0.2,0.5)},
+        colors={'inner':[0,0.3,0.7],'outer':[0.7,0,0.3],'full':[0,0.7,0.5]},
+        fig_num=None):
+
+    """
+    Plots the QACITS model calibration: normalized differential intensity and
+    model error as a function of the true tip-tilt, for each region. Only
+    needs the fit diagnostics, so it can be called after the calibration.
+
+    Args:
+        diagnostics (dict):
+            fit diagnostics returned by fit_qacits_model or calibrate_qacits
+        fig_num (int, optional):
+            matplotlib figure number, defaults to a new figure
+
+    Return:
+        fig, ax:
+            matplotlib figure and axes
+    """
+
+    import matplotlib.pyplot as plt
+
+    fig = plt.figure(num=fig_num, figsize=(12,9))
+    fig.clf()
+    ax = fig.subplots(nrows=3, ncols=2)
+    fig.subplots_adjust(hspace=0)
+    for i, region in enumerate(['inner', 'outer', 'full']):
+        diag = diagnostics[region]
+        ax[i,0].set_xlabel(r'True tip-tilt [$\lambda/D$]')
+        ax[i,0].set_ylabel('Normalized Diff. Intensity')
+        ax[i,0].plot(diag['tt'], diag['di'], 'o', color=colors[region], alpha=.9, markersize=2,
+                   label=region+r' - r = {0:.1f} to {1:.1f} $\lambda/D$'
+                   .format(radii[region][0], radii[region][1]))
+        ax[i,0].plot(diag['tt'], diag['fit'], color=colors[region], alpha=.6, linestyle='--',
+                   label=r'Fit coeff. [{0:.2f}-{1:.2f}] $\lambda/D$ = {2:.3f}'
+                   .format(tt_fit_lim[region][0],tt_fit_lim[region][1],diag['coeff']))
+        ax[i,0].grid(color='.8',linestyle='--')
+        ax[i,0].set_xlim(0.,)
+        ax[i,0].legend()
+        ax[i,1].set_xlabel(r'True tip-tilt [$\lambda/D$]')
+        ax[i,1].set_ylabel('Model Error [%]')
+        ax[i,1].plot(diag['tt'], diag['error'],
+                   'o', markersize=2, color=colors[region], alpha=.6)
+        ax[i,1].set_ylim(-20., 20.)
+        ax[i,1].set_xlim(0.,)
+        ax[i,1].grid(color='.8',linestyle='--')
+
+    return fig, ax
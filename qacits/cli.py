@@ -0,0 +1,239 @@
+from qacits.calibrate_qacits import calibrate_qacits
+from qacits.run_qacits import measure_di, estimate_from_di
+from qacits.util.bin_images import bin_images
+import numpy as np
+import argparse
+import ast
+import sys
+import time
+
+
+# parameters given by the command line options, not by the parameter file
+_cli_keys = ['cx', 'cy', 'exact', 'plot_fig', 'verbose']
+# parameters of the DI measurement (measure_di), the others being parameters
+# of the estimation (estimate_from_di)
+_di_keys = ['radii', 'dark', 'background', 'bad_pixels', 'saturation_level',
+            'saturation_mode']
+
+
+def read_parameter_file(filename):
+    """
+    Reads a QACITS parameter file, in the ConfigObj format (unrepr=True) of
+    run_qacits_vlt: radii, inner_slope, outer_slope, full_coeff, ratio,
+    phase_tolerance, modul_tolerance, small_tt_regime, large_tt_regime.
+    Without configobj, flat 'key = value' files are read with literal_eval.
+    The options of the command line (cx, cy, exact, plot_fig, verbose) are
+    not accepted in the file.
+
+    As in run_qacits_vlt (quadrant_tiptilt), phase_tolerance is given in
+    units of pi in the file; it is converted to degrees (run_qacits).
+
+    Returns:
+        qacits_params (dict):
+            parameters of run_qacits (coeffs dict from the slopes)
+    """
+    try:
+        from configobj import ConfigObj
+        params = dict(ConfigObj(filename, unrepr=True))
+    except ImportError:
+        params = {}
+        with open(filename) as f:
+            for line in f:
+                line = line.split('#')[0].strip()
+                if '=' in line:
+                    key, value = line.split('=', 1)
+                    params[key.strip()] = ast.literal_eval(value.strip())
+    cli_keys = [key for key in _cli_keys if key in params]
+    assert len(cli_keys) == 0, ('%s: %s must be given on the command line'
+                                %(filename, ', '.join(cli_keys)))
+    # run_qacits_vlt names of the coefficients
+    keys = {'inner':'inner_slope', 'outer':'outer_slope', 'full':'full_coeff'}
+    if any(keys[region] in params for region in keys):
+        coeffs = params.pop('coeffs', {'inner':1, 'outer':1, 'full':1})
+        params['coeffs'] = {region: params.pop(keys[region], coeffs[region])
+                            for region in keys}
+    if 'lut' in params:
+        # lookup tables of the calibration (see build_lut)
+        lut = params.pop('lut')
+        params.setdefault('coeffs', {'inner':1, 'outer':1, 'full':1})
+        params['coeffs']['lut'] = {region: np.array(lut[region]) for region in lut}
+    if 'radii' in params:
+        params['radii'] = {region: tuple(params['radii'][region])
+                           for region in params['radii']}
+    if 'phase_tolerance' in params:
+        params['phase_tolerance'] = params['phase_tolerance']*180.
+    return params
+
+
+def write_parameter_file(filename, qacits_params):
+    """
+    Writes a QACITS parameter file in the ConfigObj format (unrepr=True) of
+    run_qacits_vlt, the coefficients being written as inner_slope,
+    outer_slope and full_coeff, the lookup tables (if any) as lut, and
+    phase_tolerance (degrees) in units of pi.
+    """
+    params = dict(qacits_params)
+    if 'phase_tolerance' in params:
+        params['phase_tolerance'] = params['phase_tolerance']/180.
+    coeffs = params.pop('coeffs', None)
+    if coeffs is not None:
+        params['inner_slope'] = coeffs['inner']
+        params['outer_slope'] = coeffs['outer']
+        params['full_coeff'] = coeffs['full']
+        if 'lut' in coeffs:
+            params['lut'] = coeffs['lut']
+    with open(filename, 'w') as f:
+        for key in params:
+            value = params[key]
+            if isinstance(value, dict):
+                value = {k: np.asarray(value[k]).tolist() for k in value}
+            else:
+                value = np.asarray(value).tolist()
+            f.write('%s = %r\n'%(key, value))
+
+
+def _read_fits(filename):
+    # native-endian data, cached for compressed files (see ingest.getdata)
+    from qacits.util.ingest import getdata
+    return getdata(filename)
+
+
+def _progress(nframes, ntot, t0):
+    elapsed = time.perf_counter() - t0
+    print('{0}/{1} frames, {2:.1f} s, {3:.0f} frames/s'.format(nframes, ntot, elapsed,
+          nframes/max(elapsed, 1e-9)))
+    sys.stdout.flush()
+
+
+def calibrate(args):
+    """ calibrate subcommand. """
+    params = read_parameter_file(args.params) if args.params else {}
+    psf_ON = _read_fits(args.psf_on)
+    psf_OFF = _read_fits(args.psf_off)
+    tt_lamD = _read_fits(args.pointing)
+    # nbin of the parameter file, unless given on the command line
+    nbin = params.get('nbin', 0) if args.nbin is None else args.nbin
+    t0 = time.perf_counter()
+    params['coeffs'] = calibrate_qacits(psf_ON, psf_OFF, args.sampling, tt_lamD,
+        cx=args.cx, cy=args.cy, nbin=nbin, exact=args.exact, lut=args.lut,
+        plot_fig=False, verbose=args.verbose,
+        **{k: params[k] for k in params if k not in ['coeffs', 'nbin']})
+    _progress(len(psf_ON), len(psf_ON), t0)
+    print('inner_slope = {inner:.4f}, outer_slope = {outer:.4f}, '
+          'full_coeff = {full:.4f}'.format(**params['coeffs']))
+    if args.output is not None:
+        write_parameter_file(args.output, params)
+        print('parameters written to %s'%args.output)
+
+
+def run(args):
+    """ run subcommand. """
+    from astropy.io import fits
+    from concurrent.futures import ThreadPoolExecutor
+    params = read_parameter_file(args.params) if args.params else {}
+    if args.force is not None:
+        params['force'] = None if args.force == 'select' else args.force
+    psf_ON = _read_fits(args.psf_on)
+    psf_OFF = _read_fits(args.psf_off)
+    ncube = len(psf_ON)
+    chunks = [slice(i0, i0 + args.chunk_size) for i0 in range(0, ncube, args.chunk_size)]
+    # the binning applies to the whole sequence, not to each chunk
+    nbin = params.pop('nbin', 0)
+    di_params = {k: params[k] for k in _di_keys if k in params}
+
+    def process(chunk):
+        return measure_di(psf_ON[chunk], psf_OFF, args.sampling, cx=args.cx,
+                          cy=args.cy, exact=args.exact, **di_params)
+
+    writer = None
+    if args.format == 'store':
+        from qacits.util.chunk_store import ChunkedWriter
+        writer = ChunkedWriter(args.output, params=dict(params, img_sampling=args.sampling,
+                               cx=args.cx, cy=args.cy), chunk_size=args.chunk_size)
+    estimates = []
+    all_di_xy = []
+
+    def output(est):
+        if writer is not None:
+            writer.append(estimates=est)
+        else:
+            estimates.append(est)
+
+    nframes = 0
+    t0 = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.workers) as pool:
+        # results in the order of the chunks
+        for i, di in enumerate(pool.map(process, chunks)):
+            nframes = min(chunks[i].stop, ncube)
+            if nbin > 0:
+                # only the DI table (6 numbers per frame) is kept until the end
+                all_di_xy.append(di)
+            else:
+                output(estimate_from_di(di, **params))
+            if args.verbose is True or i == len(chunks) - 1:
+                _progress(nframes, ncube, t0)
+    if nbin > 0:
+        output(estimate_from_di(bin_images(np.concatenate(all_di_xy), nbin), **params))
+
+    if writer is not None:
+        writer.close()
+    else:
+        estimates = np.concatenate(estimates)
+        if args.format == 'fits':
+            fits.writeto(args.output, estimates, overwrite=True)
+        elif args.format == 'npy':
+            np.save(args.output, estimates)
+        else:
+            np.savetxt(args.output, estimates[:,0:2], header='x y [lambda/D]')
+    print('estimates written to %s'%args.output)
+
+
+def get_parser():
+    parser = argparse.ArgumentParser(prog='qacits',
+        description='QACITS pointing error estimation for a vortex coronagraph')
+    sub = parser.add_subparsers(dest='command')
+    sub.required = True
+    for name, func in [('calibrate', calibrate), ('run', run)]:
+        p = sub.add_parser(name, help='%s QACITS'%name)
+        p.set_defaults(func=func)
+        p.add_argument('psf_on', help='FITS cube of on-axis PSFs (.fits or .fits.gz)')
+        p.add_argument('psf_off', help='FITS off-axis PSF frame')
+        if name == 'calibrate':
+            p.add_argument('pointing', help='FITS file of the true tip-tilt [lambda/D]')
+        p.add_argument('-s', '--sampling', type=float, required=True,
+                       help='image sampling [pix per lambda/D]')
+        p.add_argument('-p', '--params', help='parameter file (ConfigObj format)')
+        p.add_argument('--cx', type=float, help='x position of the vortex center [pix]')
+        p.add_argument('--cy', type=float, help='y position of the vortex center [pix]')
+        p.add_argument('--exact', dest='exact', action='store_true', default=None,
+                       help='exact photometry (photutils), default if available')
+        p.add_argument('--sampled', dest='exact', action='store_false',
+                       help='photometry limited by the pixel sampling')
+        p.add_argument('-v', '--verbose', action='store_true')
+        if name == 'calibrate':
+            p.add_argument('--nbin', type=int,
+                           help='number of binned images, defaults to the parameter file one')
+            p.add_argument('--lut', action='store_true',
+                           help='build lookup tables of the model (see build_lut)')
+            p.add_argument('-o', '--output', help='output parameter file')
+        else:
+            p.add_argument('--force', choices=['inner', 'outer', 'full', 'select'],
+                           help='estimator, select for the automatic selection')
+            p.add_argument('-c', '--chunk-size', type=int, default=1000,
+                           help='number of frames per chunk')
+            p.add_argument('-w', '--workers', type=int, default=1,
+                           help='number of chunks processed in parallel')
+            p.add_argument('-f', '--format', choices=['fits', 'npy', 'txt', 'store'],
+                           default='fits', help='output format (store: see chunk_store)')
+            p.add_argument('-o', '--output', default='qacits_estimates.fits',
+                           help='output file or directory')
+    return parser
+
+
+def main(argv=None):
+    args = get_parser().parse_args(argv)
+    args.func(args)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,78 +1,268 @@
-from qacits.util.bin_images import bin_images
-from qacits.util.psf_flux import get_psf_flux, get_all_di
+from qacits.util.psf_flux import get_cube_di, get_di_mod_arg
+from qacits.util.chunk_store import _json_default
 import numpy as np
+import json
 
 
 def run_qacits(psf_ON, psf_OFF, img_sampling, cx=None, cy=None, force='outer',
         coeffs={'inner':1, 'outer':1, 'full':1},
         radii={'inner':(0,1.7), 'outer':(1.7,2.3), 'full':(0, 2.7)},
         nbin=0, ratio=0, phase_tolerance=60, modul_tolerance=0.33,
-        small_tt_regime=0.3, large_tt_regime=0.2, verbose=False, **qacits_params):
+        small_tt_regime=0.3, large_tt_regime=0.2, exact=None,
+        dark=None, background=None, bad_pixels=None, saturation_level=None,
+        saturation_mode='clip', chunk_size=1024, workers=1, full_output=False,
+        verbose=False, **qacits_params):
 
     """
-    Pointing error estimation using the QACITS model with calibrated linear 
-    coefficients (see calibrate_qacits.py), based on the QACITS method for a 
+    Pointing error estimation using the QACITS model with calibrated linear
+    coefficients (see calibrate_qacits.py), based on the QACITS method for a
     Vortex coronagraph of charge 2.
 
+    A batch of cubes (e.g. several bands, targets or configurations) can be
+    given as a 4D array of shape (nbatch, ncube, ny, nx). The image sampling,
+    center, off-axis PSF frame and coefficients can then be given per cube,
+    and the differential intensities of the whole batch are computed at once.
+
     Args:
-        psf_ON (float ndarray):
-            cube of on-axis PSFs
+        psf_ON (float or int ndarray):
+            cube of on-axis PSFs, or batch of nbatch cubes; raw integer frames
+            (e.g. uint16) are reduced without converting the whole cube
         psf_OFF (float ndarray):
-            off-axis PSF frame
-        img_sampling (float):
-            image sampling in pix per lambda/D
-        cx (float):
+            off-axis PSF frame, or one frame per cube of the batch
+        img_sampling (float or float ndarray):
+            image sampling in pix per lambda/D, one value per cube for a batch
+        cx (float or float ndarray):
             x position of the sub-image center [pix], defaults to the image center
-        cy (float):
+        cy (float or float ndarray):
             y position of the sub-image center [pix], defaults to the image center
         force (str):
             force the QACITS estimator to use a specific estimator, defaults to 'outer'
-        coeffs (dict of float):
-            linear coefficients in the QACITS model
+        coeffs (dict of float, or list of dict):
+            linear coefficients in the QACITS model, one dict per cube for a batch
+        exact (bool, optional):
+            if True, the photometry is exact (requires photutils), otherwise it
+            is limited by the pixel sampling; if None, exact when photutils is
+            available (see resolve_exact)
+        dark (float ndarray, optional):
+            dark frame subtracted from the raw frames of psf_ON
+        background (float or float ndarray, optional):
+            background level or frame subtracted from the raw frames of psf_ON
+        bad_pixels (bool ndarray, optional):
+            bad pixel map (True for bad pixels), bad pixels are replaced by
+            the mean of their valid neighbours
+        saturation_level (float, optional):
+            raw pixel value of psf_ON above which pixels are saturated; saturated
+            pixels are handled while the frames are reduced, without
+            modifying psf_ON
+        saturation_mode (str):
+            'clip' to replace saturated pixels by saturation_level, or 'mask'
+            to exclude them from the differential intensities
+        chunk_size (int):
+            number of frames reduced at once
+        workers (int):
+            number of threads reducing the chunks of frames concurrently
+            (see get_all_di_xy)
+        full_output (bool):
+            if True, also return the number of saturated pixels per frame
 
     Return:
         full_estimate_output (float ndarray):
-            full estimate output; first two columns are tip-tilt estimate
+            full estimate output; first two columns are tip-tilt estimate;
+            of shape (nbatch, ncube, 11) for a batch
+        n_sat (int ndarray):
+            number of saturated pixels per (unbinned) frame (zero without
+            saturation_level), only if full_output is True
     """
 
-    # get flux from off-axis PSF frame (photutils aperture photometry)
-    psf_flux = get_psf_flux(psf_OFF, img_sampling/2, cx=cx, cy=cy, verbose=verbose)
-
-    # bin + normalize on-axis PSF cube
-    psf_ON = bin_images(psf_ON, nbin)
-    psf_ON /= psf_flux
+    # compute the normalized differential intensities in the 3 regions
+    all_di_xy, n_sat = measure_di(psf_ON, psf_OFF, img_sampling, radii=radii,
+        nbin=nbin, cx=cx, cy=cy, exact=exact, dark=dark, background=background,
+        bad_pixels=bad_pixels, saturation_level=saturation_level,
+        saturation_mode=saturation_mode, chunk_size=chunk_size, workers=workers,
+        full_output=True, verbose=verbose)
 
-    # compute the differential intensities in the 3 regions
-    all_di_mod, all_di_arg = get_all_di(psf_ON, radii, img_sampling, ratio=ratio, cx=cx, cy=cy)
-    
     # Pointing error estimation mode
     # ------------------------------
-    
-    ncube = len(psf_ON)
-    inner_slope = coeffs['inner']
-    outer_slope = coeffs['outer']
-    full_coeff = coeffs['full']
-    phase_tolerance = phase_tolerance
-    modul_tolerance = modul_tolerance
-    small_tt_regime = small_tt_regime
-    large_tt_regime = large_tt_regime
+    full_estimate_output = estimate_from_di(all_di_xy, force=force, coeffs=coeffs,
+        ratio=ratio, phase_tolerance=phase_tolerance, modul_tolerance=modul_tolerance,
+        small_tt_regime=small_tt_regime, verbose=verbose)
+
+    if full_output is True:
+        return full_estimate_output, n_sat
+    else:
+        return full_estimate_output
+
+
+def measure_di(psf_ON, psf_OFF, img_sampling,
+        radii={'inner':(0,1.7), 'outer':(1.7,2.3), 'full':(0, 2.7)}, nbin=0,
+        cx=None, cy=None, exact=None, dark=None, background=None,
+        bad_pixels=None, saturation_level=None, saturation_mode='clip',
+        chunk_size=1024, workers=1, full_output=False, verbose=False):
+
+    """
+    First stage of run_qacits: measures the normalized differential
+    intensities of each (binned) frame, i.e. six numbers per frame, along the
+    x and y axes for the inner, outer and full regions. This DI table holds
+    all the information needed by the second stage (estimate_from_di), which
+    can be run again with other coefficients or selection parameters without
+    the photometry of the frames. See save_di and load_di to archive it.
+
+    The full region is not debiased from the outer one (ratio=0): the ratio
+    is applied by estimate_from_di.
+
+    Args:
+        psf_ON (float or int ndarray):
+            cube of on-axis PSFs, or batch of nbatch cubes
+        psf_OFF (float ndarray):
+            off-axis PSF frame, or one frame per cube of the batch
+        img_sampling (float or float ndarray):
+            image sampling in pix per lambda/D, one value per cube for a batch
+        radii (dict):
+            dictionary containing the radii in lambda/D for each region of interest
+        nbin (int):
+            number of binned images per cube (see bin_images)
+        dark, background, bad_pixels, saturation_level, saturation_mode:
+            pre-processing of the frames (see run_qacits)
+        chunk_size, workers (int):
+            number of frames reduced at once, and number of threads reducing
+            them (see get_all_di_xy)
+        full_output (bool):
+            if True, also return the number of saturated pixels per frame
+
+    Return:
+        all_di_xy (float ndarray):
+            DI table of shape (..., nframes, 3, 2), for the inner, outer, and
+            full regions, along the x and y axes
+        n_sat (int ndarray):
+            number of saturated pixels per (unbinned) frame, if full_output
+            is True
+    """
+
+    return get_cube_di(psf_ON, psf_OFF, img_sampling, radii, nbin=nbin, cx=cx,
+        cy=cy, exact=exact, dark=dark, background=background, bad_pixels=bad_pixels,
+        saturation_level=saturation_level, saturation_mode=saturation_mode,
+        xy=True, chunk_size=chunk_size, workers=workers, full_output=full_output,
+        verbose=verbose)
+
+
+def save_di(filename, all_di_xy, **params):
+    """
+    Saves a DI table (see measure_di) to a .npz file, with the parameters of
+    the measurement (e.g. img_sampling, radii, nbin, cx, cy) as metadata.
+    """
+    np.savez(filename, di=all_di_xy, params=json.dumps(params, default=_json_default))
+
+
+def load_di(filename):
+    """
+    Loads a DI table saved by save_di.
+
+    Return:
+        all_di_xy (float ndarray):
+            DI table (see measure_di)
+        params (dict):
+            parameters of the measurement
+    """
+    with np.load(filename) as data:
+        return data['di'], json.loads(str(data['params']))
+
+
+def estimate_from_di(di, all_di_arg=None, force='outer',
+        coeffs={'inner':1, 'outer':1, 'full':1}, ratio=0, phase_tolerance=60,
+        modul_tolerance=0.33, small_tt_regime=0.3, full_output=False, verbose=False,
+        **qacits_params):
+
+    """
+    Pointing error estimation from the normalized differential intensities,
+    using the QACITS model with calibrated linear coefficients. This is the
+    second stage of run_qacits: it is evaluated for all frames at once, and
+    does not depend on the images.
+
+    Args:
+        di (float ndarray or dict):
+            DI table of shape (..., nframes, 3, 2) (see measure_di), or
+            dictionary containing the modulus of the differential intensities
+            for each region of interest (see get_cube_di), of shape (ncube,)
+            or (nbatch, ncube)
+        all_di_arg (dict, optional):
+            dictionary containing the argument of the differential intensities
+            for each region of interest, if di is the dictionary of the moduli
+        force (str):
+            force the QACITS estimator to use a specific estimator
+        coeffs (dict of float, or list of dict):
+            linear coefficients in the QACITS model, one dict per cube for a batch;
+            the lookup tables of coeffs['lut'] are inverted instead, if any
+            (see build_lut)
+        ratio (float):
+            debiasing of the full region from the outer one, for differential
+            intensities measured with ratio=0 (e.g. by measure_di)
+        full_output (bool):
+            if True, also return the selected branch of each frame
+
+    Return:
+        full_estimate_output (float ndarray):
+            full estimate output (see run_qacits)
+        branch (int ndarray):
+            selected branch (see select_estimator), 0 if the estimator is
+            forced, if full_output is True
+    """
+
+    if all_di_arg is None:
+        all_di_xy = np.asarray(di)
+    else:
+        all_di_xy = None
+        all_di_mod = di
+        if ratio != 0:
+            from qacits.util.chunk_store import di_to_xy
+            all_di_xy = di_to_xy(all_di_mod, all_di_arg)
+    if all_di_xy is not None:
+        if ratio != 0:
+            all_di_xy = all_di_xy.copy()
+            all_di_xy[...,2,:] += ratio*all_di_xy[...,1,:]
+        all_di_mod, all_di_arg = get_di_mod_arg(all_di_xy)
+
+    shape = all_di_mod['outer'].shape
+    batch = (len(shape) == 2)
+    # lookup tables of the calibration (see build_lut), one per cube for a batch
+    luts = None
+    if isinstance(coeffs, (list, tuple)):
+        if all('lut' in c for c in coeffs):
+            luts = [c['lut'] for c in coeffs]
+        coeffs = {region: np.array([c[region] for c in coeffs])
+                  for region in ['inner', 'outer', 'full']}
+    elif 'lut' in coeffs:
+        luts = coeffs['lut']
+    # one coefficient per cube, broadcast over the frames
+    coeff = {}
+    for region in ['inner', 'outer', 'full']:
+        coeff[region] = np.asarray(coeffs[region], dtype=float)
+        if batch is True:
+            coeff[region] = np.broadcast_to(coeff[region], shape[:1])[:,np.newaxis]
 
     #-- inner region: linear
-    inner_est      = np.zeros((ncube, 2))
-    inner_est[:,0] = all_di_mod['inner'] / coeffs['inner']
-    inner_est[:,1] = all_di_arg['inner'] + np.pi
+    inner_est      = np.zeros(shape + (2,))
+    inner_est[...,0] = all_di_mod['inner'] / coeff['inner']
+    inner_est[...,1] = all_di_arg['inner'] + np.pi
     #-- outer region: linear
-    outer_est      = np.zeros((ncube, 2))
-    outer_est[:,0] = all_di_mod['outer'] / coeffs['outer']
-    outer_est[:,1] = all_di_arg['outer']
+    outer_est      = np.zeros(shape + (2,))
+    outer_est[...,0] = all_di_mod['outer'] / coeff['outer']
+    outer_est[...,1] = all_di_arg['outer']
     #-- full region: cubic
-    full_est      = np.zeros((ncube, 2))
-    full_est[:,0] = np.abs(all_di_mod['full']/coeffs['full'])**(1/3)
-    full_est[:,1] = all_di_arg['full']    
+    full_est      = np.zeros(shape + (2,))
+    full_est[...,0] = np.abs(all_di_mod['full']/coeff['full'])**(1/3)
+    full_est[...,1] = all_di_arg['full']
+    #-- or inversion of the lookup tables, valid up to the largest calibrated tip-tilt
+    full_max = 1.
+    if luts is not None:
+        for region, est in [('inner', inner_est), ('outer', outer_est), ('full', full_est)]:
+            est[...,0] = invert_lut(all_di_mod[region], luts, region)
+        full_max = np.max([lut['full'][1,-1] for lut in
+                           ([luts] if isinstance(luts, dict) else luts)])
 
-    #-- Estimator selection: 
-    final_est = np.zeros((ncube, 2))
-    test_output = np.zeros((ncube, 3))
+    #-- Estimator selection:
+    final_est = np.zeros(shape + (2,))
+    test_output = np.zeros(shape + (3,))
+    branch = np.zeros(shape, dtype=int)
     if force == 'inner':
         final_est = inner_est
     elif force == 'outer':
@@ -80,88 +270,140 @@ def run_qacits(psf_ON, psf_OFF, img_sampling, cx=None, cy=None, force='outer',
     elif force == 'full':
         final_est = full_est
     else :
-        for i in range(ncube):
-            # modulus to be trusted for choosing tt regime
-            outer_modulus = outer_est[i,0]
-            
-            # build complex phasors
-            inner_phasor = inner_est[i,0] * np.exp(1j * inner_est[i,1]) 
-            outer_phasor = outer_est[i,0] * np.exp(1j * outer_est[i,1])
-            full_phasor  = full_est[i,0]  * np.exp(1j * full_est[i,1])
-            
-            # test estimate agreement
-            #-- phase agreement: IN/OUT
-            test_phasor = np.exp(1j * inner_est[i,1]) * np.exp(-1j * outer_est[i,1])
-            inout_test_phase = np.arctan2(np.imag(test_phasor), np.real(test_phasor))
-            in_out_phase_agreement = (np.abs(inout_test_phase) < phase_tolerance/180*np.pi)
-            #-- phase agreement: OUT/FULL
-            test_phasor = np.exp(1j * full_est[i,1]) * np.exp(-1j * outer_est[i,1])
-            fullout_test_phase = np.arctan2(np.imag(test_phasor), np.real(test_phasor))
-            full_out_phase_agreement = (np.abs(fullout_test_phase) < phase_tolerance/180*np.pi)
-            full_out_modul_agreement = (np.abs(full_est[i,0]-outer_est[i,0]) < full_est[i,0]*modul_tolerance)
-            if verbose is True :
-                print(i, inner_est[i,0], outer_est[i,0], full_est[i,0], in_out_phase_agreement, 
-                        np.abs(test_phasor)*180./np.pi, in_out_phase_agreement)
-                print('{0:03d} -- '.format(i) +
-                       '\n \t IN   {0:.3f} l/D {1:.1f} deg'.format(inner_est[i,0],inner_est[i,1]*180/np.pi)+
-                       '\n \t OUT  {0:.3f} l/D {1:.1f} deg'.format(outer_est[i,0],outer_est[i,1]*180/np.pi)+
-                       '\n \t FULL {0:.3f} l/D {1:.1f} deg'.format(full_est[i,0],full_est[i,1]*180/np.pi))
-            
-            ### SMALL TIPTILT REGIME
-            if outer_modulus < small_tt_regime :
-                if verbose is True :
-                    print('\n \t > IN-OUT phase agreement is {}'.format(in_out_phase_agreement))
-                if in_out_phase_agreement == True:
-                    meanphasor = (inner_phasor + outer_phasor)/2.
-                    if verbose is True :
-                        print('\t => small1: in+out')
-                else :
-                    meanphasor = outer_phasor 
-                    if verbose is True :
-                        print('\t => small2: out')
-
-            ### LARGE TIPTILT REGIME
-            else :
-                if verbose is True :
-                    print('\n \t > FULL-OUT phase agreement is {}'.format(full_out_phase_agreement)+
-                    '\n \t > FULL-OUT modulus agreement is {}'.format(full_out_modul_agreement))
-                if full_out_phase_agreement == True:
-                    if full_out_modul_agreement == True:
-                        meanphasor = ( outer_phasor + full_phasor )/2.
-                        if verbose is True :
-                            print('\t => large1: full+out')
-                    else :
-                        if full_est[i,0] < 1.:
-                            meanphasor = full_phasor
-                        else:
-                            meanphasor = np.exp(1j * full_est[i,1]) # set the maximal estimate to 1 lbd/D
-                        if verbose is True :
-                            print('\t => large2: full')
-                else :
-                    if full_est[i,0] < 1.:
-                        meanphasor = full_phasor
-                    else:
-                        meanphasor = np.exp(1j * full_est[i,1]) # set the maximal estimate to 1 lbd/D
-                    if verbose is True :
-                        print('\t => large3: full')
-
-            if verbose is True:
-                final_phase = np.arctan2(np.imag(meanphasor), np.real(meanphasor))*180./np.pi
-                print('\t    final estimator mod = {0:.3f} l/D phase = {1:.1f} deg'.format(np.abs(meanphasor), final_phase))
-            final_est[i,0] = np.abs(meanphasor)
-            final_est[i,1] = np.arctan2(np.imag(meanphasor),np.real(meanphasor))
-            test_output[i,:] = np.array([inout_test_phase,fullout_test_phase,np.abs(full_est[i,0]-outer_est[i,0])])
-    
-    #-- Final estimator in X,Y: 
+        final_est, test_output, branch = select_estimator(inner_est, outer_est, full_est,
+            phase_tolerance=phase_tolerance, modul_tolerance=modul_tolerance,
+            small_tt_regime=small_tt_regime, full_max=full_max, verbose=verbose)
+
+    #-- Final estimator in X,Y:
     final_est_xy = np.zeros_like(final_est)
-    final_est_xy[:,0] = final_est[:,0] * np.cos(final_est[:,1])
-    final_est_xy[:,1] = final_est[:,0] * np.sin(final_est[:,1])
+    final_est_xy[...,0] = final_est[...,0] * np.cos(final_est[...,1])
+    final_est_xy[...,1] = final_est[...,0] * np.sin(final_est[...,1])
+
+    full_estimate_output = np.ndarray(shape + (11,))
+    full_estimate_output[...,0:2] = final_est_xy
+    full_estimate_output[...,2:4] = inner_est
+    full_estimate_output[...,4:6] = outer_est
+    full_estimate_output[...,6:8] = full_est
+    full_estimate_output[...,8:] = test_output
+
+    if full_output is True:
+        return full_estimate_output, branch
+    else:
+        return full_estimate_output
+
+
+def invert_lut(di_mod, luts, region):
+    """
+    Tip-tilt modulus [lambda/D] from the modulus of the differential
+    intensities of a region, by linear interpolation in the lookup table of
+    the calibration (see build_lut), i.e. a binary search per frame. Beyond
+    the table, the tip-tilt is the one of its last node.
+
+    Args:
+        di_mod (float ndarray):
+            modulus of the differential intensities, of shape (ncube,) or
+            (nbatch, ncube)
+        luts (dict, or list of dict):
+            lookup tables, or one dict of lookup tables per cube for a batch
+        region (str):
+            'inner', 'outer' or 'full'
+    """
+    if isinstance(luts, dict):
+        return np.interp(di_mod, luts[region][0], luts[region][1])
+    return np.array([np.interp(di_mod[b], luts[b][region][0], luts[b][region][1])
+                     for b in range(len(luts))])
+
+
+def select_estimator(inner_est, outer_est, full_est, phase_tolerance=60,
+        modul_tolerance=0.33, small_tt_regime=0.3, full_max=1., verbose=False):
+
+    """
+    Selection of the final QACITS estimate between the inner, outer and full
+    estimators, according to the tip-tilt regime and to the agreement of
+    their phases and moduli. Evaluated for all frames at once.
+
+    Args:
+        inner_est, outer_est, full_est (float ndarray):
+            modulus [lambda/D] and argument [rad] of the estimates in the last
+            dimension, for any number of frames
+        phase_tolerance (float):
+            maximum phase difference [deg] for two estimators to agree
+        modul_tolerance (float):
+            maximum relative modulus difference for the outer and full
+            estimators to agree
+        small_tt_regime (float):
+            outer modulus [lambda/D] below which the small tip-tilt regime is used
+        full_max (float):
+            maximum modulus [lambda/D] of the full estimate used alone
+
+    Return:
+        final_est (float ndarray):
+            modulus and argument of the final estimate
+        test_output (float ndarray):
+            IN/OUT phase difference, FULL/OUT phase difference, FULL/OUT
+            modulus difference
+        branch (int ndarray):
+            selected branch: 1 small1 (in+out), 2 small2 (out), 3 large1
+            (full+out), 4 large2 (full), 5 large3 (full)
+    """
+
+    # modulus to be trusted for choosing tt regime
+    outer_modulus = outer_est[...,0]
+
+    # build complex phasors
+    inner_phasor = inner_est[...,0] * np.exp(1j * inner_est[...,1])
+    outer_phasor = outer_est[...,0] * np.exp(1j * outer_est[...,1])
+    full_phasor  = full_est[...,0]  * np.exp(1j * full_est[...,1])
+    # set the maximal full estimate to full_max (1 lbd/D by default)
+    full_phasor_max = np.where(full_est[...,0] < full_max, full_phasor,
+                               full_max * np.exp(1j * full_est[...,1]))
+
+    # test estimate agreement
+    #-- phase agreement: IN/OUT
+    test_phasor = np.exp(1j * inner_est[...,1]) * np.exp(-1j * outer_est[...,1])
+    inout_test_phase = np.arctan2(np.imag(test_phasor), np.real(test_phasor))
+    in_out_phase_agreement = (np.abs(inout_test_phase) < phase_tolerance/180*np.pi)
+    #-- phase agreement: OUT/FULL
+    test_phasor = np.exp(1j * full_est[...,1]) * np.exp(-1j * outer_est[...,1])
+    fullout_test_phase = np.arctan2(np.imag(test_phasor), np.real(test_phasor))
+    full_out_phase_agreement = (np.abs(fullout_test_phase) < phase_tolerance/180*np.pi)
+    full_out_modul_agreement = (np.abs(full_est[...,0]-outer_est[...,0]) < full_est[...,0]*modul_tolerance)
+
+    ### SMALL TIPTILT REGIME: small1 in+out, small2 out
+    ### LARGE TIPTILT REGIME: large1 full+out, large2 full, large3 full
+    small = (outer_modulus < small_tt_regime)
+    branch = np.where(small,
+                      np.where(in_out_phase_agreement, 1, 2),
+                      np.where(full_out_phase_agreement,
+                               np.where(full_out_modul_agreement, 3, 4), 5))
+    meanphasor = np.select([branch == 1, branch == 2, branch == 3],
+                           [(inner_phasor + outer_phasor)/2., outer_phasor,
+                            (outer_phasor + full_phasor)/2.], full_phasor_max)
+
+    # the tolerances may be arrays broadcast with the estimates (see sweep_selection)
+    final_est = np.zeros(branch.shape + (2,))
+    final_est[...,0] = np.abs(meanphasor)
+    final_est[...,1] = np.arctan2(np.imag(meanphasor), np.real(meanphasor))
+    test_output = np.zeros(branch.shape + (3,))
+    test_output[...,0] = inout_test_phase
+    test_output[...,1] = fullout_test_phase
+    test_output[...,2] = np.abs(full_est[...,0]-outer_est[...,0])
 
-    full_estimate_output = np.ndarray((ncube, 11))
-    full_estimate_output[:,0:2] = final_est_xy
-    full_estimate_output[:,2:4] = inner_est
-    full_estimate_output[:,4:6] = outer_est
-    full_estimate_output[:,6:8] = full_est
-    full_estimate_output[:,8:] = test_output
+    if verbose is True:
+        labels = {1:'small1: in+out', 2:'small2: out', 3:'large1: full+out',
+                  4:'large2: full', 5:'large3: full'}
+        for i in np.ndindex(outer_modulus.shape):
+            print('{0} -- '.format(i) +
+                   '\n \t IN   {0:.3f} l/D {1:.1f} deg'.format(inner_est[i][0],inner_est[i][1]*180/np.pi)+
+                   '\n \t OUT  {0:.3f} l/D {1:.1f} deg'.format(outer_est[i][0],outer_est[i][1]*180/np.pi)+
+                   '\n \t FULL {0:.3f} l/D {1:.1f} deg'.format(full_est[i][0],full_est[i][1]*180/np.pi))
+            if small[i]:
+                print('\n \t > IN-OUT phase agreement is {}'.format(in_out_phase_agreement[i]))
+            else:
+                print('\n \t > FULL-OUT phase agreement is {}'.format(full_out_phase_agreement[i])+
+                '\n \t > FULL-OUT modulus agreement is {}'.format(full_out_modul_agreement[i]))
+            print('\t => ' + labels[int(branch[i])])
+            print('\t    final estimator mod = {0:.3f} l/D phase = {1:.1f} deg'
+                  .format(final_est[i][0], final_est[i][1]*180./np.pi))
 
-    return full_estimate_output
\ No newline at end of file
+    return final_est, test_output, branch
@@ -0,0 +1,243 @@
+from qacits.util.psf_flux import get_all_di_xy, get_psf_flux
+from qacits.run_qacits import estimate_from_di
+import numpy as np
+import time
+
+# pre-processing parameters of get_all_di_xy
+_di_params = ['dark', 'background', 'bad_pixels', 'saturation_level', 'saturation_mode']
+
+
+def choose_bin_width(cost_per_frame, noise_per_frame, latency_budget, target_noise,
+        frame_period=None, max_width=1000):
+    """
+    Chooses the number of frames averaged per estimate (bin width) from the
+    processing cost and the noise of single frames.
+
+    The noise of an estimate averaged over w frames is noise_per_frame/sqrt(w)
+    (white noise), so the target noise needs w >= (noise_per_frame/target_noise)**2.
+    The latency of an estimate, from the first frame of its bin, is
+    (w - 1)*frame_period + w*cost_per_frame, which must stay below the latency
+    budget. When both cannot be met, the latency budget prevails.
+
+    Args:
+        cost_per_frame (float):
+            processing time per frame [s]
+        noise_per_frame (float):
+            noise of the tip-tilt estimate of single frames [lambda/D rms per axis]
+        latency_budget (float):
+            maximum latency of an estimate [s]
+        target_noise (float):
+            target noise of the estimates [lambda/D rms per axis]
+        frame_period (float, optional):
+            time between two frames [s]; if None, the frames are all available
+            (offline processing) and only the processing time counts
+        max_width (int):
+            maximum bin width
+
+    Returns:
+        width (int):
+            number of frames per bin
+    """
+
+    if frame_period is None:
+        frame_period = 0.
+    # largest width within the latency budget
+    width_latency = int(np.floor((latency_budget + frame_period) /
+                                 max(frame_period + cost_per_frame, 1e-12)))
+    # smallest width meeting the target noise
+    width_noise = int(np.ceil((noise_per_frame/target_noise)**2)) if target_noise > 0 else max_width
+    width = min(width_noise, width_latency, max_width)
+
+    return max(width, 1)
+
+
+def frame_noise(tt_xy):
+    """
+    Robust estimate of the white noise of a sequence of tip-tilt estimates,
+    from the differences of consecutive frames (insensitive to slow drifts).
+
+    Args:
+        tt_xy (float ndarray):
+            x and y tip-tilt estimates, of dimensions (n, 2)
+
+    Returns:
+        noise (float):
+            noise per axis [rms], NaN if there are less than 3 frames
+    """
+
+    tt_xy = np.asarray(tt_xy)
+    if len(tt_xy) < 3:
+        return np.nan
+    diff = np.diff(tt_xy, axis=0)
+    mad = np.median(np.abs(diff - np.median(diff, axis=0)), axis=0)
+    # normal distribution: sigma = 1.4826 mad, and var(diff) = 2 var(frame)
+    sigma = 1.4826*mad/np.sqrt(2)
+
+    return np.sqrt(np.mean(sigma**2))
+
+
+class AdaptiveBinning(object):
+    """
+    Adaptive binning of the frames of a stream, driven by a latency budget
+    and a target noise of the estimates, instead of a fixed number of binned
+    images (nbin of run_qacits).
+
+    The differential intensities of each frame are computed when the frames
+    are processed; the processing cost per frame and the noise of the
+    single-frame estimates are measured on the fly (exponential moving
+    averages), and the bin width is chosen by choose_bin_width after each
+    call. The frames are binned in the space of the differential intensities,
+    which is equivalent to binning the images (see get_cube_di). Frames of an
+    incomplete bin are kept for the next call.
+
+    Args:
+        psf_OFF (float ndarray):
+            off-axis PSF frame
+        img_sampling (float):
+            image sampling in pix per lambda/D
+        latency_budget (float):
+            maximum latency of an estimate [s]
+        target_noise (float):
+            target noise of the estimates [lambda/D rms per axis]
+        frame_period (float, optional):
+            time between two frames [s], None for offline processing
+        max_width (int):
+            maximum bin width
+        smoothing (float):
+            weight of the last measurement in the moving averages (0 to 1)
+        qacits_params:
+            other parameters of run_qacits (radii, coeffs, force, cx, cy,
+            ratio, exact, and the pre-processing of get_cube_di)
+    """
+
+    def __init__(self, psf_OFF, img_sampling, latency_budget, target_noise,
+                 frame_period=None, max_width=1000, smoothing=0.2, cx=None, cy=None,
+                 radii={'inner':(0,1.7), 'outer':(1.7,2.3), 'full':(0, 2.7)},
+                 ratio=0, exact=None, **qacits_params):
+
+        self.img_sampling = img_sampling
+        self.latency_budget = latency_budget
+        self.target_noise = target_noise
+        self.frame_period = frame_period
+        self.max_width = max_width
+        self.smoothing = smoothing
+        self.di_params = dict(radii=radii, ratio=ratio, cx=cx, cy=cy, exact=exact)
+        for k in _di_params:
+            if k in qacits_params:
+                self.di_params[k] = qacits_params.pop(k)
+        self.qacits_params = qacits_params
+        self.psf_flux = get_psf_flux(psf_OFF, img_sampling/2, cx=cx, cy=cy, exact=exact)
+        self.cost_per_frame = None
+        self.noise_per_frame = None
+        self.width = 1
+        self.buffer = np.zeros((0, 3, 2))
+        self.last_tt = np.zeros((0, 2))
+
+    def _update(self, value, measure):
+        if not np.isfinite(measure):
+            return value
+        if value is None:
+            return measure
+        return (1 - self.smoothing)*value + self.smoothing*measure
+
+    def process(self, frames):
+        """
+        Processes new frames of the stream.
+
+        Args:
+            frames (ndarray):
+                cube of frames of dimensions (n, ny, nx)
+
+        Returns:
+            full_estimate_output (float ndarray):
+                full estimate output (see run_qacits) of the bins completed
+                by these frames, of dimensions (nbin, 11)
+            widths (int ndarray):
+                number of frames of each bin
+        """
+
+        frames = np.asarray(frames)
+        if frames.ndim == 2:
+            frames = frames[np.newaxis]
+        t0 = time.perf_counter()
+        di_xy = get_all_di_xy(frames, img_sampling=self.img_sampling,
+                              **self.di_params)[0]/self.psf_flux
+        if len(frames) > 0:
+            self.cost_per_frame = self._update(self.cost_per_frame,
+                                               (time.perf_counter() - t0)/len(frames))
+
+        # noise of the single-frame estimates, with the last frame of the previous call
+        tt_xy = estimate_from_di(di_xy, **self.qacits_params)[:,0:2]
+        tt_xy = np.concatenate([self.last_tt, tt_xy])
+        self.noise_per_frame = self._update(self.noise_per_frame, frame_noise(tt_xy))
+        self.last_tt = tt_xy[-1:]
+        if self.noise_per_frame is not None:
+            self.width = choose_bin_width(self.cost_per_frame, self.noise_per_frame,
+                self.latency_budget, self.target_noise, frame_period=self.frame_period,
+                max_width=self.max_width)
+
+        # complete bins
+        self.buffer = np.concatenate([self.buffer, di_xy])
+        nbin = len(self.buffer)//self.width
+        return self._estimate(nbin*self.width, self.width)
+
+    def flush(self):
+        """ Processes the frames of the last incomplete bin, e.g. at the end of a stream. """
+        return self._estimate(len(self.buffer), len(self.buffer))
+
+    def _estimate(self, nframes, width):
+        if nframes == 0:
+            return np.zeros((0, 11)), np.zeros(0, dtype=int)
+        di_xy = np.mean(self.buffer[:nframes].reshape(-1, width, 3, 2), axis=1)
+        self.buffer = self.buffer[nframes:]
+        estimates = estimate_from_di(di_xy, **self.qacits_params)
+        return estimates, np.full(len(estimates), width)
+
+
+def run_qacits_adaptive(psf_ON, psf_OFF, img_sampling, latency_budget, target_noise,
+        chunk_size=100, frame_period=None, verbose=False, **qacits_params):
+
+    """
+    Runs QACITS on a cube with adaptive binning (see AdaptiveBinning), the
+    cube being processed by chunks of frames as a stream.
+
+    Args:
+        psf_ON (float ndarray):
+            cube of on-axis PSFs
+        psf_OFF (float ndarray):
+            off-axis PSF frame
+        img_sampling (float):
+            image sampling in pix per lambda/D
+        latency_budget (float):
+            maximum latency of an estimate [s]
+        target_noise (float):
+            target noise of the estimates [lambda/D rms per axis]
+        chunk_size (int):
+            number of frames processed at once
+        frame_period (float, optional):
+            time between two frames [s], None for offline processing
+
+    Returns:
+        full_estimate_output (float ndarray):
+            full estimate output (see run_qacits), one row per bin
+        widths (int ndarray):
+            number of frames of each bin
+    """
+
+    binning = AdaptiveBinning(psf_OFF, img_sampling, latency_budget, target_noise,
+                              frame_period=frame_period, **qacits_params)
+    estimates = []
+    widths = []
+    for i0 in range(0, len(psf_ON), chunk_size):
+        est, w = binning.process(psf_ON[i0:i0+chunk_size])
+        estimates.append(est)
+        widths.append(w)
+        if verbose is True:
+            print('{0} frames: {1:.2e} s/frame, noise {2:.4f} l/D, bin width {3}'.format(
+                  i0 + len(psf_ON[i0:i0+chunk_size]), binning.cost_per_frame,
+                  binning.noise_per_frame, binning.width))
+    est, w = binning.flush()
+    estimates.append(est)
+    widths.append(w)
+
+    return np.concatenate(estimates), np.concatenate(widths)
@@ -0,0 +1,180 @@
+from qacits.util.psf_flux import get_cube_di
+from qacits.run_qacits import estimate_from_di
+from qacits.util.ingest import file_checksum
+from qacits.util.chunk_store import ChunkedWriter, open_store
+import numpy as np
+import hashlib
+import json
+import os
+
+regions = ['inner', 'outer', 'full']
+
+
+def read_progress(output_dir):
+    """
+    Reads the progress log of a batch run.
+
+    Args:
+        output_dir (str):
+            output directory of the run
+
+    Returns:
+        config (dict):
+            configuration of the run (first record), None for a new run
+        chunks (dict):
+            records of the completed chunks, by chunk index
+    """
+    config = None
+    chunks = {}
+    filename = os.path.join(output_dir, 'progress.jsonl')
+    if os.path.isfile(filename):
+        with open(filename) as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    # last record interrupted while being written
+                    continue
+                if 'chunk' in record:
+                    chunks[record['chunk']] = record
+                else:
+                    config = record
+    return config, chunks
+
+
+def _to_json(x):
+    # arrays of the configuration, e.g. a dark frame, are stored as a checksum
+    x = np.asarray(x)
+    if x.size > 16:
+        return 'sha256:' + hashlib.sha256(np.ascontiguousarray(x).tobytes()).hexdigest()
+    return x.tolist()
+
+
+def _append_record(output_dir, record):
+    with open(os.path.join(output_dir, 'progress.jsonl'), 'a') as f:
+        f.write(json.dumps(record) + '\n')
+        f.flush()
+        os.fsync(f.fileno())
+
+
+def run_qacits_batch(psf_ON, psf_OFF, img_sampling, output_dir, chunk_size=1000,
+        cx=None, cy=None, radii={'inner':(0,1.7), 'outer':(1.7,2.3), 'full':(0, 2.7)},
+        nbin=0, ratio=0, exact=None, verbose=False, **qacits_params):
+
+    """
+    Batch driver of run_qacits for long cubes, with checkpoints. The cube is
+    processed by chunks of chunk_size frames: the estimates and the
+    differential intensities of each chunk are written as one chunk of a
+    store in output_dir (see ChunkedWriter, with the configuration of the
+    run as parameters), and the completed chunk is then appended to a
+    progress log with the checksums of its files.
+
+    When a run is restarted with the same output_dir, the completed chunks
+    are skipped, after checking their checksums. The chunks of the store
+    being appended in order, the run resumes from the first missing or
+    corrupted chunk, which is processed again with all the next ones. The
+    configuration of the run must not change between restarts.
+
+    Args:
+        psf_ON (float ndarray):
+            cube of on-axis PSFs (3D), e.g. a memory-mapped FITS file
+        psf_OFF (float ndarray):
+            off-axis PSF frame
+        img_sampling (float):
+            image sampling in pix per lambda/D
+        output_dir (str):
+            output directory, created if needed
+        chunk_size (int):
+            number of frames per chunk
+        nbin (int):
+            number of binned images per chunk (see bin_images)
+        qacits_params:
+            other parameters of run_qacits, including the pre-processing
+            (dark, background, bad_pixels, saturation_level, saturation_mode)
+
+    Return:
+        full_estimate_output (float ndarray):
+            full estimate output for the whole cube (see run_qacits)
+    """
+
+    os.makedirs(output_dir, exist_ok=True)
+    di_params = {k: qacits_params[k] for k in ['dark', 'background', 'bad_pixels',
+                 'saturation_level', 'saturation_mode'] if k in qacits_params}
+    ncube = len(psf_ON)
+    nchunk = int(np.ceil(ncube/chunk_size))
+    # configuration of the run, that must be the same when restarting
+    config = dict(shape=list(np.shape(psf_ON)), chunk_size=chunk_size, nchunk=nchunk,
+                  img_sampling=float(img_sampling), cx=cx, cy=cy, radii=radii,
+                  nbin=nbin, ratio=ratio, exact=exact,
+                  qacits_params={k: qacits_params[k] for k in sorted(qacits_params)})
+    config = json.loads(json.dumps(config, default=_to_json))
+    old_config, chunks = read_progress(output_dir)
+    if old_config is None:
+        writer = ChunkedWriter(output_dir, params=config, chunk_size=chunk_size)
+        _append_record(output_dir, config)
+    elif old_config != config:
+        raise ValueError('the configuration differs from the one of the run in %s'%output_dir)
+    else:
+        writer = ChunkedWriter(output_dir, mode='a')
+    # empty outputs, so that the arrays of the store exist (and have their
+    # shape) before the first chunk
+    no_di = {region: np.zeros(0) for region in regions}
+    writer.append(estimates=estimate_from_di(no_di, no_di, **qacits_params),
+                  di=(no_di, no_di))
+
+    # first chunk to process: the last chunks of the store may be incomplete,
+    # i.e. written but not recorded in the progress log
+    first = 0
+    while first < nchunk and first in chunks and all(os.path.isfile(filename) and
+            file_checksum(filename) == chunks[first]['sha256'][name]
+            for name, filename in writer.chunk_files(first).items()):
+        first += 1
+    if verbose is True and first > 0:
+        print('chunks 1 to %s/%s: already completed'%(first, nchunk))
+    if first < nchunk and first in chunks and verbose is True:
+        print('chunk %s/%s: checksum mismatch, processed again'%(first + 1, nchunk))
+    writer.truncate(first)
+
+    for i in range(first, nchunk):
+        i0 = i*chunk_size
+        all_di_mod, all_di_arg = get_cube_di(psf_ON[i0:i0+chunk_size], psf_OFF,
+            img_sampling, radii, nbin=nbin, ratio=ratio, cx=cx, cy=cy, exact=exact,
+            **di_params)
+        estimates = estimate_from_di(all_di_mod, all_di_arg, **qacits_params)
+        # one chunk of the store per chunk of the cube
+        writer.append(estimates=estimates, di=(all_di_mod, all_di_arg))
+        writer.flush()
+        _append_record(output_dir, dict(chunk=i, first=i0, nframes=len(estimates),
+            sha256={name: file_checksum(filename)
+                    for name, filename in writer.chunk_files(i).items()}))
+        if verbose is True:
+            print('chunk %s/%s: done'%(i + 1, nchunk))
+
+    return load_batch(output_dir)
+
+
+def load_batch(output_dir, key='estimates'):
+    """
+    Reads the outputs of a batch run, for the completed chunks.
+
+    Args:
+        output_dir (str):
+            output directory of the run
+        key (str):
+            'estimates' for the full estimate output of run_qacits, 'di' for
+            the differential intensities, of shape (n, 3, 2) for the inner,
+            outer and full regions, along the x and y axes
+
+    Return:
+        output (float ndarray):
+            output of the completed chunks, in the order of the frames
+    """
+
+    arrays, _ = open_store(output_dir)
+    _, chunks = read_progress(output_dir)
+    output = arrays[key]
+    # completed chunks: recorded in the progress log, from the first one
+    nchunk = 0
+    while nchunk < len(output.bounds) - 1 and nchunk in chunks:
+        nchunk += 1
+    return output[:output.bounds[nchunk]]
@@ -0,0 +1,262 @@
+from qacits.calibrate_qacits import calibrate_qacits
+from qacits.run_qacits import run_qacits
+from qacits.util.psf_flux import get_di_xy, get_psf_flux, _exact_default_
+from qacits.util.bin_images import bin_images
+from qacits.util.ingest import getdata, to_native
+from qacits.util.vortex_psf import make_vortex_psfs
+import numpy as np
+import os
+import time
+import tracemalloc
+
+# photometry paths of get_di_xy, from the most accurate to the fastest
+backends = {'exact':True, 'sampled':False}
+
+
+def get_backends():
+    """ Returns the list of photometry paths available (exact needs photutils). """
+    return [name for name in backends if backends[name] is False or _exact_default_]
+
+
+def benchmark_backends(psf_ON_calib, psf_ON, psf_OFF, img_sampling, tt_lamD_calib,
+        tt_lamD, lamD=21.78, sign=1, names=None, nrepeat=3, verbose=False,
+        **qacits_params):
+
+    """
+    Runs calibrate_qacits and run_qacits once per photometry path, and
+    measures the accuracy and the throughput of each path.
+
+    Args:
+        psf_ON_calib (float ndarray):
+            cube of on-axis PSFs used for the calibration
+        psf_ON (float ndarray):
+            cube of on-axis PSFs used for the pointing error estimation
+        psf_OFF (float ndarray):
+            off-axis PSF frame
+        img_sampling (float):
+            image sampling in pix per lambda/D
+        tt_lamD_calib (2D float ndarray):
+            true x and y tip-tilt values in lambda/D of psf_ON_calib
+        tt_lamD (2D float ndarray):
+            true x and y tip-tilt values in lambda/D of psf_ON
+        lamD (float):
+            mas per lambda/D
+        sign (int):
+            sign of the QACITS estimate w.r.t. the true tip-tilt, e.g. -1 for
+            the data cubes of the demo and +1 for make_vortex_psfs
+        names (list of str, optional):
+            photometry paths to compare, defaults to all the available ones
+        nrepeat (int):
+            the throughput is the best of nrepeat runs of run_qacits
+
+    Return:
+        results (dict):
+            for each path, a dict with the RMS pointing error in lambda/D
+            ('rms_lamD') and mas ('rms_mas'), the RMS difference to the
+            estimates of the first path ('diff_lamD'), the frames per second
+            of run_qacits ('fps') and its peak memory in MB ('peak_MB')
+    """
+
+    if names is None:
+        names = get_backends()
+    tt_lamD = np.asarray(tt_lamD)
+    results = {}
+    for name in names:
+        exact = backends[name]
+        params = dict(qacits_params, exact=exact)
+        params['coeffs'] = calibrate_qacits(psf_ON_calib, psf_OFF,
+            img_sampling, tt_lamD_calib, **dict(params, plot_fig=False))
+        # timed runs without tracing, then one traced run for the peak memory
+        elapsed = np.inf
+        for i in range(nrepeat):
+            t0 = time.perf_counter()
+            tt_est = run_qacits(psf_ON, psf_OFF, img_sampling, **params)[...,0:2]
+            elapsed = min(elapsed, time.perf_counter() - t0)
+        tracemalloc.start()
+        run_qacits(psf_ON, psf_OFF, img_sampling, **params)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        tt_est = sign*tt_est
+        if len(results) == 0:
+            tt_ref = tt_est
+        res = {}
+        res['rms_lamD'] = np.sqrt(np.mean(np.sum((tt_est - tt_lamD)**2, axis=-1)))
+        res['rms_mas'] = res['rms_lamD']*lamD
+        res['diff_lamD'] = np.sqrt(np.mean(np.sum((tt_est - tt_ref)**2, axis=-1)))
+        res['fps'] = tt_lamD.size/2/elapsed
+        res['peak_MB'] = peak/2**20
+        results[name] = res
+        if verbose is True:
+            print('{0:8s} rms = {1:.4f} l/D = {2:.2f} mas, diff = {3:.4f} l/D, '
+                  '{4:.0f} frames/s, peak = {5:.1f} MB'.format(name, res['rms_lamD'],
+                  res['rms_mas'], res['diff_lamD'], res['fps'], res['peak_MB']))
+
+    return results
+
+
+def check_backends(results, tolerance=0.005):
+    """
+    Checks that the faster photometry paths are accurate enough, i.e. that
+    the RMS pointing error of each path does not exceed the one of the first
+    (reference) path by more than the tolerance.
+
+    Args:
+        results (dict):
+            results of benchmark_backends
+        tolerance (float):
+            maximum increase of the RMS pointing error [lambda/D]
+
+    Return:
+        failed (list of str):
+            paths not accurate enough, empty if all paths pass
+    """
+
+    names = list(results)
+    ref = results[names[0]]['rms_lamD']
+    failed = [name for name in names[1:]
+              if results[name]['rms_lamD'] - ref > tolerance]
+    return failed
+
+
+def run_benchmark(data_dir='data', img_sampling=3.98, lamD=21.78, tolerance=0.005,
+        ncube=1000, jitter=0.05, flux=1e6, seed=0, nrepeat=3, verbose=True,
+        **qacits_params):
+
+    """
+    Accuracy vs throughput benchmark of the photometry paths, on the data
+    cubes and on synthetic cubes. The on-axis data cubes (see the demo) are
+    not in the repository: if they are missing from data_dir, on-axis cubes
+    are simulated (make_vortex_psfs) for the tip-tilt sequences of data_dir.
+    The synthetic case is a random jitter sequence of ncube frames, with
+    photon noise.
+
+    Args:
+        data_dir (str):
+            directory of the data files
+        img_sampling (float):
+            image sampling in pix per lambda/D of the data cubes
+        lamD (float):
+            mas per lambda/D
+        tolerance (float):
+            maximum increase of the RMS pointing error [lambda/D] of the
+            faster paths (see check_backends)
+        ncube (int):
+            number of frames of the synthetic jitter sequence
+        jitter (float):
+            standard deviation [lambda/D] of the synthetic jitter, per axis
+        flux (float):
+            total flux [photons] of the synthetic off-axis PSF
+
+    Return:
+        all_results (dict):
+            results of benchmark_backends for the 'data' and 'synthetic' cases
+    """
+
+    qacits_params.setdefault('force', None)
+    tt_lamD_calib = getdata(os.path.join(data_dir, 'point_8s_100ms_L_calib.fits'))
+    tt_lamD_jitter = getdata(os.path.join(data_dir, 'point_8s_100ms_L_jitter.fits'))
+    files = [os.path.join(data_dir, 'onaxis_PSF_L_CVC_%s.fits.gz'%s)
+             for s in ['calib', 'jitter']]
+    cases = {}
+    if all(os.path.isfile(f) for f in files):
+        psf_OFF = getdata(os.path.join(data_dir, 'offaxis_PSF_L_CVC.fits'))
+        cases['data'] = (getdata(files[0]), getdata(files[1]), psf_OFF,
+                         img_sampling, tt_lamD_calib, tt_lamD_jitter, -1)
+    # sampling of the simulated PSFs, for the default pupil size
+    npupil = 64
+    sim_sampling = np.round(npupil*img_sampling)/npupil
+    if not 'data' in cases:
+        psf_ON_calib, psf_OFF = make_vortex_psfs(tt_lamD_calib, img_sampling, npupil=npupil)
+        psf_ON, _ = make_vortex_psfs(tt_lamD_jitter, img_sampling, npupil=npupil)
+        cases['data'] = (psf_ON_calib, psf_ON, psf_OFF, sim_sampling,
+                         tt_lamD_calib, tt_lamD_jitter, 1)
+    rng = np.random.default_rng(seed)
+    tt_lamD = rng.normal(0, jitter, (ncube, 2))
+    psf_ON_calib, psf_OFF = make_vortex_psfs(tt_lamD_calib, img_sampling,
+        npupil=npupil, flux=flux, seed=seed)
+    psf_ON, _ = make_vortex_psfs(tt_lamD, img_sampling, npupil=npupil, flux=flux,
+        seed=seed+1)
+    cases['synthetic'] = (psf_ON_calib, psf_ON, psf_OFF, sim_sampling,
+                          tt_lamD_calib, tt_lamD, 1)
+
+    all_results = {}
+    for case in cases:
+        if verbose is True:
+            print('\n{0} cubes:'.format(case))
+        psf_ON_calib, psf_ON, psf_OFF, sampling, tt_calib, tt, sign = cases[case]
+        all_results[case] = benchmark_backends(psf_ON_calib, psf_ON, psf_OFF,
+            sampling, tt_calib, tt, lamD=lamD, sign=sign, nrepeat=nrepeat,
+            verbose=verbose, **qacits_params)
+    for case in all_results:
+        failed = check_backends(all_results[case], tolerance=tolerance)
+        assert len(failed) == 0, ('{0} cubes: RMS pointing error of {1} exceeds the '
+            '{2} one by more than {3} lambda/D'.format(case, ', '.join(failed),
+            list(all_results[case])[0], tolerance))
+
+    return all_results
+
+
+def benchmark_byte_order(data_dir='data', img_sampling=3.98, ncube=200, nrepeat=5,
+        verbose=True):
+
+    """
+    Benchmark of the numpy kernels on big-endian data, as returned by
+    fits.getdata, vs the same data converted to native byte order at load
+    time (see ingest.to_native). The cube is made of ncube copies of the
+    off-axis PSF frame of data_dir.
+
+    Args:
+        data_dir (str):
+            directory of the data files
+        img_sampling (float):
+            image sampling in pix per lambda/D of the data
+        ncube (int):
+            number of frames of the cube
+        nrepeat (int):
+            each timing is the best of nrepeat runs
+
+    Return:
+        results (dict):
+            for each kernel, the time [s] on big-endian and on native data,
+            and the speed-up; 'load' is the time of the conversion itself
+    """
+
+    from astropy.io import fits
+
+    psf_OFF = fits.getdata(os.path.join(data_dir, 'offaxis_PSF_L_CVC.fits'))
+    cube = np.repeat(psf_OFF[np.newaxis], ncube, axis=0)
+    t0 = time.perf_counter()
+    cube_native = to_native(cube)
+    t_load = time.perf_counter() - t0
+    psf_OFF_native = to_native(psf_OFF)
+    kernels = {
+        'bin_images': lambda c, off: bin_images(c, 10),
+        'get_di_xy': lambda c, off: get_di_xy(c, img_sampling, exact=False),
+        'get_psf_flux': lambda c, off: get_psf_flux(off, img_sampling/2, exact=False),
+        'run_qacits': lambda c, off: run_qacits(c, off, img_sampling, exact=False)}
+    results = {'load': dict(native=t_load)}
+    if verbose is True:
+        print('{0} frames of {1}, big-endian ({2}) vs native ({3}):'.format(ncube,
+              psf_OFF.shape, cube.dtype.str, cube_native.dtype.str))
+        print('{0:14s} {1:.2e} s'.format('to_native', t_load))
+    for name in kernels:
+        res = {}
+        for key, c, off in [('big_endian', cube, psf_OFF), ('native', cube_native, psf_OFF_native)]:
+            elapsed = np.inf
+            for i in range(nrepeat):
+                t0 = time.perf_counter()
+                kernels[name](c, off)
+                elapsed = min(elapsed, time.perf_counter() - t0)
+            res[key] = elapsed
+        res['speedup'] = res['big_endian']/res['native']
+        results[name] = res
+        if verbose is True:
+            print('{0:14s} {1:.2e} s vs {2:.2e} s, speed-up {3:.2f}'.format(name,
+                  res['big_endian'], res['native'], res['speedup']))
+
+    return results
+
+
+if __name__ == '__main__':
+    run_benchmark()
+    benchmark_byte_order()
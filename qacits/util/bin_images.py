@@ -19,9 +19,11 @@ def bin_images(cube, nbin):
             binned image cube
     """
 
-    # image cube must be 3D numpy array
-    cube = np.array(cube, ndmin=3)
-    ncube, ny, nx = cube.shape
+    # image cube must be 3D numpy array (not copied)
+    cube = np.asarray(cube)
+    if cube.ndim == 2:
+        cube = cube[np.newaxis]
+    ncube = cube.shape[0]
     assert nbin <= ncube, 'nbin must be <= ncube'
 
     # case 0:
@@ -29,14 +31,14 @@ def bin_images(cube, nbin):
         cube_binned = cube.copy()
     # case 1: all images averaged
     elif nbin == 1:
-        cube_binned = np.array(np.mean(cube, axis=0), ndmin=3)
+        cube_binned = np.mean(cube, axis=0, keepdims=True)
     # else: bin the images
     elif ncube > 1:
-        cube_binned = np.zeros((nbin, ny, nx))
+        cube_binned = np.zeros((nbin,) + cube.shape[1:])
         bin_width = ncube // nbin
         i0 = ncube - bin_width * nbin
         for i in range(nbin):
-            cube_binned[i] = np.mean(cube[i0+bin_width*i:i0+bin_width*(i+1),:,:], axis=0)
+            cube_binned[i] = np.mean(cube[i0+bin_width*i:i0+bin_width*(i+1)], axis=0)
     else :
         cube_binned = cube.copy()
 
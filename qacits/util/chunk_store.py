@@ -0,0 +1,253 @@
+import numpy as np
+import io
+import json
+import os
+import zlib
+
+regions = ['inner', 'outer', 'full']
+
+
+def _json_default(x):
+    # numpy scalars and arrays of the metadata
+    return np.asarray(x).tolist()
+
+
+def _chunk_filename(path, name, i, compression):
+    filename = os.path.join(path, name, '%06d.npy'%i)
+    return filename + '.z' if compression == 'zlib' else filename
+
+
+class ChunkedWriter(object):
+    """
+    Chunked, compressed array writer for the QACITS outputs, e.g. the full
+    estimate output, the differential intensities of each region and the
+    selected branches. The store is a directory on the local filesystem:
+    one sub-directory per array, holding one file per chunk of chunk_size
+    frames, and a metadata file (meta.json) with the array shapes, data
+    types, chunk lengths and the QACITS parameters (radii, coeffs, image
+    sampling, center...).
+
+    Frames are appended in any number (streaming): full chunks are written
+    as soon as they are complete, and the metadata is updated after each
+    chunk, so a store can be read while it is written. Uncompressed chunks
+    (compression=None) are .npy files that can be memory-mapped when read
+    (see ChunkedArray); compressed chunks are zlib-compressed .npy files.
+
+    Args:
+        path (str):
+            directory of the store
+        params (dict, optional):
+            parameters stored in the metadata
+        chunk_size (int):
+            number of frames per chunk
+        compression (str or None):
+            'zlib', or None for memory-mappable chunks
+        level (int):
+            zlib compression level
+        mode (str):
+            'w' to create (or overwrite) the store, 'a' to append to an
+            existing store
+    """
+
+    def __init__(self, path, params=None, chunk_size=1000, compression='zlib', level=1,
+                 mode='w'):
+
+        assert mode in ['w', 'a'], "mode must be 'w' or 'a'"
+        self.path = path
+        self.buffers = {}
+        if mode == 'a' and os.path.isfile(os.path.join(path, 'meta.json')):
+            self.meta = read_meta(path)
+            if params is not None:
+                self.meta['params'].update(json.loads(json.dumps(params,
+                                           default=_json_default)))
+        else:
+            os.makedirs(path, exist_ok=True)
+            self.meta = dict(chunk_size=chunk_size, compression=compression, level=level,
+                             params=json.loads(json.dumps(params or {},
+                                               default=_json_default)),
+                             arrays={})
+            self._write_meta()
+
+    def append(self, **arrays):
+        """
+        Appends frames to the arrays of the store, e.g.
+        append(estimates=full_estimate_output, branch=branch). The
+        differential intensities can be given as a (all_di_mod, all_di_arg)
+        tuple of dicts, stored as an array of dimensions (n, 3, 2) for the
+        inner, outer and full regions, along the x and y axes.
+        """
+        for name in arrays:
+            data = arrays[name]
+            if isinstance(data, tuple):
+                data = di_to_xy(*data)
+            data = np.asarray(data)
+            if name not in self.meta['arrays']:
+                self.meta['arrays'][name] = dict(dtype=data.dtype.str,
+                    shape=list(data.shape[1:]), chunks=[])
+                os.makedirs(os.path.join(self.path, name), exist_ok=True)
+            spec = self.meta['arrays'][name]
+            assert list(data.shape[1:]) == spec['shape'], 'wrong frame shape for %s'%name
+            data = data.astype(spec['dtype'], copy=False)
+            if name in self.buffers:
+                data = np.concatenate([self.buffers.pop(name), data])
+            chunk_size = self.meta['chunk_size']
+            nfull = len(data)//chunk_size*chunk_size
+            for i0 in range(0, nfull, chunk_size):
+                self._write_chunk(name, data[i0:i0+chunk_size])
+            if nfull < len(data):
+                self.buffers[name] = data[nfull:]
+        self._write_meta()
+
+    def flush(self):
+        """ Writes the incomplete chunks, e.g. at the end of a stream. """
+        for name in list(self.buffers):
+            self._write_chunk(name, self.buffers.pop(name))
+        self._write_meta()
+
+    def close(self):
+        self.flush()
+
+    def chunk_files(self, i):
+        """ Returns the files of the chunk i of each array, by name. """
+        return {name: _chunk_filename(self.path, name, i, self.meta['compression'])
+                for name in self.meta['arrays']}
+
+    def truncate(self, nchunk):
+        """
+        Drops the chunks from the chunk nchunk on, and the incomplete chunks,
+        e.g. to resume an interrupted stream from its last valid chunk.
+        """
+        self.buffers = {}
+        for name in self.meta['arrays']:
+            del self.meta['arrays'][name]['chunks'][nchunk:]
+        self._write_meta()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def _write_chunk(self, name, data):
+        spec = self.meta['arrays'][name]
+        filename = _chunk_filename(self.path, name, len(spec['chunks']),
+                                   self.meta['compression'])
+        if self.meta['compression'] == 'zlib':
+            f = io.BytesIO()
+            np.save(f, np.ascontiguousarray(data))
+            with open(filename, 'wb') as fz:
+                fz.write(zlib.compress(f.getvalue(), self.meta['level']))
+        else:
+            np.save(filename, np.ascontiguousarray(data))
+        spec['chunks'].append(len(data))
+
+    def _write_meta(self):
+        # written to a temporary file first: the metadata is always complete
+        filename = os.path.join(self.path, 'meta.json')
+        with open(filename + '.tmp', 'w') as f:
+            json.dump(self.meta, f, indent=1, default=_json_default)
+        os.replace(filename + '.tmp', filename)
+
+
+def di_to_xy(all_di_mod, all_di_arg):
+    """
+    Converts the modulus and argument of the differential intensities (dicts
+    of arrays of shape (n,)) to an array of shape (n, 3, 2) along the x and y
+    axes, for the inner, outer and full regions.
+    """
+    mod = np.stack([all_di_mod[r] for r in regions], axis=-1)
+    arg = np.stack([all_di_arg[r] for r in regions], axis=-1)
+    return np.stack([mod*np.cos(arg), mod*np.sin(arg)], axis=-1)
+
+
+def read_meta(path):
+    """ Returns the metadata of a store. """
+    with open(os.path.join(path, 'meta.json')) as f:
+        return json.load(f)
+
+
+class ChunkedArray(object):
+    """
+    Read access to an array of a store written by ChunkedWriter. Only the
+    chunks needed by an indexing (array[i0:i1], array[i]) are read; the
+    uncompressed chunks are memory-mapped.
+
+    Args:
+        path (str):
+            directory of the store
+        name (str):
+            name of the array
+    """
+
+    def __init__(self, path, name):
+        self.path = path
+        self.name = name
+        meta = read_meta(path)
+        spec = meta['arrays'][name]
+        self.compression = meta['compression']
+        self.dtype = np.dtype(spec['dtype'])
+        self.bounds = np.concatenate([[0], np.cumsum(spec['chunks'], dtype=int)])
+        self.shape = (int(self.bounds[-1]),) + tuple(spec['shape'])
+
+    def __len__(self):
+        return self.shape[0]
+
+    def chunk(self, i):
+        """ Returns the chunk i, memory-mapped if not compressed. """
+        filename = _chunk_filename(self.path, self.name, i, self.compression)
+        if self.compression == 'zlib':
+            with open(filename, 'rb') as f:
+                return np.load(io.BytesIO(zlib.decompress(f.read())))
+        return np.load(filename, mmap_mode='r')
+
+    def __getitem__(self, index):
+        if isinstance(index, tuple):
+            if isinstance(index[0], slice):
+                return self[index[0]][(slice(None),) + index[1:]]
+            return self[index[0]][index[1:]]
+        if not isinstance(index, slice):
+            index = int(index)
+            if index < -len(self) or index >= len(self):
+                raise IndexError('index %d is out of bounds for axis 0 with size %d'
+                                 %(index, len(self)))
+            if index < 0:
+                index += len(self)
+            i = np.searchsorted(self.bounds, index, side='right') - 1
+            return self.chunk(i)[index - self.bounds[i]]
+        start, stop, step = index.indices(len(self))
+        if step != 1:
+            # chunks covering the selected rows read in ascending order, then
+            # the step (possibly negative) applied to them
+            rows = range(start, stop, step)
+            if len(rows) == 0:
+                return np.zeros((0,) + self.shape[1:], self.dtype)
+            first, last = min(rows[0], rows[-1]), max(rows[0], rows[-1])
+            return self[first:last + 1][rows[0] - first::step]
+        first = np.searchsorted(self.bounds, start, side='right') - 1
+        last = np.searchsorted(self.bounds, stop, side='left')
+        out = [self.chunk(i)[max(start - self.bounds[i], 0):stop - self.bounds[i]]
+               for i in range(first, last)]
+        if len(out) == 1:
+            return out[0]
+        return np.concatenate(out) if len(out) > 0 else np.zeros((0,) + self.shape[1:], self.dtype)
+
+    def __array__(self, dtype=None, copy=None):
+        return np.asarray(self[:], dtype=dtype)
+
+
+def open_store(path):
+    """
+    Opens a store written by ChunkedWriter.
+
+    Args:
+        path (str):
+            directory of the store
+
+    Returns:
+        arrays (dict of ChunkedArray):
+            arrays of the store, by name
+        params (dict):
+            parameters stored in the metadata
+    """
+    meta = read_meta(path)
+    return {name: ChunkedArray(path, name) for name in meta['arrays']}, meta['params']
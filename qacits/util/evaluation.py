@@ -0,0 +1,175 @@
+import numpy as np
+try:
+    # recursive filters along the time axis, for all runs at once
+    from scipy.signal import lfilter as _lfilter
+except ImportError:
+    _lfilter = None
+
+
+def pointing_error(tt_est, tt_true, sign=1, scale=1.):
+    """
+    Pointing error of the QACITS estimates w.r.t. the true tip-tilt, as in the
+    demo: sign*tt_est - tt_true. Any number of leading dimensions (runs,
+    configurations...) can be given, broadcast against each other.
+
+    Args:
+        tt_est (float ndarray):
+            tip-tilt estimates [lambda/D] of shape (..., nframes, 2), or full
+            estimate output of run_qacits (..., nframes, 11)
+        tt_true (float ndarray):
+            true tip-tilt [lambda/D] of shape (..., nframes, 2)
+        sign (int):
+            sign of the QACITS estimate w.r.t. the true tip-tilt, e.g. -1 for
+            the data cubes of the demo
+        scale (float):
+            unit conversion, e.g. lamD to get the error in mas
+
+    Returns:
+        err (float ndarray):
+            pointing error along x and y, of shape (..., nframes, 2)
+    """
+
+    tt_est = np.asarray(tt_est)[...,0:2]
+    return (sign*tt_est - np.asarray(tt_true))*scale
+
+
+def error_stats(err):
+    """
+    Statistics of the pointing error, computed along the frames for all
+    leading dimensions at once.
+
+    Args:
+        err (float ndarray):
+            pointing error of shape (..., nframes, 2) (see pointing_error)
+
+    Returns:
+        stats (dict):
+            'rms' (RMS of the distance, as in the demo), 'rms_x', 'rms_y'
+            (RMS per axis), 'mean_x', 'mean_y' (bias per axis), 'std_x',
+            'std_y' and 'max' (largest distance), of shape (...)
+    """
+
+    stats = RunningErrorStats()
+    stats.update(err)
+    return stats.result()
+
+
+class RunningErrorStats(object):
+    """
+    Streaming version of error_stats: the pointing errors are given by chunks
+    of frames (update), only their sums are kept.
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.sums = None
+
+    def update(self, err):
+        """
+        Args:
+            err (float ndarray):
+                pointing errors of the next frames, of shape (..., n, 2)
+        """
+        err = np.asarray(err, dtype=float)
+        sums = [np.sum(err, axis=-2), np.sum(err**2, axis=-2),
+                np.max(np.hypot(err[...,0], err[...,1]), axis=-1, initial=0)]
+        if self.sums is None:
+            self.sums = sums
+        else:
+            self.sums = [self.sums[0] + sums[0], self.sums[1] + sums[1],
+                         np.maximum(self.sums[2], sums[2])]
+        self.count += err.shape[-2]
+
+    def result(self):
+        """ Returns the statistics of the frames given so far (see error_stats). """
+        mean = self.sums[0]/self.count
+        ms = self.sums[1]/self.count
+        return {'rms': np.sqrt(np.sum(ms, axis=-1)),
+                'rms_x': np.sqrt(ms[...,0]), 'rms_y': np.sqrt(ms[...,1]),
+                'mean_x': mean[...,0], 'mean_y': mean[...,1],
+                'std_x': np.sqrt(np.maximum(ms[...,0] - mean[...,0]**2, 0)),
+                'std_y': np.sqrt(np.maximum(ms[...,1] - mean[...,1]**2, 0)),
+                'max': self.sums[2]}
+
+
+def error_psd(err, dt=1., nperseg=256):
+    """
+    Temporal power spectral density of the pointing error along x and y
+    (Welch method: Hann windows, half overlapping segments, one-sided),
+    computed for all leading dimensions at once. The integral of the PSD over
+    the frequencies is the variance of the error.
+
+    Args:
+        err (float ndarray):
+            pointing error of shape (..., nframes, 2) (see pointing_error)
+        dt (float):
+            time between two frames [s]
+        nperseg (int):
+            number of frames per segment, at most nframes
+
+    Returns:
+        freq (float ndarray):
+            frequencies [Hz]
+        psd (float ndarray):
+            PSD [unit**2/Hz] of shape (..., nfreq, 2)
+    """
+
+    err = np.asarray(err, dtype=float)
+    nframes = err.shape[-2]
+    nperseg = min(nperseg, nframes)
+    step = max(nperseg//2, 1)
+    starts = np.arange(0, nframes - nperseg + 1, step)
+    window = np.hanning(nperseg + 2)[1:-1]
+    psd = 0
+    for i0 in starts:
+        seg = err[...,i0:i0+nperseg,:]
+        seg = (seg - np.mean(seg, axis=-2, keepdims=True))*window[:,np.newaxis]
+        psd = psd + np.abs(np.fft.rfft(seg, axis=-2))**2
+    psd = psd/len(starts)*dt/np.sum(window**2)
+    # one-sided: the power of the negative frequencies is added
+    psd[...,1:(nperseg + 1)//2,:] *= 2
+    freq = np.fft.rfftfreq(nperseg, dt)
+
+    return freq, psd
+
+
+def loop_residuals(tt_est, tt_true, bandwidth, dt=1., sign=1, scale=1.):
+    """
+    Residual pointing error after a pointing control loop driven by the QACITS
+    estimates: an integrator with a one-frame delay, of the given closed-loop
+    bandwidth (loop gain 2*pi*bandwidth*dt). The correction applied to frame
+    k is the integration of the measurements up to frame k-1, the measurements
+    being the true tip-tilt plus the estimation error (taken from the open
+    loop estimates). Computed for all leading dimensions at once.
+
+    Args:
+        tt_est (float ndarray):
+            tip-tilt estimates [lambda/D] of shape (..., nframes, 2), or full
+            estimate output of run_qacits (..., nframes, 11)
+        tt_true (float ndarray):
+            true (open loop) tip-tilt [lambda/D] of shape (..., nframes, 2)
+        bandwidth (float):
+            closed-loop bandwidth [Hz]
+        dt (float):
+            time between two frames [s]
+        sign, scale:
+            see pointing_error
+
+    Returns:
+        residuals (float ndarray):
+            residual pointing error along x and y, of shape (..., nframes, 2)
+    """
+
+    tt_true = np.asarray(tt_true, dtype=float)
+    # measurement: true tip-tilt + estimation error
+    meas = tt_true + pointing_error(tt_est, tt_true, sign=sign)
+    gain = min(2*np.pi*bandwidth*dt, 1.)
+    # correction: c[k] = (1 - gain)*c[k-1] + gain*meas[k-1]
+    if _lfilter is not None:
+        corr = _lfilter([0., gain], [1., -(1 - gain)], meas, axis=-2)
+    else:
+        corr = np.zeros(meas.shape)
+        for k in range(1, meas.shape[-2]):
+            corr[...,k,:] = (1 - gain)*corr[...,k-1,:] + gain*meas[...,k-1,:]
+
+    return (tt_true - corr)*scale
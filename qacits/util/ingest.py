@@ -0,0 +1,281 @@
+import numpy as np
+import gzip
+import hashlib
+import json
+import os
+
+_BLOCK = 2880
+_BITPIX = {8:'u1', 16:'>i2', 32:'>i4', 64:'>i8', -32:'>f4', -64:'>f8'}
+
+
+def _open(filename):
+    # gzip files are decompressed on the fly, other files are read as is
+    with open(filename, 'rb') as f:
+        magic = f.read(2)
+    if magic == b'\x1f\x8b':
+        return gzip.open(filename, 'rb')
+    return open(filename, 'rb')
+
+
+def _read_header(f, ext=None):
+    """
+    Reads the header of the HDU ext, and skips the data of the previous HDUs.
+    As fits.getdata, ext=None selects the primary HDU, or the first extension
+    with data if the primary HDU has none. Returns the header, the shape of
+    the data and the index of the HDU.
+    """
+    from astropy.io import fits
+    i = 0
+    while True:
+        try:
+            header = fits.Header.fromfile(f, endcard=True, padding=True)
+        except EOFError:
+            raise IndexError('no HDU %s with data'%('' if ext is None else ext))
+        shape = tuple(header['NAXIS%d'%k] for k in range(header['NAXIS'], 0, -1))
+        if i == ext or (ext is None and len(shape) > 0 and np.prod(shape) > 0):
+            return header, shape, i
+        nbytes = int(np.prod(shape))*abs(header['BITPIX'])//8 if shape else 0
+        nbytes += header.get('PCOUNT', 0)
+        f.read(int(np.ceil(nbytes/_BLOCK))*_BLOCK)
+        i += 1
+
+
+def _scaling(header):
+    """ Returns the native output dtype, and the scale and zero of the data. """
+    raw = np.dtype(_BITPIX[header['BITPIX']])
+    bscale = header.get('BSCALE', 1)
+    bzero = header.get('BZERO', 0)
+    if bscale == 1 and bzero == 0:
+        return raw.newbyteorder('='), 1, 0
+    # unsigned integers convention
+    for kind, offset in [('u2', 2**15), ('u4', 2**31), ('u8', 2**63)]:
+        if bscale == 1 and bzero == offset and raw.itemsize == np.dtype(kind).itemsize:
+            return np.dtype(kind), 1, bzero
+    return np.dtype(np.float32 if raw.itemsize <= 2 else np.float64), bscale, bzero
+
+
+def iter_fits_chunks(filename, chunk_size=1000, ext=None):
+    """
+    Reads a (gzip-compressed) FITS cube by chunks of frames, decompressed on
+    the fly: the whole cube is never in memory. The chunks are native-endian,
+    with the BSCALE/BZERO scaling applied.
+
+    Args:
+        filename (str):
+            FITS file, compressed with gzip or not
+        chunk_size (int):
+            number of frames per chunk
+        ext (int, optional):
+            HDU index, defaults to the primary HDU, or to the first extension
+            with data if the primary HDU has none (as fits.getdata)
+
+    Yields:
+        chunk (ndarray):
+            chunk of frames, of dimensions (n, ny, nx)
+    """
+    with _open(filename) as f:
+        header, shape, _ = _read_header(f, ext=ext)
+        raw = np.dtype(_BITPIX[header['BITPIX']])
+        dtype, bscale, bzero = _scaling(header)
+        frame_shape = shape[1:] if len(shape) > 2 else shape
+        nframes = shape[0] if len(shape) > 2 else 1
+        frame_size = int(np.prod(frame_shape))
+        for i0 in range(0, nframes, chunk_size):
+            n = min(chunk_size, nframes - i0)
+            buf = f.read(n*frame_size*raw.itemsize)
+            chunk = np.frombuffer(buf, dtype=raw).reshape((n,) + frame_shape)
+            if bscale == 1 and bzero == 0:
+                yield chunk.astype(dtype)
+            elif dtype.kind == 'u':
+                # unsigned integers: flip the sign bit
+                unsigned = chunk.view(raw.str.replace('i', 'u'))
+                yield (unsigned ^ unsigned.dtype.type(bzero)).astype(dtype)
+            else:
+                yield (chunk*dtype.type(bscale) + dtype.type(bzero)).astype(dtype)
+
+
+def to_native(data, chunk_size=256, out=None):
+    """
+    Returns data as a native-endian, C-contiguous array, so that the numpy
+    kernels (bin_images, get_di_xy, get_psf_flux...) run on their fast paths,
+    without byte swapping or hidden conversion copies. FITS data are
+    big-endian: the conversion is done once, by chunks of frames, so that a
+    memory-mapped cube is never converted as a whole in temporary memory.
+    Arrays already native and contiguous are returned as is.
+
+    Args:
+        data (ndarray):
+            image or cube of frames, e.g. returned by fits.getdata
+        chunk_size (int):
+            number of frames converted at once
+        out (ndarray, optional):
+            output array, e.g. a memory map, of the shape of data and of
+            a native dtype; defaults to a new array
+
+    Returns:
+        data (ndarray):
+            native-endian and C-contiguous data
+    """
+
+    data = np.asanyarray(data)
+    if data.dtype.isnative and data.flags.c_contiguous and out is None:
+        return data
+    if out is None:
+        out = np.empty(data.shape, dtype=data.dtype.newbyteorder('='))
+    if data.ndim < 3:
+        out[...] = data
+        return out
+    for i0 in range(0, len(data), chunk_size):
+        out[i0:i0+chunk_size] = data[i0:i0+chunk_size]
+    return out
+
+
+def getdata(filename, ext=None, cache=False, cache_dir=None, chunk_size=256, verbose=False):
+    """
+    Replacement of fits.getdata returning native-endian, C-contiguous data.
+    Gzip-compressed files, or any file if cache is True, are converted once
+    into a cached native-endian memory map (see cached_getdata); other files
+    are memory-mapped and converted in memory by chunks (see to_native).
+
+    Args:
+        filename (str):
+            FITS file, compressed with gzip or not
+        ext (int, optional):
+            HDU index, defaults to the primary HDU, or to the first extension
+            with data if the primary HDU has none (as fits.getdata)
+        cache (bool):
+            if True, use the cache of cached_getdata for uncompressed files
+            too, e.g. for cubes larger than the memory
+
+    Returns:
+        data (ndarray):
+            native-endian and C-contiguous data
+    """
+
+    from astropy.io import fits
+    with open(filename, 'rb') as f:
+        compressed = (f.read(2) == b'\x1f\x8b')
+    if compressed or cache is True:
+        return cached_getdata(filename, ext=ext, cache_dir=cache_dir,
+                              chunk_size=chunk_size, verbose=verbose)
+    return to_native(fits.getdata(filename, ext=ext, memmap=True), chunk_size=chunk_size)
+
+
+def file_checksum(filename):
+    """ Returns the sha256 checksum of a file. """
+    sha = hashlib.sha256()
+    with open(filename, 'rb') as f:
+        for block in iter(lambda: f.read(2**20), b''):
+            sha.update(block)
+    return sha.hexdigest()
+
+
+def default_cache_dir():
+    """ Cache directory: $QACITS_CACHE, or ~/.cache/qacits. """
+    return os.environ.get('QACITS_CACHE',
+        os.path.join(os.path.expanduser('~'), '.cache', 'qacits'))
+
+
+def cached_getdata(filename, ext=None, cache_dir=None, chunk_size=256, verbose=False):
+    """
+    Replacement of fits.getdata for (gzip-compressed) FITS cubes read in
+    several sessions. The first call decompresses the data once, by chunks,
+    into an uncompressed native-endian .npy cache file; the next calls
+    return a read-only memory map of this cache file, i.e. open instantly.
+
+    The cache files are keyed by the sha256 checksum of the source file. To
+    avoid computing the checksum at each call, the checksum of each source
+    file is kept in an index with the file size and modification time.
+
+    Args:
+        filename (str):
+            FITS file, compressed with gzip or not
+        ext (int, optional):
+            HDU index, defaults to the primary HDU, or to the first extension
+            with data if the primary HDU has none (as fits.getdata)
+        cache_dir (str, optional):
+            cache directory, defaults to $QACITS_CACHE or ~/.cache/qacits
+        chunk_size (int):
+            number of frames decompressed at once
+
+    Returns:
+        data (numpy memmap):
+            read-only data, native-endian
+    """
+
+    if cache_dir is None:
+        cache_dir = default_cache_dir()
+    os.makedirs(cache_dir, exist_ok=True)
+    filename = os.path.abspath(filename)
+    stat = os.stat(filename)
+    index_file = os.path.join(cache_dir, 'index.json')
+    index = {}
+    if os.path.isfile(index_file):
+        with open(index_file) as f:
+            index = json.load(f)
+    entry = index.get(filename)
+    if entry is not None and entry['size'] == stat.st_size and entry['mtime'] == stat.st_mtime:
+        checksum = entry['sha256']
+    else:
+        checksum = file_checksum(filename)
+        index[filename] = dict(size=stat.st_size, mtime=stat.st_mtime, sha256=checksum)
+        with open(index_file + '.tmp', 'w') as f:
+            json.dump(index, f, indent=1)
+        os.replace(index_file + '.tmp', index_file)
+
+    # HDU selected by fits.getdata, so that ext=None and its index share the cache
+    with _open(filename) as f:
+        header, shape, ext = _read_header(f, ext=ext)
+    cache_file = os.path.join(cache_dir, '%s_%d.npy'%(checksum, ext))
+    if not os.path.isfile(cache_file):
+        if verbose is True:
+            print('decompressing %s into %s'%(filename, cache_file))
+        dtype, _, _ = _scaling(header)
+        tmpname = cache_file + '.tmp.npy'
+        data = np.lib.format.open_memmap(tmpname, mode='w+', dtype=dtype, shape=shape)
+        flat = data.reshape((-1,) + shape[-2:]) if len(shape) > 2 else data[np.newaxis]
+        i0 = 0
+        for chunk in iter_fits_chunks(filename, chunk_size=chunk_size, ext=ext):
+            flat[i0:i0+len(chunk)] = chunk.reshape((-1,) + flat.shape[1:])
+            i0 += len(chunk)
+        data.flush()
+        del data, flat
+        os.replace(tmpname, cache_file)
+    elif verbose is True:
+        print('reading %s from the cache %s'%(filename, cache_file))
+
+    return np.load(cache_file, mmap_mode='r')
+
+
+def run_qacits_fits(filename, psf_OFF, img_sampling, chunk_size=1000, ext=None,
+        verbose=False, **qacits_params):
+
+    """
+    Runs QACITS on a (gzip-compressed) FITS cube decompressed on the fly, by
+    chunks of frames, without decompressing the whole cube in memory or on
+    disk.
+
+    Args:
+        filename (str):
+            FITS file of the cube of on-axis PSFs, compressed with gzip or not
+        psf_OFF (float ndarray):
+            off-axis PSF frame
+        img_sampling (float):
+            image sampling in pix per lambda/D
+        chunk_size (int):
+            number of frames per chunk; the binning (nbin) is applied per chunk
+
+    Return:
+        full_estimate_output (float ndarray):
+            full estimate output (see run_qacits)
+    """
+
+    from qacits.run_qacits import run_qacits
+
+    estimates = []
+    for chunk in iter_fits_chunks(filename, chunk_size=chunk_size, ext=ext):
+        estimates.append(run_qacits(chunk, psf_OFF, img_sampling, **qacits_params))
+        if verbose is True:
+            print('%s frames processed'%sum(len(e) for e in estimates))
+
+    return np.concatenate(estimates)
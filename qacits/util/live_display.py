@@ -0,0 +1,225 @@
+import numpy as np
+import time
+
+
+class MinMaxHistory(object):
+    """
+    Decimated history of a time series, kept as the min and max values over
+    bins of samples. When the number of bins exceeds nbins_max, adjacent bins
+    are merged two by two (the bin width doubles), so that appending a sample
+    is O(1) and the decimated history never exceeds nbins_max bins.
+
+    Args:
+        nbins_max (int):
+            maximum number of bins (must be even)
+    """
+
+    def __init__(self, nbins_max=500):
+        self.nbins_max = nbins_max + (nbins_max % 2)
+        self.width = 1
+        self.nbins = 0
+        self.count = 0
+        self.bin_min = np.full(self.nbins_max, np.inf)
+        self.bin_max = np.full(self.nbins_max, -np.inf)
+
+    def append(self, values):
+        """ Appends an array of samples to the history. """
+        values = np.ravel(values)
+        while len(values) > 0:
+            # fill the current bin
+            i = self.count // self.width
+            if i == self.nbins_max:
+                self._merge()
+                continue
+            n = min(self.width*(i + 1) - self.count, len(values))
+            self.bin_min[i] = min(self.bin_min[i], np.min(values[:n]))
+            self.bin_max[i] = max(self.bin_max[i], np.max(values[:n]))
+            self.count += n
+            self.nbins = i + 1
+            values = values[n:]
+
+    def _merge(self):
+        half = self.nbins_max//2
+        self.bin_min[:half] = np.minimum(self.bin_min[0::2], self.bin_min[1::2])
+        self.bin_max[:half] = np.maximum(self.bin_max[0::2], self.bin_max[1::2])
+        self.bin_min[half:] = np.inf
+        self.bin_max[half:] = -np.inf
+        self.width *= 2
+        self.nbins = half
+
+    def get_data(self):
+        """
+        Returns:
+            index (float ndarray):
+                sample index at the center of each bin
+            bin_min, bin_max (float ndarray):
+                min and max values of each bin
+        """
+        nb = self.nbins
+        index = np.arange(nb)*self.width + (self.width - 1)/2
+        index = np.minimum(index, max(self.count - 1, 0))
+        return index, self.bin_min[:nb].copy(), self.bin_max[:nb].copy()
+
+
+class LiveTiptiltDisplay(object):
+    """
+    Live display of the tip-tilt estimates over time, for long sequences.
+
+    Unlike display_tiptilt_sequence, the figure is not redrawn for each new
+    estimate: the static background is rendered once, and only the data
+    artists are redrawn (blitting). The amplitude history is decimated
+    (min/max per bin, see MinMaxHistory) and drawn as a min/max envelope, and
+    the 2D plot only shows the last n_recent estimates, so the cost of a
+    refresh does not depend on the number of accumulated samples. Refreshes
+    are limited to refresh_rate per second.
+
+    With offscreen=True, the figure is rendered with the Agg backend without
+    pyplot, e.g. for headless telemetry snapshots (see snapshot).
+
+    Args:
+        delta_t (float, optional):
+            time between two estimates, the time axis is in frames if None
+        tt_lim (float):
+            limit of the 2D plot [lambda/D]
+        tt_circ_rad (list of float, optional):
+            radii [lambda/D] of the circles drawn on the 2D plot
+        n_recent (int):
+            number of recent estimates shown on the 2D plot
+        nbins_max (int):
+            maximum number of bins of the decimated amplitude history
+        refresh_rate (float):
+            maximum number of refreshes per second
+        offscreen (bool):
+            if True, render off-screen with the Agg backend
+        fig_num (int, optional):
+            matplotlib figure number (not used off-screen)
+    """
+
+    def __init__(self, delta_t=None, tt_lim=1., tt_circ_rad=None, n_recent=200,
+                 nbins_max=500, refresh_rate=10., offscreen=False, fig_num=None):
+
+        from matplotlib.patches import Polygon
+        if offscreen is True:
+            from matplotlib.figure import Figure
+            from matplotlib.backends.backend_agg import FigureCanvasAgg
+            self.fig = Figure(figsize=(9,4))
+            FigureCanvasAgg(self.fig)
+        else:
+            import matplotlib.pyplot as plt
+            self.fig = plt.figure(num=fig_num, figsize=(9,4))
+            self.fig.clf()
+        self.canvas = self.fig.canvas
+        self.delta_t = 1. if delta_t is None else delta_t
+        self.refresh_period = 1./refresh_rate
+        self.last_refresh = -np.inf
+        self.history = MinMaxHistory(nbins_max)
+        self.recent = np.zeros((n_recent, 2))
+        self.n_tt = 0
+
+        self.fig.suptitle('Tip-tilt estimates over time')
+        self.ax = self.fig.subplots(nrows=1, ncols=2)
+
+        ### LEFT PLOT: 2D tip-tilt estimates
+        ax = self.ax[0]
+        ax.set_aspect('equal')
+        ax.axis([-tt_lim, tt_lim, -tt_lim, tt_lim])
+        ticks = np.linspace(-tt_lim, tt_lim, 11)
+        ax.set_xticks(ticks)
+        ax.set_yticks(ticks)
+        ax.vlines(0., -tt_lim, tt_lim, color='.65', linestyle='--')
+        ax.hlines(0., -tt_lim, tt_lim, color='.65', linestyle='--')
+        ax.set_xlabel(r'$\lambda/D$')
+        ax.set_ylabel(r'$\lambda/D$')
+        if tt_circ_rad is not None:
+            for r in tt_circ_rad:
+                thet = np.linspace(0., 2*np.pi)
+                ax.plot(r*np.cos(thet),r*np.sin(thet), ':', color='.8')
+        self.line_2d, = ax.plot([], [], 'co', alpha=.5, markersize=3, animated=True)
+
+        ### RIGHT PLOT: tip-tilt amplitude as a function of time ###
+        ax = self.ax[1]
+        ax.set_xlabel('# frames' if delta_t is None else 'Time')
+        ax.set_ylabel(r'Tip-tilt amplitude [$\lambda/D$]')
+        ax.grid(color='.8', linestyle='--')
+        ax.set_xlim(0, 100*self.delta_t)
+        ax.set_ylim(0, .1)
+        self.patch_mod = Polygon(np.zeros((0,2)), closed=True, color='c', alpha=.7, 
+                                 animated=True)
+        ax.add_patch(self.patch_mod)
+
+        self.background = None
+
+    def _draw_background(self):
+        self.canvas.draw()
+        self.background = self.canvas.copy_from_bbox(self.fig.bbox)
+
+    def update(self, tt_xy, force=False):
+        """
+        Appends new tip-tilt estimates and refreshes the display if the last
+        refresh is older than the refresh period.
+
+        Args:
+            tt_xy (2D float ndarray):
+                new x and y tip-tilt estimates, of dimensions (n_tt, 2)
+            force (bool):
+                if True, refresh the display regardless of the refresh rate
+        """
+        tt_xy = np.array(tt_xy, ndmin=2)[:,0:2]
+        n = len(tt_xy)
+        if n > 0:
+            self.history.append(np.sqrt(np.sum(tt_xy**2, axis=1)))
+            n_recent = len(self.recent)
+            self.recent = np.roll(self.recent, -min(n, n_recent), axis=0)
+            self.recent[-min(n, n_recent):] = tt_xy[-n_recent:]
+            self.n_tt += n
+        now = time.perf_counter()
+        if force is True or (now - self.last_refresh) >= self.refresh_period:
+            self.refresh()
+            self.last_refresh = now
+
+    def refresh(self):
+        """ Redraws the data artists over the stored background. """
+        index, bin_min, bin_max = self.history.get_data()
+        time_axis = index*self.delta_t
+        # the background is rendered again only when the axes must be extended
+        ax = self.ax[1]
+        xmax = ax.get_xlim()[1]
+        ymax = ax.get_ylim()[1]
+        if len(index) > 0 and (time_axis[-1] > xmax or np.max(bin_max) > ymax):
+            while time_axis[-1] > xmax:
+                xmax *= 2
+            ax.set_xlim(0, xmax)
+            ax.set_ylim(0, max(ymax, np.ceil(np.max(bin_max)*1.2*10.)/10.))
+            self.background = None
+        if self.background is None:
+            self._draw_background()
+
+        n_recent = min(self.n_tt, len(self.recent))
+        self.line_2d.set_data(self.recent[len(self.recent)-n_recent:,0],
+                              self.recent[len(self.recent)-n_recent:,1])
+        self.patch_mod.set_xy(np.concatenate([np.stack([time_axis, bin_max], axis=1),
+                                              np.stack([time_axis, bin_min], axis=1)[::-1]]))
+        self.canvas.restore_region(self.background)
+        self.ax[0].draw_artist(self.line_2d)
+        self.ax[1].draw_artist(self.patch_mod)
+        self.canvas.blit(self.fig.bbox)
+        self.canvas.flush_events()
+
+    def snapshot(self, filename=None):
+        """
+        Renders the current state of the display, e.g. for headless telemetry.
+
+        Args:
+            filename (str, optional):
+                if given, the snapshot is saved in this file
+
+        Returns:
+            img (uint8 ndarray):
+                RGBA image of the display, of dimensions (ny, nx, 4)
+        """
+        self.refresh()
+        img = np.array(self.canvas.buffer_rgba())
+        if filename is not None:
+            import matplotlib.image
+            matplotlib.image.imsave(filename, img)
+        return img
@@ -1,4 +1,9 @@
+from qacits.util.bin_images import bin_images
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 import numpy as np
+import hashlib
+import threading
 try:
     # import photutils
     from photutils import aperture
@@ -6,7 +11,19 @@ try:
 except:
     _exact_default_ = False
 
-def get_psf_flux(img, radius, cx=None, cy=None, exact=_exact_default_, verbose=False):
+
+def resolve_exact(exact=None):
+    """ 
+    Photometry path of a call: exact if photutils is available, when exact is 
+    None. The choice is made per call, and never stored in the module.
+    """
+    if exact is None:
+        return _exact_default_
+    assert exact is False or _exact_default_, 'the exact photometry requires photutils'
+    return exact
+
+
+def get_psf_flux(img, radius, cx=None, cy=None, exact=None, verbose=False):
     """ 
     Computes the aperture photometry of the PSF core for a given radius
     generally corresponding to half the FWHM. Based on photometry routines 
@@ -23,6 +40,7 @@ def get_psf_flux(img, radius, cx=None, cy=None, exact=_exact_default_, verbose=F
             flux in the PSF core
     """
 
+    exact = resolve_exact(exact)
     ny, nx = img.shape
     if cx == None :
         cx = (nx - 1)/2
@@ -43,7 +61,7 @@ def get_psf_flux(img, radius, cx=None, cy=None, exact=_exact_default_, verbose=F
     return psf_flux
 
 
-def get_di_xy(cube, radius, cx=None, cy=None, exact=_exact_default_):
+def get_di_xy(cube, radius, cx=None, cy=None, exact=None):
     """ 
     Computes the differential intensities along the x and y axes. Based on 
     photometry routines from the photutils package (if available).
@@ -64,7 +82,10 @@ def get_di_xy(cube, radius, cx=None, cy=None, exact=_exact_default_):
             x and y axes
     """
 
-    cube = np.array(cube, ndmin=3)
+    exact = resolve_exact(exact)
+    cube = np.asarray(cube)
+    if cube.ndim == 2:
+        cube = cube[np.newaxis]
     ncube, ny, nx = cube.shape
     if cx == None :
         cx = (nx - 1)/2
@@ -76,16 +97,11 @@ def get_di_xy(cube, radius, cx=None, cy=None, exact=_exact_default_):
         di_xy = np.zeros((ncube, 2))
 
     elif exact is False:
-        x, y = np.meshgrid(np.arange(nx)-cx, np.arange(ny)-cy)
-        r = np.abs(x + 1j*y)
-        for img in cube:
-            img_mask = img*(r <= radius)
-            Sxy = np.sum(img_mask)
-            Sx = np.cumsum(np.sum(img_mask, axis=0))
-            Sy = np.cumsum(np.sum(img_mask, axis=1))
-            Ix = Sxy - 2*np.interp(cx, np.arange(nx)+.5, Sx)
-            Iy = Sxy - 2*np.interp(cy, np.arange(ny)+.5, Sy)
-            di_xy.append([Ix, Iy])
+        # one batched reduction over the stacked frames (no per-frame loop),
+        # the masked sums, cumsums and interpolations being folded into the
+        # pixel weights
+        weights = get_di_weights((ny, nx), radius, cx=cx, cy=cy, exact=False)
+        di_xy = np.tensordot(cube, weights, axes=([1,2], [1,2]))
     else:
         aper = aperture.CircularAperture((cx, cy), radius)
         y, x = np.indices((ny,nx))
@@ -108,19 +124,433 @@ def get_di_xy(cube, radius, cx=None, cy=None, exact=_exact_default_):
     return np.float32(di_xy)
 
 
-def get_all_di(cube, radii, img_sampling, ratio=0, cx=None, cy=None, exact=_exact_default_):
+def get_di_weights(shape, radius, cx=None, cy=None, exact=None):
+    """ 
+    Computes the pixel weights such that the differential intensities along the 
+    x and y axes are the dot product of an image with these weights. This gives 
+    the same result as get_di_xy, but the geometry is computed only once and 
+    can be evaluated for several (sub-pixel) centers at the same time.
+
+    Args:
+        shape (tuple of int):
+            image shape (ny, nx)
+        radius (float):
+            radius [pix] of the region of interest (full, inner, or outer area)
+        cx (float or float ndarray, optional):
+            x position(s) of the sub-image center [pix], defaults to the image center
+        cy (float or float ndarray, optional):
+            y position(s) of the sub-image center [pix], defaults to the image center
+
+    Returns:
+        weights (float ndarray):
+            weights of shape (..., 2, ny, nx), the leading dimensions being 
+            those of the broadcast cx and cy
+    """
+
+    exact = resolve_exact(exact)
+    ny, nx = shape
+    if cx is None :
+        cx = (nx - 1)/2
+    if cy is None :
+        cy = (ny - 1)/2
+    cx, cy = np.broadcast_arrays(np.asarray(cx, dtype=float), np.asarray(cy, dtype=float))
+    weights = np.zeros(cx.shape + (2, ny, nx))
+    if radius == 0:
+        return weights
+
+    x = np.arange(nx)
+    y = np.arange(ny)
+    if exact is False:
+        dx = x - cx[...,np.newaxis]
+        dy = y - cy[...,np.newaxis]
+        mask = np.hypot(dx[...,np.newaxis,:], dy[...,:,np.newaxis]) <= radius
+        # fraction of each column (row) below the center, as in np.interp
+        wx = np.clip(cx[...,np.newaxis] + .5 - x, 0, 1)
+        wy = np.clip(cy[...,np.newaxis] + .5 - y, 0, 1)
+        wx[...,0] = 1
+        wy[...,0] = 1
+        weights[...,0,:,:] = mask*(1 - 2*wx)[...,np.newaxis,:]
+        weights[...,1,:,:] = mask*(1 - 2*wy)[...,:,np.newaxis]
+    else:
+        for i in np.ndindex(cx.shape):
+            aper = aperture.CircularAperture((cx[i], cy[i]), radius)
+            frac = aper.to_mask(method='exact').to_image((ny, nx))
+            for k, (c, n, u) in enumerate([(cx[i], nx, x), (cy[i], ny, y)]):
+                c1 = np.floor(c) - 1
+                # linear interpolation weights between the three partial sums
+                if c <= c1 + 1.5:
+                    t = c - (c1 + .5)
+                    w = (1 - t)*(u <= c1) + t*(u <= c1 + 1)
+                else:
+                    t = (c - (c1 + 1.5))/(n - (c1 + 1.5))
+                    w = (1 - t)*(u <= c1 + 1) + t
+                w = 1 - 2*w
+                weights[i+(k,)] = frac*(w[np.newaxis,:] if k == 0 else w[:,np.newaxis])
+
+    return weights
+
+
+def get_all_di_weights(shape, radii, img_sampling, ratio=0, cx=None, cy=None, 
+        exact=None):
+    """ 
+    Computes the pixel weights of the differential intensities for all regions 
+    (inner, outer, and full area), including the debiasing of the full area 
+    from the linear component estimated on the outer area.
+
+    Args:
+        shape (tuple of int):
+            image shape (ny, nx)
+        radii (dict):
+            dictionary containing the radii in lambda/D for each region of interest 
+        img_sampling (float):
+            image sampling in pix per lambda/D
+
+    Returns:
+        weights (float ndarray):
+            weights of shape (3, 2, ny, nx) for the inner, outer, and full 
+            regions, along the x and y axes
+    """
+
+    weights = {}
+    for region in ['inner', 'outer', 'full']:
+        r0, r1 = radii[region]
+        weights[region] = (get_di_weights(shape, r1*img_sampling, cx=cx, cy=cy, exact=exact) - 
+                           get_di_weights(shape, r0*img_sampling, cx=cx, cy=cy, exact=exact))
+    weights['full'] += ratio*weights['outer']
+
+    return np.array([weights[region] for region in ['inner', 'outer', 'full']])
+
+
+# cache of the geometry of get_all_di_xy, shared by all threads
+_geometry_cache = OrderedDict()
+_geometry_lock = threading.Lock()
+_geometry_cache_size = 16
+
+
+def get_geometry(shape, radii, img_sampling, nbatch=1, ratio=0, cx=None, cy=None,
+        exact=None, bad_pixels=None):
+    """ 
+    Returns the weights of all regions (see get_all_di_weights), with the bad 
+    pixels folded in, cropped to the area where they are not null, for nbatch 
+    cubes. The last geometries are cached: a stream of cubes with the same 
+    geometry computes it only once. The cache is shared by all threads: the 
+    lock only protects its lookup and update, the weights being computed 
+    outside of it, and the returned weights are read-only.
+
+    Args:
+        shape (tuple of int):
+            image shape (ny, nx)
+        radii (dict):
+            dictionary containing the radii in lambda/D for each region of interest 
+        img_sampling (float or float ndarray):
+            image sampling in pix per lambda/D, one value per cube for a batch
+        nbatch (int):
+            number of cubes of the batch
+
+    Returns:
+        weights (float ndarray):
+            read-only weights of shape (nbatch, npix, 6), npix being the number 
+            of pixels of the cropped area
+        sub_y, sub_x (slice):
+            cropped area
+    """
+
+    exact = resolve_exact(exact)
+    img_sampling = np.broadcast_to(img_sampling, nbatch)
+    cx = np.broadcast_to(np.array(cx, dtype=object), nbatch)
+    cy = np.broadcast_to(np.array(cy, dtype=object), nbatch)
+    bpm_key = None
+    if bad_pixels is not None:
+        bad_pixels = np.asarray(bad_pixels, dtype=bool)
+        bpm_key = hashlib.sha1(np.packbits(bad_pixels).tobytes()).hexdigest()
+    key = (tuple(shape), tuple((region, tuple(radii[region])) for region in sorted(radii)),
+           tuple(img_sampling.tolist()), tuple(np.ravel(ratio).tolist()),
+           tuple(cx.tolist()), tuple(cy.tolist()), exact, bpm_key)
+
+    with _geometry_lock:
+        if key in _geometry_cache:
+            _geometry_cache.move_to_end(key)
+            return _geometry_cache[key]
+
+    # computed outside the lock, so that other geometries are not blocked
+    weights = np.array([get_all_di_weights(shape, radii, img_sampling[b], 
+        ratio=ratio, cx=cx[b], cy=cy[b], exact=exact) for b in range(nbatch)])
+    if bad_pixels is not None:
+        weights = fold_bad_pixels(weights, bad_pixels)
+    # crop to the area where the weights are not null
+    ind_y = np.where(np.any(weights != 0, axis=(0,1,2,4)))[0]
+    ind_x = np.where(np.any(weights != 0, axis=(0,1,2,3)))[0]
+    if len(ind_x) == 0:
+        ind_y = ind_x = np.array([0])
+    sub_y = slice(ind_y[0], ind_y[-1] + 1)
+    sub_x = slice(ind_x[0], ind_x[-1] + 1)
+    weights = weights[..., sub_y, sub_x].reshape(nbatch, 6, -1).transpose(0,2,1)
+    weights = np.ascontiguousarray(weights)
+    weights.flags.writeable = False
+
+    with _geometry_lock:
+        # another thread may have inserted the same geometry meanwhile: the 
+        # first one is kept, so that all threads share the same weights
+        geometry = _geometry_cache.setdefault(key, (weights, sub_y, sub_x))
+        _geometry_cache.move_to_end(key)
+        if len(_geometry_cache) > _geometry_cache_size:
+            _geometry_cache.popitem(last=False)
+
+    return geometry
+
+
+def fold_bad_pixels(weights, bad_pixels):
+    """ 
+    Folds the correction of bad pixels into the pixel weights: each bad pixel 
+    is replaced by the mean of its valid (not bad) 4-connected neighbours, so 
+    its weight is shared between these neighbours. The dot product of the 
+    folded weights with a raw image is the one of the original weights with 
+    the corrected image.
+
+    Args:
+        weights (float ndarray):
+            pixel weights of shape (..., ny, nx)
+        bad_pixels (bool ndarray):
+            bad pixel map of shape (ny, nx), True for bad pixels
+
+    Returns:
+        weights (float ndarray):
+            folded pixel weights, null for the bad pixels
+    """
+
+    bad = np.asarray(bad_pixels, dtype=bool)
+    ny, nx = bad.shape
+    weights = np.array(weights, dtype=float)
+    # only the bad pixels in the regions of interest matter
+    used = np.any(weights != 0, axis=tuple(range(weights.ndim - 2)))
+    for y, x in zip(*np.nonzero(bad & used)):
+        neighbours = [(y + dy, x + dx) for dy, dx in [(-1,0), (1,0), (0,-1), (0,1)]
+                      if 0 <= y + dy < ny and 0 <= x + dx < nx and not bad[y + dy, x + dx]]
+        for yn, xn in neighbours:
+            weights[..., yn, xn] += weights[..., y, x]/len(neighbours)
+        weights[..., y, x] = 0
+
+    return weights
+
+
+def get_all_di_xy(cube, radii, img_sampling, ratio=0, cx=None, cy=None, 
+        exact=None, dark=None, background=None, bad_pixels=None, 
+        saturation_level=None, saturation_mode='clip', chunk_size=1024, workers=1):
+    """ 
+    Computes the differential intensities for all regions (full, inner, or outer 
+    area) along the x and y axes, as the dot product of the frames with the 
+    region weights (see get_all_di_weights). The weights are cached and shared 
+    between calls and threads (see get_geometry).
+
+    The frames are reduced by chunks of chunk_size frames, restricted to the 
+    area where the weights are not null. The pre-processing is fused with this 
+    reduction, so that each raw pixel is read only once and no cube-sized mask 
+    or copy is created: 
+
+    - the bad pixels correction is folded into the weights (see fold_bad_pixels),
+    - the dark and background are subtracted as differential intensity offsets, 
+      computed once,
+    - saturated pixels (raw values above saturation_level) are handled chunk 
+      by chunk.
+
+    Integer frames are converted to float chunk by chunk only: 8 and 16-bit 
+    frames are reduced in float32 (exact for these values), wider integers in 
+    float64.
+
+    The cube can be a lazy array larger than the memory: any array exposing 
+    shape, dtype and slicing (memory map, h5py or zarr dataset, ChunkedArray) 
+    is read chunk by chunk, and the blocks of frames of a dask array are 
+    reduced independently and in parallel by the dask scheduler. Only the 
+    differential intensities of the frames are kept in memory.
+
+    Args:
+        cube (float or int ndarray):
+            single image, image cube of ncube frames, or batch of nbatch cubes;
+            raw integer frames (e.g. uint16) are not converted as a whole
+        radii (dict):
+            dictionary containing the radii in lambda/D for each region of interest 
+        img_sampling (float or float ndarray):
+            image sampling in pix per lambda/D, one value per cube for a batch
+        dark (float ndarray, optional):
+            dark frame, or one frame per cube of the batch
+        background (float or float ndarray, optional):
+            background level or frame, or one per cube of the batch
+        bad_pixels (bool ndarray, optional):
+            bad pixel map, True for bad pixels
+        saturation_level (float, optional):
+            raw pixel value above which pixels are saturated, in the units of cube
+        saturation_mode (str):
+            'clip' to replace saturated pixels by saturation_level, or 'mask' 
+            to exclude them from the differential intensities
+        chunk_size (int):
+            number of frames reduced at once
+        workers (int):
+            number of threads reducing the chunks concurrently; the frames are 
+            split into workers chunks at least
+
+    Returns:
+        all_di_xy (float ndarray):
+            differential intensities of shape (..., ncube, 3, 2) for the inner, 
+            outer, and full regions, along the x and y axes
+        n_sat (int ndarray):
+            number of saturated pixels per frame in the area of the regions 
+            (bad pixels excluded), of shape (..., ncube)
+    """
+
+    assert saturation_mode in ['clip', 'mask'], "saturation_mode must be 'clip' or 'mask'"
+    if _is_dask(cube):
+        return _get_all_di_xy_dask(cube, radii, img_sampling, ratio=ratio, cx=cx, cy=cy,
+            exact=exact, dark=dark, background=background, bad_pixels=bad_pixels,
+            saturation_level=saturation_level, saturation_mode=saturation_mode,
+            chunk_size=chunk_size)
+    # lazy arrays (memory maps, h5py or zarr datasets, ChunkedArray...) are
+    # only read chunk by chunk
+    if not hasattr(cube, 'shape') or not hasattr(cube, 'dtype'):
+        cube = np.asarray(cube)
+    if len(cube.shape) == 2:
+        cube = np.asarray(cube)[np.newaxis]
+    batch = (len(cube.shape) == 4)
+    if batch is True:
+        nbatch, ncube, ny, nx = cube.shape
+    else:
+        nbatch = 1
+        ncube, ny, nx = cube.shape
+
+    # geometry, computed once per cube of the batch, and shared between calls
+    weights, sub_y, sub_x = get_geometry((ny, nx), radii, img_sampling, nbatch=nbatch,
+        ratio=ratio, cx=cx, cy=cy, exact=exact, bad_pixels=bad_pixels)
+
+    # dark + background level of each pixel, and its differential intensities
+    level = np.zeros((nbatch, ny, nx))
+    for frame in [dark, background]:
+        if frame is not None:
+            # one level per cube of the batch
+            if np.ndim(frame) == 1:
+                frame = np.reshape(frame, (-1, 1, 1))
+            level += frame
+    level = level[:, sub_y, sub_x].reshape(nbatch, 1, -1)
+    offset = np.matmul(level, weights)
+    if bad_pixels is not None:
+        good = ~np.asarray(bad_pixels, dtype=bool)[sub_y, sub_x].ravel()
+    # raw integer frames are converted chunk by chunk: up to 16 bits, the
+    # values are exact in float32, and the sums are accumulated in float32
+    dtype = np.dtype(cube.dtype)
+    if dtype.kind in 'biu':
+        acc = np.float32 if dtype.itemsize <= 2 else np.float64
+        weights = weights.astype(acc)
+        level = level.astype(acc)
+    else:
+        acc = None
+
+    # one batched matrix product per chunk for all regions, axes, and cubes;
+    # each chunk writes its own frames only, and each thread gets a chunk at least
+    if workers > 1:
+        chunk_size = max(min(chunk_size, int(np.ceil(ncube/workers))), 1)
+    all_di_xy = np.zeros((nbatch, ncube, 6))
+    n_sat = np.zeros((nbatch, ncube), dtype=int)
+
+    def reduce_chunk(i0):
+        if batch is True:
+            chunk = np.asarray(cube[:, i0:i0+chunk_size, sub_y, sub_x])
+        else:
+            chunk = np.asarray(cube[i0:i0+chunk_size, sub_y, sub_x])[np.newaxis]
+        chunk = chunk.reshape(nbatch, chunk.shape[1], -1)
+        if acc is not None:
+            chunk = chunk.astype(acc)
+        if saturation_level is not None:
+            sat = (chunk > saturation_level)
+            if bad_pixels is not None:
+                sat &= good
+            n_sat[:, i0:i0+chunk_size] = np.sum(sat, axis=-1)
+            if saturation_mode == 'clip':
+                chunk = np.where(sat, saturation_level, chunk)
+            else:
+                # null after dark and background subtraction
+                chunk = np.where(sat, level, chunk)
+        all_di_xy[:, i0:i0+chunk_size] = np.matmul(chunk, weights) - offset
+
+    if workers > 1:
+        # the numpy operations of the chunks release the GIL
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            list(pool.map(reduce_chunk, range(0, ncube, chunk_size)))
+    else:
+        for i0 in range(0, ncube, chunk_size):
+            reduce_chunk(i0)
+    all_di_xy = all_di_xy.reshape(nbatch, ncube, 3, 2)
+    if batch is False:
+        all_di_xy = all_di_xy[0]
+        n_sat = n_sat[0]
+
+    return all_di_xy, n_sat
+
+
+def _is_dask(cube):
+    return type(cube).__module__.split('.')[0] == 'dask'
+
+
+def _get_all_di_xy_dask(cube, radii, img_sampling, **di_params):
+    # each block of frames of a dask array is reduced independently to its
+    # differential intensities (with the number of saturated pixels), in
+    # parallel by the dask scheduler; only these small tables are combined
+    if cube.ndim == 2:
+        cube = cube[np.newaxis]
+    ndim = cube.ndim
+    # the frames are split along the frame axis only
+    cube = cube.rechunk({k: -1 for k in range(ndim) if k != ndim - 3})
+
+    def reduce_block(block):
+        di_xy, n_sat = get_all_di_xy(block, radii, img_sampling, **di_params)
+        return np.concatenate([di_xy.reshape(di_xy.shape[:-2] + (6,)),
+                               n_sat[...,np.newaxis]], axis=-1)
+
+    table = cube.map_blocks(reduce_block, dtype=float, drop_axis=ndim-1,
+                            chunks=cube.chunks[:-2] + ((7,),)).compute()
+
+    return table[...,:6].reshape(table.shape[:-1] + (3, 2)), table[...,6].astype(int)
+
+
+def get_di_mod_arg(all_di_xy):
+    """ 
+    Converts the differential intensities of shape (..., 3, 2) along the x and 
+    y axes to modulus and argument, for each region of interest.
+    """
+
+    all_di_mod = {}
+    all_di_arg = {}
+    for i, region in enumerate(['inner', 'outer', 'full']):
+        all_di_mod[region] = np.sqrt(all_di_xy[...,i,0]**2 + all_di_xy[...,i,1]**2)
+        all_di_arg[region] = np.arctan2(all_di_xy[...,i,1], all_di_xy[...,i,0])
+
+    return all_di_mod, all_di_arg
+
+
+def get_all_di(cube, radii, img_sampling, ratio=0, cx=None, cy=None, exact=None,
+        dark=None, background=None, bad_pixels=None, saturation_level=None, 
+        saturation_mode='clip', full_output=False):
     """ 
     Computes the differential intensities for all regions (full, inner, or outer 
     area) along the x and y axes, then converts the outputs to modulus and argument.
     Based on photometry routines from the photutils package (if available).
 
+    A batch of cubes can be given as a 4D array, with one image sampling and 
+    center per cube: the differential intensities are then computed for the 
+    whole batch at once.
+
     Args:
         cube (float ndarray):
-            single image or image cube of ncube frames
+            single image, image cube of ncube frames, or batch of nbatch cubes
         radii (dict):
             dictionary containing the radii in lambda/D for each region of interest 
-        img_sampling (float):
-            image sampling in pix per lambda/D
+        img_sampling (float or float ndarray):
+            image sampling in pix per lambda/D, one value per cube for a batch
+        dark, background, bad_pixels (optional):
+            pre-processing of the frames (see get_all_di_xy)
+        saturation_level (float, optional):
+            pixel value above which pixels are saturated (see get_all_di_xy)
+        saturation_mode (str):
+            'clip' or 'mask' the saturated pixels
+        full_output (bool):
+            if True, also return the number of saturated pixels per frame
 
     Returns:
         all_di_mod (dict):
@@ -129,24 +559,119 @@ def get_all_di(cube, radii, img_sampling, ratio=0, cx=None, cy=None, exact=_exac
         all_di_arg (dict):
             dictionary containing the argument of the differential intensities
             for each region of interest 
+        n_sat (int ndarray):
+            number of saturated pixels per frame, if full_output is True
     """
 
-    all_dixy = {}
-    for region in ['inner', 'outer', 'full']:
-        r0, r1 = radii[region]
-        all_dixy0 = get_di_xy(cube, r0*img_sampling, cx=cx, cy=cy)
-        all_dixy1 = get_di_xy(cube, r1*img_sampling, cx=cx, cy=cy)
-        all_dixy[region] = all_dixy1 - all_dixy0
+    all_di_xy, n_sat = get_all_di_xy(cube, radii, img_sampling, ratio=ratio, cx=cx, 
+        cy=cy, exact=exact, dark=dark, background=background, bad_pixels=bad_pixels, 
+        saturation_level=saturation_level, saturation_mode=saturation_mode)
+
+    # Transform to mod-arg (modulus-argument)
+    all_di_mod, all_di_arg = get_di_mod_arg(all_di_xy)
+
+    if full_output is True:
+        return all_di_mod, all_di_arg, n_sat
+    else:
+        return all_di_mod, all_di_arg
+
+
+def get_cube_di(psf_ON, psf_OFF, img_sampling, radii, nbin=0, ratio=0, cx=None, cy=None,
+        exact=None, dark=None, background=None, bad_pixels=None, 
+        saturation_level=None, saturation_mode='clip', xy=False, chunk_size=1024, 
+        workers=1, full_output=False, verbose=False):
+    """ 
+    Computes the differential intensities for all regions of a cube of on-axis 
+    PSFs, binned and normalized by the flux of the off-axis PSF. A batch of 
+    cubes can be given as a 4D array, with one off-axis PSF frame, image 
+    sampling and center per cube (or the same for all cubes).
+
+    The differential intensities are linear in the images, so the binning and 
+    the normalization are applied to the differential intensities of the 
+    frames: psf_ON is neither copied nor modified. The optional pre-processing 
+    of the raw frames (dark, background, bad pixels and saturation) is fused 
+    with the reduction of the frames (see get_all_di_xy), and applies to 
+    psf_ON only: psf_OFF must be already reduced.
+
+    Args:
+        psf_ON (float ndarray):
+            cube of on-axis PSFs, or batch of nbatch cubes
+        psf_OFF (float ndarray):
+            off-axis PSF frame, or one frame per cube of the batch
+        img_sampling (float or float ndarray):
+            image sampling in pix per lambda/D, one value per cube for a batch
+        radii (dict):
+            dictionary containing the radii in lambda/D for each region of interest 
+        nbin (int):
+            number of binned images per cube (see bin_images)
+        dark (float ndarray, optional):
+            dark frame of psf_ON, or one frame per cube of the batch
+        background (float or float ndarray, optional):
+            background level or frame of psf_ON, or one per cube of the batch
+        bad_pixels (bool ndarray, optional):
+            bad pixel map, True for bad pixels
+        saturation_level (float, optional):
+            raw pixel value of psf_ON above which pixels are saturated
+        saturation_mode (str):
+            'clip' or 'mask' the saturated pixels
+        xy (bool):
+            if True, return the differential intensities along the x and y 
+            axes, of shape (..., nframes, 3, 2), instead of all_di_mod and 
+            all_di_arg
+        chunk_size, workers (int):
+            number of frames reduced at once, and number of threads reducing 
+            them (see get_all_di_xy)
+        full_output (bool):
+            if True, also return the number of saturated pixels per frame
+
+    Returns:
+        all_di_mod (dict):
+            dictionary containing the modulus of the differential intensities
+            for each region of interest 
+        all_di_arg (dict):
+            dictionary containing the argument of the differential intensities
+            for each region of interest 
+        n_sat (int ndarray):
+            number of saturated pixels per (unbinned) frame, if full_output 
+            is True
+    """
+
+    # compute the differential intensities in the 3 regions, for each frame
+    # (lazy arrays are reduced chunk by chunk, see get_all_di_xy)
+    if not hasattr(psf_ON, 'shape'):
+        psf_ON = np.asarray(psf_ON)
+    all_di_xy, n_sat = get_all_di_xy(psf_ON, radii, img_sampling, ratio=ratio, 
+        cx=cx, cy=cy, exact=exact, dark=dark, background=background, 
+        bad_pixels=bad_pixels, saturation_level=saturation_level, 
+        saturation_mode=saturation_mode, chunk_size=chunk_size, workers=workers)
+    if verbose is True and saturation_level is not None:
+        print('saturated pixels: %s in %s frames'%(np.sum(n_sat), np.sum(n_sat > 0)))
+
+    if len(psf_ON.shape) == 4:
+        # batch of cubes: binning along the frame axis of each cube
+        nbatch = psf_ON.shape[0]
+        psf_OFF = np.broadcast_to(psf_OFF, (nbatch,) + np.shape(psf_OFF)[-2:])
+        sampling = np.broadcast_to(img_sampling, nbatch)
+        cxb = np.broadcast_to(np.array(cx, dtype=object), nbatch)
+        cyb = np.broadcast_to(np.array(cy, dtype=object), nbatch)
+        psf_flux = np.array([get_psf_flux(psf_OFF[b], sampling[b]/2, cx=cxb[b], cy=cyb[b], 
+                             exact=exact, verbose=verbose) for b in range(nbatch)])
+        all_di_xy = np.moveaxis(bin_images(np.moveaxis(all_di_xy, 1, 0), nbin), 0, 1)
+        all_di_xy /= psf_flux[:,np.newaxis,np.newaxis,np.newaxis]
+    else:
+        # get flux from off-axis PSF frame (photutils aperture photometry)
+        psf_flux = get_psf_flux(psf_OFF, img_sampling/2, cx=cx, cy=cy, exact=exact, verbose=verbose)
+        # bin + normalize the differential intensities
+        all_di_xy = bin_images(all_di_xy, nbin)
+        all_di_xy /= psf_flux
 
-    #-- Debias the diff. int. computed on full area from the linear component
-    #   (estimated from the outer area)
-    all_dixy['full'] += (ratio * all_dixy['outer'])
+    if xy is True:
+        return (all_di_xy, n_sat) if full_output is True else all_di_xy
 
     # Transform to mod-arg (modulus-argument)
-    all_di_mod = {}
-    all_di_arg = {}
-    for region in ['inner', 'outer', 'full']:
-        all_di_mod[region] = np.sqrt(all_dixy[region][:,0]**2 + all_dixy[region][:,1]**2)
-        all_di_arg[region] = np.arctan2(all_dixy[region][:,1], all_dixy[region][:,0])
+    all_di_mod, all_di_arg = get_di_mod_arg(all_di_xy)
 
-    return all_di_mod, all_di_arg
\ No newline at end of file
+    if full_output is True:
+        return all_di_mod, all_di_arg, n_sat
+    else:
+        return all_di_mod, all_di_arg
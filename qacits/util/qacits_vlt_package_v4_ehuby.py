@@ -26,17 +26,13 @@ import numpy as np
 import matplotlib.pyplot as plt
 from skimage.transform import warp
 from scipy.optimize import curve_fit
-from scipy.optimize import OptimizeWarning
 from scipy.stats import linregress
 from configobj import ConfigObj
 try:
+    # only needed by get_delta_i_exact (exact=True)
     import photutils
-    _exact_default_ = True
-except:
-    _exact_default_ = False
-
-import warnings
-warnings.simplefilter("error", OptimizeWarning)
+except ImportError:
+    photutils = None
 
 def run_qacits_vlt(parameter_file, 
                    sci_cube, sci_dit, 
@@ -168,6 +164,7 @@ def run_qacits_vlt(parameter_file,
                                         mean_psf_flux, image_sampling,
                                         model_calibration=model_calibration,
                                         calib_tt=calib_tt, force=force,
+                                        plot_fig=disp_plots,
                                         verbose=verbose, exact=exact)    
     
     ## DISPLAY ###################################################################
@@ -189,14 +186,13 @@ def run_qacits_vlt(parameter_file,
               '\n R = {0:1.2f} l/D  ;  t = {1:1.2f} degr'.format(tt_rt[img_i,0],tt_rt[img_i,1]))
         fig1, ax1 = display_tiptilt_target(sci_cube_binned[img_i], image_sampling, vortex_center_yx,
                                            tiptilt_estimate[img_i], subim_width_lbdd=subim_width_lbdd, 
-                                           fig_num=41, tt_lim=1., plot_title='QUADRANT ANALYSIS',
+                                           tt_lim=1., plot_title='QUADRANT ANALYSIS',
                                            img_circ_rad=(inner_rad_lbdd, outer_rad_lbdd), 
                                            tt_circ_rad=(.2,.4,.6,.8,1.))
         
         #-- plot all estimates
         fig2, ax2 = display_tiptilt_sequence(tiptilt_estimate, 
-                                             tt_circ_rad=(.2,.4,.6,.8,1.), 
-                                             fignum=42)
+                                             tt_circ_rad=(.2,.4,.6,.8,1.))
         
         plt.show(block=False)
 
@@ -207,7 +203,7 @@ def run_qacits_vlt(parameter_file,
 def quadrant_tiptilt_v7(qacits_params, img_cube, vortex_center_yx, 
                      psf_flux, image_sampling,
                      model_calibration = False, calib_tt = None, 
-                     force=None, exact=True, verbose=False):
+                     force=None, exact=True, plot_fig=True, verbose=False):
     """
     QACITS tip-tilt estimator method optimized for the ERIS instrument.
     
@@ -239,6 +235,8 @@ def quadrant_tiptilt_v7(qacits_params, img_cube, vortex_center_yx,
         if True, the photometry in the quadrant will be exact (requires the
         photutils module). Otherwise the photometry measurement is limited by
         the pixel sampling.
+    plot_fig : boolean
+        If True, plot the model fits in model calibration mode.
     verbose : boolean
         prints various things in the console, for debugging purposes.
         
@@ -345,10 +343,10 @@ def quadrant_tiptilt_v7(qacits_params, img_cube, vortex_center_yx,
         colors = {'inner':[0.,0.3,.7],'outer':[.7,0.,0.3],'full':[0.,.7,0.5]}
         slopes = {}
         model_order = {'inner':1,'outer':1,'full':3}
-        plt.figure(num=1, figsize=(12,9))
-        plt.clf()
-        fig, ax = plt.subplots(nrows=3,ncols=2,num=1)
-        fig.subplots_adjust(hspace=0) #wspace=0
+        if plot_fig is True:
+            fig = plt.figure(figsize=(12,9))
+            ax = fig.subplots(nrows=3,ncols=2)
+            fig.subplots_adjust(hspace=0) #wspace=0
         for i, region in enumerate(tt_fit_lim):
             ind_x = np.where((calib_tt>tt_fit_lim[region][0]) & 
                              (calib_tt<tt_fit_lim[region][1]))[0]
@@ -362,6 +360,8 @@ def quadrant_tiptilt_v7(qacits_params, img_cube, vortex_center_yx,
             y = yy[ind_x]
             lin_params = linregress(x,y)
             slopes[region] = lin_params.slope
+            if plot_fig is False:
+                continue
 #            ax[i].set_title(region)
             ax[i,0].set_xlabel(r'True tip-tilt [$\lambda/D$]')
             ax[i,0].set_ylabel('Normalized Diff. Intensity')
@@ -530,7 +530,7 @@ def quadrant_tiptilt_v7(qacits_params, img_cube, vortex_center_yx,
 def quadrant_tiptilt(qacits_params, img_cube, vortex_center_yx, 
                      psf_flux, image_sampling,
                      model_calibration = False, calib_tt = None, 
-                     force=None, exact=True, verbose=False):
+                     force=None, exact=True, plot_fig=True, verbose=False):
     """
     QACITS tip-tilt estimator method optimized for the ERIS instrument.
     
@@ -562,6 +562,8 @@ def quadrant_tiptilt(qacits_params, img_cube, vortex_center_yx,
         if True, the photometry in the quadrant will be exact (requires the
         photutils module). Otherwise the photometry measurement is limited by
         the pixel sampling.
+    plot_fig : boolean
+        If True, plot the model fits in model calibration mode.
     verbose : boolean
         prints various things in the console, for debugging purposes.
         
@@ -664,10 +666,10 @@ def quadrant_tiptilt(qacits_params, img_cube, vortex_center_yx,
         colors = {'inner':[0.,0.3,.7],'outer':[.7,0.,0.3],'full':[0.,.7,0.5]}
         slopes = {}
         model_order = {'inner':1,'outer':1,'full':3}
-        plt.figure(num=1, figsize=(12,9))
-        plt.clf()
-        fig, ax = plt.subplots(nrows=3,ncols=2,num=1)
-        fig.subplots_adjust(hspace=0) #wspace=0
+        if plot_fig is True:
+            fig = plt.figure(figsize=(12,9))
+            ax = fig.subplots(nrows=3,ncols=2)
+            fig.subplots_adjust(hspace=0) #wspace=0
         for i, region in enumerate(tt_fit_lim):
             ind_x = np.where((calib_tt>tt_fit_lim[region][0]) & 
                              (calib_tt<tt_fit_lim[region][1]))[0]
@@ -681,6 +683,8 @@ def quadrant_tiptilt(qacits_params, img_cube, vortex_center_yx,
             y = yy[ind_x]
             lin_params = linregress(x,y)
             slopes[region] = lin_params.slope
+            if plot_fig is False:
+                continue
 #            ax[i].set_title(region)
             ax[i,0].set_xlabel(r'True tip-tilt [$\lambda/D$]')
             ax[i,0].set_ylabel('Normalized Diff. Intensity')
@@ -1127,8 +1131,7 @@ def get_psf_flux_v7(psf_cube, radius_lbdd, image_sampling, cyx_guess,
         if display is True:
             #        print('First guess 2D Gaussian params\n', first_guess)
             #        print('Fitted 2D Gaussian params\n', gauss_params)
-            plt.figure(num=40, figsize=(4,4))
-            plt.clf()
+            plt.figure(figsize=(4,4))
             plt.imshow(psf_subimage, cmap='plasma')
             plt.vlines(psf_cx, 0., 2*subim_width, color='w', linestyle='--')
             plt.hlines(psf_cy, 0., 2*subim_width, color='w', linestyle='--')
@@ -1210,8 +1213,7 @@ def get_psf_flux(psf_cube, radius_lbdd, image_sampling, cyx_guess,
         if display is True:
             #        print('First guess 2D Gaussian params\n', first_guess)
             #        print('Fitted 2D Gaussian params\n', gauss_params)
-            plt.figure(num=40, figsize=(4,4))
-            plt.clf()
+            plt.figure(figsize=(4,4))
             plt.imshow(psf_subimage, cmap='plasma')
             plt.vlines(psf_cx, 0., 2*subim_width, color='w', linestyle='--')
             plt.hlines(psf_cy, 0., 2*subim_width, color='w', linestyle='--')
@@ -1397,12 +1399,16 @@ def fit_gauss_2D(img, first_guess=None):
         
     popt, pcov = curve_fit(gauss_2D, (x, y), img.ravel(), 
                                p0=first_guess)
+    # failed fit (covariance not estimated): checked here, without changing
+    # the warning filters of the process
+    if not np.all(np.isfinite(pcov)):
+        raise RuntimeError('Covariance of the parameters could not be estimated')
     
     return popt
 
 def display_tiptilt_target(img, image_sampling, vortex_cyx, 
                              tt_estimate_xy,
-                             subim_width_lbdd=3., fig_num=1,
+                             subim_width_lbdd=3., fig_num=None,
                              img_circ_rad=None, tt_circ_rad=None,
                              tt_lim = 1., 
                              plot_title=''):
@@ -1418,11 +1424,11 @@ def display_tiptilt_target(img, image_sampling, vortex_cyx,
     subim_extent = np.array([-subim_width_lbdd, subim_width_lbdd,
                              -subim_width_lbdd, subim_width_lbdd])
     
-    plt.figure(num=fig_num, figsize=(9,4))
-    plt.clf()
-    plt.suptitle(plot_title)
+    fig = plt.figure(num=fig_num, figsize=(9,4))
+    fig.clf()
+    fig.suptitle(plot_title)
     
-    fig, ax = plt.subplots(nrows=1, ncols=2, num=fig_num)
+    ax = fig.subplots(nrows=1, ncols=2)
     
     ### LEFT PLOT: SUB-IMAGE
     ax[0].set_title('Coronagraphic image')
@@ -1460,15 +1466,16 @@ def display_tiptilt_target(img, image_sampling, vortex_cyx,
     return fig, ax
 
 def display_tiptilt_sequence(tt_xy, delta_t = None, 
-                             tt_circ_rad=None, fignum=2):
+                             tt_circ_rad=None, fignum=None):
     """
     Display the tip-tilt estimates over time.
+    For live monitoring of long sequences, see live_display.LiveTiptiltDisplay.
     """
-    plt.figure(num=fignum, figsize=(9,4))
-    plt.clf()
-    plt.suptitle('Tip-tilt estimates over time')
+    fig = plt.figure(num=fignum, figsize=(9,4))
+    fig.clf()
+    fig.suptitle('Tip-tilt estimates over time')
     
-    fig, ax = plt.subplots(nrows=1, ncols=2, num=fignum)
+    ax = fig.subplots(nrows=1, ncols=2)
     
     ### LEFT PLOT: 2D tip-tilt estimates
     ax[0].plot(tt_xy[:,0],tt_xy[:,1], 'c', alpha=.3)
@@ -1512,18 +1519,19 @@ def display_tiptilt_sequence(tt_xy, delta_t = None,
     return fig, ax
     
 def display_tiptilt_sequence_alma(tt_xy, delta_t = None, 
-                             tt_circ_rad=None, tt_xy_simul = None, fignum=2):
+                             tt_circ_rad=None, tt_xy_simul = None, fignum=None):
     """
     Display the tip-tilt estimates over time.
+    For live monitoring of long sequences, see live_display.LiveTiptiltDisplay.
     """
-    plt.figure(num=fignum, figsize=(14.3,4)) #figsize=(9,4))
-    plt.clf()
+    fig = plt.figure(num=fignum, figsize=(14.3,4)) #figsize=(9,4))
+    fig.clf()
     if tt_xy_simul is None:
-        plt.suptitle('Tip-tilt estimates over time')
+        fig.suptitle('Tip-tilt estimates over time')
     else:
-        plt.suptitle('Tip-tilt measured-simulated differences over time')
+        fig.suptitle('Tip-tilt measured-simulated differences over time')
     
-    fig, ax = plt.subplots(nrows=1, ncols=3, num=fignum)
+    ax = fig.subplots(nrows=1, ncols=3)
     
     ### LEFT PLOT: 2D tip-tilt estimates
     if tt_xy_simul is None:
@@ -1648,15 +1656,17 @@ def display_tiptilt_sequence_alma(tt_xy, delta_t = None,
     return fig, ax
 
 def display_tiptilt_sequence_alma2(tt_xy, delta_t = None,
-                             tt_circ_rad=None, tt_xy_simul = None, fignum=2):
+                             tt_circ_rad=None, tt_xy_simul = None, fignum=None):
     """
     Display the tip-tilt estimates over time.
+    For live monitoring of long sequences, see live_display.LiveTiptiltDisplay.
     """
     #plt.figure(num=fignum, figsize=(14.3/3.,4)) #figsize=(9,4))
-    plt.clf()
     #fig, ax = plt.subplots(num=fignum, figsize = (7,7),dpi=200)
     #fig, ax = plt.subplots(num=fignum, figsize = (6,6),dpi=200)
-    fig, ax = plt.subplots(num=fignum, figsize = (7,7),dpi=200)
+    fig = plt.figure(num=fignum, figsize = (7,7),dpi=200)
+    fig.clf()
+    ax = fig.subplots()
     #plt.rcParams["font.size"] = 18
     #plt.rcParams.update({'font.size': 13})
     #plt.rc('xtick', labelsize=13) 
@@ -0,0 +1,320 @@
+import numpy as np
+import contextlib
+import multiprocessing
+import time
+from multiprocessing import shared_memory
+
+# header of the shared memory block (int64 words)
+_MAGIC = 0x51414349545301
+_HEADER = 16
+_I_MAGIC, _I_NSLOTS, _I_NY, _I_NX, _I_NCONS, _I_WRITE, _I_CLOSED = range(7)
+_I_DTYPE = 8        # 8 words for the dtype string
+_CONSUMER = 4       # words per consumer: active, read count, overruns, spare
+
+
+def _attach_shared_memory(name):
+    # the block belongs to the producer, it must not be tracked (python >= 3.13);
+    # before, processes started by the producer share its resource tracker
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:
+        return shared_memory.SharedMemory(name=name)
+
+
+class FrameRingBuffer(object):
+    """
+    Fixed-size ring buffer of frames in shared memory, written by a single
+    producer and read by several consumers (e.g. QACITS estimation, live
+    display, archiving), possibly in other processes, without copying the
+    frames.
+
+    The producer never waits: the buffer is lock-free for a single producer.
+    Each frame slot is stamped with its frame index once written, and the
+    write counter is incremented afterwards. Each consumer has its own read
+    counter: a consumer lagging by more than nslots frames loses the oldest
+    frames, which are counted as overruns. Consumers get read-only views of
+    the slots (see get_frames), valid until the producer wraps around; use
+    is_valid after processing a view to check that it was not overwritten.
+
+    The producer creates the buffer (create=True, with shape and dtype), the
+    consumers attach to it by name (create=False). The consumer slots are
+    claimed (register) and freed (unregister) under the lock of the buffer:
+    the producer creates it (ring.lock), and consumers in other processes
+    must be given the same lock, e.g. as an argument of their Process.
+    Without it, registrations must be serialized by the caller.
+
+    Args:
+        name (str, optional):
+            name of the shared memory block, random if None when creating
+        shape (tuple of int):
+            frame shape (ny, nx), when creating
+        nslots (int):
+            number of frames in the ring, when creating
+        dtype (numpy dtype):
+            data type of the frames, when creating
+        create (bool):
+            if True, create the shared memory block, otherwise attach to it
+        max_consumers (int):
+            maximum number of registered consumers, when creating
+        lock (multiprocessing.Lock, optional):
+            lock of the consumer registrations, created if None when creating
+    """
+
+    def __init__(self, name=None, shape=None, nslots=256, dtype=np.float32,
+                 create=True, max_consumers=8, lock=None):
+
+        if create is True:
+            ny, nx = shape
+            dtype = np.dtype(dtype)
+            nhead = _HEADER + _CONSUMER*max_consumers + nslots
+            size = 8*nhead + nslots*ny*nx*dtype.itemsize
+            self.shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+            header = np.ndarray(_HEADER, dtype=np.int64, buffer=self.shm.buf)
+            header[:] = 0
+            header[[_I_MAGIC, _I_NSLOTS, _I_NY, _I_NX, _I_NCONS]] = \
+                _MAGIC, nslots, ny, nx, max_consumers
+            header[_I_DTYPE:].view('S64')[0] = dtype.str.encode()
+        else:
+            self.shm = _attach_shared_memory(name)
+            header = np.ndarray(_HEADER, dtype=np.int64, buffer=self.shm.buf)
+            assert header[_I_MAGIC] == _MAGIC, 'not a FrameRingBuffer'
+            nslots, ny, nx, max_consumers = header[[_I_NSLOTS, _I_NY, _I_NX, _I_NCONS]]
+            dtype = np.dtype(header[_I_DTYPE:].view('S64')[0].decode())
+        if create is True and lock is None:
+            lock = multiprocessing.Lock()
+        self.lock = lock
+        self.owner = create
+        self.name = self.shm.name
+        self.nslots = int(nslots)
+        self.shape = (int(ny), int(nx))
+        self.dtype = dtype
+        self.max_consumers = int(max_consumers)
+
+        buf = self.shm.buf
+        self._header = np.ndarray(_HEADER, dtype=np.int64, buffer=buf)
+        self._consumers = np.ndarray((self.max_consumers, _CONSUMER), dtype=np.int64,
+                                     buffer=buf, offset=8*_HEADER)
+        offset = 8*(_HEADER + _CONSUMER*self.max_consumers)
+        self._stamps = np.ndarray(self.nslots, dtype=np.int64, buffer=buf, offset=offset)
+        if create is True:
+            self._consumers[:] = 0
+            self._stamps[:] = -1
+        offset += 8*self.nslots
+        self._frames = np.ndarray((self.nslots,) + self.shape, dtype=self.dtype,
+                                  buffer=buf, offset=offset)
+
+    #-- producer
+
+    def write(self, frames):
+        """
+        Writes one frame or a cube of frames in the ring (producer only).
+
+        Args:
+            frames (ndarray):
+                frame of dimensions (ny, nx), or cube of dimensions (n, ny, nx)
+        """
+        frames = np.asarray(frames)
+        if frames.ndim == 2:
+            frames = frames[np.newaxis]
+        count = int(self._header[_I_WRITE])
+        # only the last nslots frames can be kept
+        if len(frames) > self.nslots:
+            count += len(frames) - self.nslots
+            frames = frames[-self.nslots:]
+        for frame in frames:
+            slot = count % self.nslots
+            self._stamps[slot] = -1
+            self._frames[slot] = frame
+            self._stamps[slot] = count
+            count += 1
+            self._header[_I_WRITE] = count
+
+    def close(self):
+        """ Signals the consumers that no more frames will be written. """
+        self._header[_I_CLOSED] = 1
+
+    @property
+    def closed(self):
+        return bool(self._header[_I_CLOSED])
+
+    @property
+    def write_count(self):
+        """ Total number of frames written. """
+        return int(self._header[_I_WRITE])
+
+    #-- consumers
+
+    def register(self, from_start=False):
+        """
+        Registers a new consumer.
+
+        Args:
+            from_start (bool):
+                if True, the consumer starts with the oldest frame in the ring,
+                otherwise with the next frame to be written
+
+        Returns:
+            consumer (int):
+                consumer id, to be given to get_frames and release
+        """
+        # the claim of a free slot (read then write) must not be interleaved
+        with self._registration():
+            free = np.nonzero(self._consumers[:,0] == 0)[0]
+            assert len(free) > 0, 'maximum number of consumers reached'
+            consumer = int(free[0])
+            count = self.write_count
+            self._consumers[consumer] = 0
+            self._consumers[consumer,1] = max(count - self.nslots, 0) if from_start else count
+            self._consumers[consumer,0] = 1
+        return consumer
+
+    def unregister(self, consumer):
+        """ Unregisters a consumer. """
+        with self._registration():
+            self._consumers[consumer,0] = 0
+
+    def _registration(self):
+        if self.lock is None:
+            return contextlib.nullcontext()
+        return self.lock
+
+    def get_frames(self, consumer, max_frames=None):
+        """
+        Returns a read-only view of the next frames for a consumer, without
+        copying them. The view stops at the end of the ring, the following
+        frames are returned by the next call. Frames overwritten before being
+        read are skipped and counted as overruns.
+
+        Args:
+            consumer (int):
+                consumer id
+            max_frames (int, optional):
+                maximum number of frames returned
+
+        Returns:
+            frames (ndarray):
+                view of dimensions (n, ny, nx), possibly empty
+            first (int):
+                index of the first frame of the view
+        """
+        count = self.write_count
+        read = int(self._consumers[consumer,1])
+        if count - read > self.nslots:
+            self._consumers[consumer,2] += count - self.nslots - read
+            read = count - self.nslots
+            self._consumers[consumer,1] = read
+        slot = read % self.nslots
+        n = min(count - read, self.nslots - slot)
+        if max_frames is not None:
+            n = min(n, max_frames)
+        frames = self._frames[slot:slot+n]
+        frames.flags.writeable = False
+        return frames, read
+
+    def is_valid(self, first, n):
+        """
+        Returns True if the frames first to first+n-1 are still in the ring,
+        i.e. were not overwritten while being processed.
+        """
+        if n == 0:
+            return True
+        last = (first + n - 1) % self.nslots
+        return (self.write_count - first <= self.nslots and
+                self._stamps[first % self.nslots] == first and
+                self._stamps[last] == first + n - 1)
+
+    def release(self, consumer, first, n):
+        """
+        Marks the frames returned by get_frames as read. The frames that were
+        overwritten while being processed are counted as overruns.
+
+        Returns:
+            valid (bool):
+                False if some of the frames were overwritten
+        """
+        valid = self.is_valid(first, n)
+        if valid is False:
+            self._consumers[consumer,2] += max(min(n, self.write_count - self.nslots - first), 1)
+        self._consumers[consumer,1] = max(int(self._consumers[consumer,1]), first + n)
+        return valid
+
+    def stats(self):
+        """
+        Returns:
+            stats (dict):
+                for each registered consumer, its 'lag' (number of frames
+                written but not read yet) and its number of 'overruns' (frames
+                lost because the consumer was too slow)
+        """
+        count = self.write_count
+        return {int(c): dict(lag=count - int(self._consumers[c,1]),
+                             overruns=int(self._consumers[c,2]))
+                for c in np.nonzero(self._consumers[:,0])[0]}
+
+    def detach(self):
+        """ Detaches from the shared memory, and frees it if owned. """
+        self._header = self._consumers = self._stamps = self._frames = None
+        self.shm.close()
+        if self.owner is True:
+            self.shm.unlink()
+
+
+def run_qacits_consumer(name, psf_OFF, img_sampling, callback=None, chunk_size=100,
+        timeout=None, poll=1e-3, lock=None, **qacits_params):
+
+    """
+    QACITS estimator worker attached to a FrameRingBuffer, e.g. as the target
+    of a multiprocessing.Process. The frames are processed by chunks of at most
+    chunk_size frames, directly in the shared memory, until the producer
+    closes the buffer.
+
+    Args:
+        name (str):
+            name of the FrameRingBuffer
+        psf_OFF (float ndarray):
+            off-axis PSF frame
+        img_sampling (float):
+            image sampling in pix per lambda/D
+        callback (function, optional):
+            called with the estimates of each chunk (see run_qacits) and the
+            index of its first frame
+        chunk_size (int):
+            maximum number of frames processed at once
+        timeout (float, optional):
+            stop after timeout seconds without new frames
+        poll (float):
+            waiting time [s] when there is no new frame
+        lock (multiprocessing.Lock, optional):
+            lock of the buffer (ring.lock of the producer), needed when
+            several consumers may register at the same time
+
+    Return:
+        stats (dict):
+            lag and overruns of this consumer (see FrameRingBuffer.stats)
+    """
+
+    from qacits.run_qacits import run_qacits
+
+    ring = FrameRingBuffer(name=name, create=False, lock=lock)
+    consumer = ring.register()
+    t_last = time.perf_counter()
+    try:
+        while True:
+            frames, first = ring.get_frames(consumer, max_frames=chunk_size)
+            if len(frames) == 0:
+                if ring.closed:
+                    break
+                if timeout is not None and time.perf_counter() - t_last > timeout:
+                    break
+                time.sleep(poll)
+                continue
+            estimates = run_qacits(frames, psf_OFF, img_sampling, **qacits_params)
+            if ring.release(consumer, first, len(frames)) and callback is not None:
+                callback(estimates, first)
+            t_last = time.perf_counter()
+        stats = ring.stats()[consumer]
+    finally:
+        ring.unregister(consumer)
+        ring.detach()
+
+    return stats
@@ -0,0 +1,98 @@
+from qacits.run_qacits import select_estimator
+from qacits.util.psf_flux import get_di_mod_arg
+import numpy as np
+import itertools
+
+# selection parameters of the sweep, in the order of the output dimensions
+sweep_params = ['ratio', 'phase_tolerance', 'modul_tolerance', 'small_tt_regime']
+
+
+def sweep_selection(all_di_xy, tt_lamD, coeffs={'inner':1, 'outer':1, 'full':1},
+        ratio=[0], phase_tolerance=[60], modul_tolerance=[0.33], small_tt_regime=[0.3],
+        sign=1, chunk_size=1000, verbose=False):
+
+    """
+    RMS pointing error of the QACITS estimates for a grid of selection
+    parameters, from precomputed differential intensities (see measure_di).
+    All the combinations of the parameters are evaluated at once, in one
+    broadcast computation per chunk of frames, instead of one call to
+    run_qacits per combination.
+
+    Args:
+        all_di_xy (float ndarray):
+            DI table of shape (nframes, 3, 2), measured with ratio=0
+        tt_lamD (2D float ndarray):
+            true x and y tip-tilt values in lambda/D, of shape (nframes, 2)
+        coeffs (dict of float, or list of dict):
+            linear coefficients in the QACITS model, or one dict per ratio
+            (the full coefficient depends on the ratio)
+        ratio, phase_tolerance, modul_tolerance, small_tt_regime (list of float):
+            values of the selection parameters (see run_qacits)
+        sign (int):
+            sign of the QACITS estimate w.r.t. the true tip-tilt, e.g. -1 for
+            the data cubes of the demo
+        chunk_size (int):
+            number of frames evaluated at once
+
+    Returns:
+        rms (float ndarray):
+            RMS pointing error [lambda/D], of shape (len(ratio),
+            len(phase_tolerance), len(modul_tolerance), len(small_tt_regime))
+        best (dict):
+            parameters of the smallest RMS pointing error
+    """
+
+    grid = [np.atleast_1d(np.asarray(p, dtype=float)) for p in
+            [ratio, phase_tolerance, modul_tolerance, small_tt_regime]]
+    shape = tuple(len(g) for g in grid)
+    if isinstance(coeffs, dict):
+        coeffs = [coeffs]*shape[0]
+    assert len(coeffs) == shape[0], 'one dict of coefficients per ratio'
+    coeff = {region: np.array([c[region] for c in coeffs], dtype=float)
+             for region in ['inner', 'outer', 'full']}
+    # parameters along their own dimension, frames along the last one
+    ratio, phase_tolerance, modul_tolerance, small_tt_regime = [
+        g.reshape(tuple(-1 if k == i else 1 for k in range(4)) + (1,))
+        for i, g in enumerate(grid)]
+    coeff_full = coeff['full'].reshape(-1, 1, 1, 1, 1)
+
+    all_di_xy = np.asarray(all_di_xy)
+    tt_lamD = np.asarray(tt_lamD)
+    nframes = len(all_di_xy)
+    sq_err = np.zeros(shape)
+    for i0 in range(0, nframes, chunk_size):
+        di = all_di_xy[i0:i0+chunk_size]
+        all_di_mod, all_di_arg = get_di_mod_arg(di)
+        #-- inner and outer estimators: same for all parameters (but the ratio)
+        inner_est = np.stack(np.broadcast_arrays(
+            all_di_mod['inner']/coeff['inner'].reshape(-1, 1, 1, 1, 1),
+            all_di_arg['inner'] + np.pi), axis=-1)
+        outer_est = np.stack(np.broadcast_arrays(
+            all_di_mod['outer']/coeff['outer'].reshape(-1, 1, 1, 1, 1),
+            all_di_arg['outer']), axis=-1)
+        #-- full estimator: debiased by the outer region, for each ratio
+        full_xy = di[:,2] + ratio[...,np.newaxis]*di[:,1]
+        full_est = np.stack([
+            np.abs(np.hypot(full_xy[...,0], full_xy[...,1])/coeff_full)**(1/3),
+            np.arctan2(full_xy[...,1], full_xy[...,0])], axis=-1)
+        final_est, _, _ = select_estimator(inner_est, outer_est, full_est,
+            phase_tolerance=phase_tolerance, modul_tolerance=modul_tolerance,
+            small_tt_regime=small_tt_regime)
+        est_x = sign*final_est[...,0]*np.cos(final_est[...,1])
+        est_y = sign*final_est[...,0]*np.sin(final_est[...,1])
+        tt = tt_lamD[i0:i0+chunk_size]
+        sq_err += np.sum((est_x - tt[:,0])**2 + (est_y - tt[:,1])**2, axis=-1)
+
+    rms = np.sqrt(sq_err/nframes)
+    index = np.unravel_index(np.argmin(rms), shape)
+    best = {name: float(grid[k][index[k]]) for k, name in enumerate(sweep_params)}
+    best['coeffs'] = coeffs[index[0]]
+    best['rms'] = float(rms[index])
+
+    if verbose is True:
+        for index in itertools.product(*[range(n) for n in shape]):
+            print(', '.join('{0} = {1:g}'.format(name, grid[k][index[k]])
+                  for k, name in enumerate(sweep_params)) +
+                  ': rms = {0:.4f} l/D'.format(rms[index]))
+
+    return rms, best
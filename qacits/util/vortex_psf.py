@@ -0,0 +1,157 @@
+import numpy as np
+try:
+    # multithreaded FFTs, with single precision support
+    from scipy import fft as _fft
+    _fft_kwargs = dict(workers=-1)
+except ImportError:
+    _fft = np.fft
+    _fft_kwargs = {}
+
+
+def circular_pupil(npupil, obstruction=0., npad=None):
+    """
+    Creates a circular pupil, with an optional central obstruction.
+
+    Args:
+        npupil (int):
+            pupil diameter [pix]
+        obstruction (float):
+            diameter of the central obstruction, as a fraction of the pupil diameter
+        npad (int, optional):
+            size of the output array, defaults to npupil
+
+    Returns:
+        pupil (float ndarray):
+            2D array of 1 inside the pupil and 0 outside, centered on the
+            pixel (npad//2, npad//2)
+    """
+
+    if npad is None:
+        npad = npupil
+    x = np.arange(npad) - npad//2
+    r = np.hypot(x[np.newaxis,:], x[:,np.newaxis])
+    pupil = (r < npupil/2) & (r >= obstruction*npupil/2)
+
+    return np.float64(pupil)
+
+
+def make_vortex_psfs(tt_lamD, img_sampling=4., npupil=64, nimg=None,
+        obstruction=0.15, lyot_ratio=0.95, leak=0., flux=None, background=0.,
+        read_noise=0., seed=None, nchunk=32, dtype=np.float32):
+    """
+    Simulates on-axis coronagraphic PSFs of a charge 2 vortex coronagraph with
+    given tip-tilt offsets, and the corresponding off-axis PSF. Each frame is
+    propagated with FFTs through the pupil, the vortex phase mask and the Lyot
+    stop, the tip-tilt offsets being processed by batches of nchunk frames.
+
+    The image sampling is npad/npupil pix per lambda/D, npad being the closest
+    integer to npupil*img_sampling, and the PSFs are centered on the pixel
+    ((nimg-1)/2, (nimg-1)/2), i.e. the default center in run_qacits. The
+    QACITS estimate of these PSFs is +tt_lamD. Without central obstruction the
+    differential intensities are not linear at small tip-tilt, the default
+    obstruction is close to the VLT one.
+
+    Args:
+        tt_lamD (2D float ndarray):
+            x and y tip-tilt values in lambda/D, of dimensions (ncube, 2)
+        img_sampling (float):
+            image sampling in pix per lambda/D
+        npupil (int):
+            pupil diameter [pix]
+        nimg (int, optional):
+            size of the output images [pix], odd; defaults to +/- 6 lambda/D
+        obstruction (float):
+            diameter of the central obstruction, as a fraction of the pupil diameter
+        lyot_ratio (float):
+            diameter of the Lyot stop, as a fraction of the pupil diameter
+        leak (float):
+            fraction of the (tip-tilted) non-coronagraphic PSF leaking through
+            the vortex, e.g. chromatic leakage
+        flux (float, optional):
+            total flux [photons] in the off-axis PSF; if given, photon noise
+            is added to the on-axis PSFs
+        background (float):
+            background level [photons/pix]
+        read_noise (float):
+            standard deviation of the detector read noise [photons/pix]
+        seed (int, optional):
+            seed of the random number generator
+        nchunk (int):
+            number of frames propagated at once
+        dtype (numpy dtype):
+            data type of the outputs, the propagation is in single precision
+            for float32
+
+    Returns:
+        psf_ON (float ndarray):
+            cube of on-axis PSFs, of dimensions (ncube, nimg, nimg)
+        psf_OFF (float ndarray):
+            off-axis PSF frame, of dimensions (nimg, nimg)
+    """
+
+    tt_lamD = np.array(tt_lamD, ndmin=2, dtype=float)
+    ncube = len(tt_lamD)
+    npad = int(np.round(npupil*img_sampling))
+    sampling = npad/npupil
+    if nimg is None:
+        nimg = 2*int(np.ceil(6*sampling)) + 1
+    assert nimg % 2 == 1, 'nimg must be odd'
+    assert nimg <= npad, 'nimg must be <= npupil*img_sampling'
+
+    # pupil, Lyot stop and vortex phase mask, centered on the pixel npad//2
+    pupil = circular_pupil(npupil, obstruction=obstruction, npad=npad)
+    lyot = circular_pupil(lyot_ratio*npupil, obstruction=obstruction/lyot_ratio,
+                          npad=npad)
+    x = np.arange(npad) - npad//2
+    vortex = np.exp(2j*np.arctan2(x[:,np.newaxis], x[np.newaxis,:]))
+    vortex[npad//2, npad//2] = 0
+    # FFTs are computed with the origin at the array corner
+    pupil = np.fft.ifftshift(pupil)
+    lyot = np.fft.ifftshift(lyot)
+    vortex = np.fft.ifftshift(vortex)
+    crop = np.r_[-(nimg//2):nimg//2+1]
+    # single precision fields for single precision outputs
+    ctype = np.result_type(dtype, np.complex64)
+    pupil = pupil.astype(ctype)
+    lyot = lyot.astype(ctype)
+    vortex = vortex.astype(ctype)
+
+    def image(field):
+        field = _fft.fft2(field, axes=(-2,-1), **_fft_kwargs)
+        return np.abs(field[..., crop[:,np.newaxis], crop[np.newaxis,:]])**2
+
+    # off-axis PSF, normalized to a unit total flux within the image
+    psf_OFF = image(pupil*lyot)
+    norm = np.sum(psf_OFF)
+    psf_OFF /= norm
+
+    # tip-tilt phase ramps, in cycles per pupil diameter
+    xf = np.fft.ifftshift(x)/npupil
+    psf_ON = np.zeros((ncube, nimg, nimg), dtype=dtype)
+    for i0 in range(0, ncube, nchunk):
+        tt = tt_lamD[i0:i0+nchunk]
+        # separable ramps: exp(i(ax+by)) = exp(iax)*exp(iby)
+        ramp_x = np.exp(2j*np.pi*tt[:,0,np.newaxis]*xf).astype(ctype)
+        ramp_y = np.exp(2j*np.pi*tt[:,1,np.newaxis]*xf).astype(ctype)
+        field = pupil*ramp_x[:,np.newaxis,:]*ramp_y[:,:,np.newaxis]
+        # vortex in the focal plane, then Lyot stop in the pupil plane
+        focal = _fft.fft2(field, axes=(-2,-1), **_fft_kwargs)*vortex
+        lyot_field = _fft.ifft2(focal, axes=(-2,-1), **_fft_kwargs)*lyot
+        psf = image(lyot_field)
+        if leak > 0:
+            psf = (1 - leak)*psf + leak*image(field*lyot)
+        psf_ON[i0:i0+nchunk] = psf/norm
+
+    if flux is not None or background > 0 or read_noise > 0:
+        rng = np.random.default_rng(seed)
+        scale = 1. if flux is None else flux
+        psf_OFF = psf_OFF*scale
+        psf_ON *= scale
+        psf_ON += background
+        if flux is not None:
+            psf_ON[:] = rng.poisson(psf_ON)
+        if read_noise > 0:
+            psf_ON += rng.normal(0, read_noise, psf_ON.shape)
+        psf_ON -= background
+
+    return psf_ON, np.asarray(psf_OFF, dtype=dtype)
@@ -0,0 +1,45 @@
+from qacits.run_qacits import run_qacits
+from qacits.util.adaptive_binning import choose_bin_width, frame_noise, run_qacits_adaptive
+from qacits.util.vortex_psf import make_vortex_psfs
+import numpy as np
+
+img_sampling = 4.
+coeffs = {'inner':0.08, 'outer':0.03, 'full':2.}
+
+
+def test_choose_bin_width():
+    # noise limited: (0.1/0.02)**2 = 25 frames
+    assert choose_bin_width(1e-4, 0.1, 1., 0.02) == 25
+    # latency limited: offline, then with a frame period of 10 ms
+    assert choose_bin_width(1e-3, 0.1, 0.01, 0.02) == 10
+    assert choose_bin_width(1e-3, 0.1, 0.1, 0.02, frame_period=0.01) == 10
+    assert choose_bin_width(1e-3, 0.1, 1., 0., max_width=50) == 50
+    assert choose_bin_width(1., 0.1, 1e-3, 0.02) == 1
+
+
+def test_frame_noise():
+    rng = np.random.default_rng(0)
+    # white noise of 0.05 on a slow drift
+    drift = np.linspace(0, 1, 5000)[:,np.newaxis]*np.array([1, -0.5])
+    tt = drift + rng.normal(0, 0.05, (5000, 2))
+    assert abs(frame_noise(tt) - 0.05) < 0.003
+    assert np.isnan(frame_noise(tt[:2]))
+
+
+def test_adaptive_binning():
+    rng = np.random.default_rng(0)
+    tt = rng.normal(0.1, 0.02, (300, 2))
+    psf_ON, psf_OFF = make_vortex_psfs(tt, img_sampling=img_sampling, nimg=33,
+                                       flux=1e5, seed=0)
+    est, widths = run_qacits_adaptive(psf_ON, psf_OFF, img_sampling, latency_budget=10.,
+                                      target_noise=0.005, chunk_size=50, coeffs=coeffs,
+                                      exact=False)
+    assert np.sum(widths) == len(psf_ON) and len(est) == len(widths)
+    # jitter of 0.02 l/D per frame: about 16 frames per bin
+    assert 8 < np.median(widths) < 32
+    # each bin is the estimate of its mean frame
+    first = np.concatenate([[0], np.cumsum(widths)[:-1]])
+    for i in [0, len(widths)//2, len(widths) - 1]:
+        ref = run_qacits(psf_ON[first[i]:first[i]+widths[i]], psf_OFF, img_sampling,
+                         nbin=1, coeffs=coeffs, exact=False)
+        assert np.allclose(est[i], ref[0], rtol=1e-4, atol=1e-6)
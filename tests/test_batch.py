@@ -0,0 +1,73 @@
+from qacits.run_qacits import run_qacits
+from qacits.util.batch import run_qacits_batch, load_batch, read_progress
+from qacits.util.chunk_store import open_store
+from qacits.util.vortex_psf import make_vortex_psfs
+import numpy as np
+import pytest
+
+img_sampling = 4.
+coeffs = {'inner':0.08, 'outer':0.03, 'full':2.}
+
+
+class InterruptedCube(object):
+    # cube whose reading fails from the frame nmax on, as a killed run
+    def __init__(self, cube, nmax):
+        self.cube = cube
+        self.nmax = nmax
+        self.shape = cube.shape
+
+    def __len__(self):
+        return len(self.cube)
+
+    def __getitem__(self, index):
+        if min(index.stop, len(self.cube)) > self.nmax:
+            raise RuntimeError('interrupted')
+        return self.cube[index]
+
+
+@pytest.fixture(scope='module')
+def psfs():
+    rng = np.random.default_rng(0)
+    tt = rng.normal(0, 0.1, (95, 2))
+    return make_vortex_psfs(tt, img_sampling=img_sampling, nimg=33, flux=1e6, seed=0)
+
+
+def test_batch(psfs, tmp_path):
+    psf_ON, psf_OFF = psfs
+    est = run_qacits_batch(psf_ON, psf_OFF, img_sampling, tmp_path, chunk_size=20,
+                           coeffs=coeffs, exact=False)
+    ref = run_qacits(psf_ON, psf_OFF, img_sampling, coeffs=coeffs, exact=False)
+    assert np.allclose(est, ref)
+    # the output directory is a store
+    arrays, params = open_store(tmp_path)
+    assert params['chunk_size'] == 20
+    assert np.array_equal(arrays['estimates'][:], est)
+    assert arrays['di'].shape == (95, 3, 2)
+    assert list(np.diff(arrays['estimates'].bounds)) == [20, 20, 20, 20, 15]
+
+
+def test_resume(psfs, tmp_path):
+    psf_ON, psf_OFF = psfs
+    with pytest.raises(RuntimeError):
+        run_qacits_batch(InterruptedCube(psf_ON, 50), psf_OFF, img_sampling, tmp_path,
+                         chunk_size=20, coeffs=coeffs, exact=False)
+    assert len(load_batch(tmp_path)) == 40
+    # corrupted chunk: processed again, with the next ones
+    with open(tmp_path/'estimates'/'000001.npy.z', 'wb') as f:
+        f.write(b'corrupted')
+    est = run_qacits_batch(InterruptedCube(psf_ON, 95), psf_OFF, img_sampling, tmp_path,
+                           chunk_size=20, coeffs=coeffs, exact=False)
+    ref = run_qacits(psf_ON, psf_OFF, img_sampling, coeffs=coeffs, exact=False)
+    assert np.allclose(est, ref)
+    _, chunks = read_progress(tmp_path)
+    assert sorted(chunks) == [0, 1, 2, 3, 4]
+    with pytest.raises(ValueError):
+        run_qacits_batch(psf_ON, psf_OFF, img_sampling, tmp_path, chunk_size=10,
+                         coeffs=coeffs, exact=False)
+
+
+def test_empty(psfs, tmp_path):
+    psf_ON, psf_OFF = psfs
+    est = run_qacits_batch(psf_ON[:0], psf_OFF, img_sampling, tmp_path, exact=False)
+    assert est.shape == (0, 11)
+    assert load_batch(tmp_path, 'di').shape == (0, 3, 2)
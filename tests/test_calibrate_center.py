@@ -0,0 +1,43 @@
+from qacits.calibrate_center import calibrate_center
+from qacits.calibrate_qacits import calibrate_qacits
+from qacits.util.vortex_psf import make_vortex_psfs
+import numpy as np
+import pytest
+
+img_sampling = 4.
+nimg = 49
+center = (nimg - 1)/2
+
+
+@pytest.fixture(scope='module')
+def jitter():
+    # zero mean jitter around the vortex center (image center)
+    rng = np.random.default_rng(0)
+    tt = rng.normal(0, 0.03, (100, 2))
+    tt -= np.mean(tt, axis=0)
+    psf_ON, psf_OFF = make_vortex_psfs(tt, img_sampling=img_sampling, nimg=nimg)
+    return tt, psf_ON, psf_OFF
+
+
+@pytest.fixture(scope='module')
+def coeffs():
+    rng = np.random.default_rng(1)
+    tt = rng.uniform(-0.3, 0.3, (200, 2))
+    psf_ON, psf_OFF = make_vortex_psfs(tt, img_sampling=img_sampling, nimg=nimg)
+    return calibrate_qacits(psf_ON, psf_OFF, img_sampling, tt, exact=False, plot_fig=False)
+
+
+def test_center_without_tiptilt(jitter):
+    tt, psf_ON, psf_OFF = jitter
+    cx, cy = calibrate_center(psf_ON, psf_OFF, img_sampling, cx=center + 0.6, cy=center - 0.5)
+    assert abs(cx - center) < 0.02 and abs(cy - center) < 0.02
+
+
+@pytest.mark.parametrize('sign', [1, -1])
+def test_center_with_tiptilt(jitter, coeffs, sign):
+    # make_vortex_psfs: the estimate is +tt, i.e. sign*tt_lamD with tt_lamD = sign*tt
+    # same photometry (flux normalization included) as the calibration
+    tt, psf_ON, psf_OFF = jitter
+    cx, cy = calibrate_center(psf_ON, psf_OFF, img_sampling, tt_lamD=sign*tt, sign=sign,
+                              coeffs=coeffs, cx=center + 0.6, cy=center - 0.5, exact=False)
+    assert abs(cx - center) < 0.02 and abs(cy - center) < 0.02
@@ -0,0 +1,59 @@
+from qacits.calibrate_qacits import calibration_uncertainty, fit_qacits_model
+from qacits.util.psf_flux import get_cube_di
+from qacits.util.vortex_psf import make_vortex_psfs
+import numpy as np
+import pytest
+
+img_sampling = 4.
+radii = {'inner':(0,1.7), 'outer':(1.7,2.3), 'full':(0,2.7)}
+
+
+@pytest.fixture(scope='module')
+def calib():
+    rng = np.random.default_rng(0)
+    tt = rng.uniform(-0.4, 0.4, (120, 2))
+    psf_ON, psf_OFF = make_vortex_psfs(tt, img_sampling=img_sampling, nimg=33,
+                                       flux=1e6, seed=0)
+    return tt, psf_ON, psf_OFF
+
+
+def test_vectorized_fits(calib):
+    # same samples and folds, fitted one by one with fit_qacits_model
+    tt, psf_ON, psf_OFF = calib
+    nboot, kfold, seed = 20, 4, 3
+    res = calibration_uncertainty(psf_ON, psf_OFF, img_sampling, tt, exact=False,
+                                  nboot=nboot, kfold=kfold, seed=seed)
+    all_di_mod, _ = get_cube_di(psf_ON, psf_OFF, img_sampling, radii, exact=False)
+    rng = np.random.default_rng(seed)
+    counts = rng.multinomial(len(tt), np.full(len(tt), 1/len(tt)), size=nboot)
+    folds = np.array_split(rng.permutation(len(tt)), kfold)
+    for b in range(nboot):
+        ind = np.repeat(np.arange(len(tt)), counts[b])
+        coeffs, _ = fit_qacits_model(tt[ind], {region: all_di_mod[region][ind]
+                                               for region in all_di_mod})
+        for region in coeffs:
+            assert np.isclose(res['bootstrap'][region][b], coeffs[region])
+    for k in range(kfold):
+        ind = np.setdiff1d(np.arange(len(tt)), folds[k])
+        coeffs, _ = fit_qacits_model(tt[ind], {region: all_di_mod[region][ind]
+                                               for region in all_di_mod})
+        for region in coeffs:
+            assert np.isclose(res['cv_coeffs'][k][region], coeffs[region])
+
+
+def test_uncertainty(calib):
+    tt, psf_ON, psf_OFF = calib
+    res = calibration_uncertainty(psf_ON, psf_OFF, img_sampling, tt, exact=False,
+                                  nboot=100, seed=0)
+    res2 = calibration_uncertainty(psf_ON, psf_OFF, img_sampling, tt, exact=False,
+                                   nboot=100, seed=0)
+    for region in ['inner', 'outer', 'full']:
+        assert res['bootstrap'][region].shape == (100,)
+        assert np.array_equal(res['bootstrap'][region], res2['bootstrap'][region],
+                              equal_nan=True)
+        low, high = res['interval'][region]
+        assert low <= res['coeffs'][region] <= high
+        assert res['std'][region] > 0
+    # RMS pointing errors, not sums of squares
+    assert 0 < res['fit_rms'] < 0.1
+    assert res['inflation'] >= 1
@@ -0,0 +1,43 @@
+from qacits.util.chunk_store import ChunkedWriter, ChunkedArray, open_store
+import numpy as np
+import pytest
+
+
+@pytest.fixture(params=['zlib', None])
+def store(tmp_path, request):
+    data = np.arange(103*11, dtype=float).reshape(103, 11)
+    with ChunkedWriter(tmp_path/'store', params={'img_sampling':4.}, chunk_size=10,
+                       compression=request.param) as writer:
+        # appended in pieces that do not match the chunks
+        for i0 in range(0, len(data), 7):
+            writer.append(estimates=data[i0:i0+7])
+    return tmp_path/'store', data
+
+
+def test_open_store(store):
+    path, data = store
+    arrays, params = open_store(path)
+    assert params == {'img_sampling': 4.}
+    assert arrays['estimates'].shape == data.shape
+    assert np.array_equal(np.asarray(arrays['estimates']), data)
+
+
+@pytest.mark.parametrize('index', [slice(None), slice(5, 37), slice(10, 20),
+    slice(None, None, -1), slice(90, 3, -7), slice(-5, None), slice(2, 100, 9),
+    slice(50, 50), slice(60, 40), slice(200, 300), slice(None, None, 3)])
+def test_slices(store, index):
+    path, data = store
+    arr = ChunkedArray(path, 'estimates')
+    assert np.array_equal(arr[index], data[index])
+    assert arr[index].shape == data[index].shape
+
+
+def test_integers(store):
+    path, data = store
+    arr = ChunkedArray(path, 'estimates')
+    for i in [0, 9, 10, 102, -1, -103]:
+        assert np.array_equal(arr[i], data[i])
+    assert np.array_equal(arr[-4, 2:5], data[-4, 2:5])
+    for i in [103, -104, 1000]:
+        with pytest.raises(IndexError):
+            arr[i]
@@ -0,0 +1,78 @@
+from qacits.calibrate_qacits import calibrate_qacits
+from qacits.cli import main, read_parameter_file, write_parameter_file
+from qacits.run_qacits import run_qacits
+from qacits.util.vortex_psf import make_vortex_psfs
+from astropy.io import fits
+import numpy as np
+import pytest
+
+img_sampling = 4.
+coeffs = {'inner':0.08, 'outer':0.03, 'full':2.}
+
+
+@pytest.fixture(scope='module')
+def fits_files(tmp_path_factory):
+    path = tmp_path_factory.mktemp('cli')
+    rng = np.random.default_rng(0)
+    tt = rng.normal(0, 0.1, (300, 2))
+    psf_ON, psf_OFF = make_vortex_psfs(tt, img_sampling=img_sampling, nimg=33,
+                                       flux=1e6, seed=0)
+    fits.writeto(path/'on.fits', psf_ON)
+    fits.writeto(path/'off.fits', psf_OFF)
+    return path, psf_ON, psf_OFF
+
+
+def test_parameter_file(tmp_path):
+    params = {'coeffs':coeffs, 'ratio':-0.2, 'phase_tolerance':60., 'nbin':10,
+              'radii':{'inner':(0,1.7), 'outer':(1.7,2.3), 'full':(0,2.7)}}
+    write_parameter_file(tmp_path/'params.ini', params)
+    # phase_tolerance in units of pi in the file, as in run_qacits_vlt
+    assert 'phase_tolerance = 0.333' in (tmp_path/'params.ini').read_text()
+    params_read = read_parameter_file(tmp_path/'params.ini')
+    assert params_read['coeffs'] == coeffs
+    assert params_read['radii'] == params['radii']
+    assert np.isclose(params_read['phase_tolerance'], 60)
+    assert params_read['nbin'] == 10
+
+
+def test_parameter_file_cli_keys(tmp_path):
+    (tmp_path/'params.ini').write_text('cx = 10.\nratio = 0.\n')
+    with pytest.raises(AssertionError):
+        read_parameter_file(tmp_path/'params.ini')
+
+
+@pytest.mark.parametrize('nbin', [0, 10])
+def test_run_chunks(fits_files, tmp_path, nbin):
+    # chunks of 64 frames, the last one being short: the binning applies to
+    # the whole sequence of 300 frames
+    path, psf_ON, psf_OFF = fits_files
+    write_parameter_file(tmp_path/'params.ini', {'coeffs':coeffs, 'ratio':-0.2,
+                         'phase_tolerance':45., 'nbin':nbin})
+    main(['run', str(path/'on.fits'), str(path/'off.fits'), '-s', str(img_sampling),
+          '-p', str(tmp_path/'params.ini'), '--sampled', '-c', '64', '-w', '2',
+          '-f', 'npy', '-o', str(tmp_path/'est.npy')])
+    est = np.load(tmp_path/'est.npy')
+    ref = run_qacits(psf_ON, psf_OFF, img_sampling, coeffs=coeffs, ratio=-0.2,
+                     phase_tolerance=45., nbin=nbin, exact=False)
+    assert est.shape == ref.shape
+    assert len(est) == (nbin if nbin > 0 else len(psf_ON))
+    assert np.allclose(est, ref, rtol=1e-5, atol=1e-8)
+
+
+def test_calibrate_nbin(fits_files, tmp_path):
+    # nbin of the parameter file: 3 frames per pointing, binned to 20 frames
+    path, _, psf_OFF = fits_files
+    tt = np.random.default_rng(1).uniform(-0.3, 0.3, (20, 2))
+    psf_ON, _ = make_vortex_psfs(np.repeat(tt, 3, axis=0), img_sampling=img_sampling,
+                                 nimg=33, flux=1e6)
+    fits.writeto(tmp_path/'on.fits', psf_ON)
+    fits.writeto(tmp_path/'tt.fits', tt)
+    write_parameter_file(tmp_path/'params.ini', {'nbin':20})
+    main(['calibrate', str(tmp_path/'on.fits'), str(path/'off.fits'),
+          str(tmp_path/'tt.fits'), '-s', str(img_sampling), '--sampled',
+          '-p', str(tmp_path/'params.ini'), '-o', str(tmp_path/'out.ini')])
+    params = read_parameter_file(tmp_path/'out.ini')
+    ref = calibrate_qacits(psf_ON, psf_OFF, img_sampling, tt, nbin=20, exact=False,
+                           plot_fig=False)
+    assert params['nbin'] == 20
+    assert all(np.isclose(params['coeffs'][region], ref[region]) for region in ref)
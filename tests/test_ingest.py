@@ -0,0 +1,61 @@
+from qacits.util.ingest import getdata, cached_getdata, iter_fits_chunks, to_native
+from astropy.io import fits
+import numpy as np
+import gzip
+import pytest
+
+
+@pytest.fixture
+def cube():
+    return np.random.default_rng(0).normal(size=(20, 9, 8)).astype('>f4')
+
+
+def write_gz(filename, hdus):
+    fits.HDUList(hdus).writeto(str(filename)[:-3])
+    with open(str(filename)[:-3], 'rb') as f, gzip.open(filename, 'wb') as fz:
+        fz.write(f.read())
+
+
+@pytest.mark.parametrize('compressed', [True, False])
+def test_getdata(cube, tmp_path, compressed):
+    filename = tmp_path/('cube.fits.gz' if compressed else 'cube.fits')
+    if compressed:
+        write_gz(filename, [fits.PrimaryHDU(cube)])
+    else:
+        fits.writeto(filename, cube)
+    data = getdata(filename, cache_dir=tmp_path/'cache')
+    assert data.dtype.isnative and data.flags.c_contiguous
+    assert np.array_equal(data, cube)
+    # second call from the cache
+    assert np.array_equal(getdata(filename, cache_dir=tmp_path/'cache'), cube)
+    assert np.array_equal(np.concatenate(list(iter_fits_chunks(filename, chunk_size=7))),
+                          cube)
+
+
+def test_empty_primary(cube, tmp_path):
+    # data in the first extension with data, as fits.getdata
+    filename = tmp_path/'cube.fits.gz'
+    write_gz(filename, [fits.PrimaryHDU(), fits.ImageHDU(cube[:, 0]), fits.ImageHDU(cube)])
+    ref = fits.getdata(filename)
+    assert ref.shape == (20, 8)
+    data = getdata(filename, cache_dir=tmp_path/'cache')
+    assert data.shape == (20, 8) and np.array_equal(data, ref)
+    data = cached_getdata(filename, ext=2, cache_dir=tmp_path/'cache')
+    assert np.array_equal(data, cube)
+    with pytest.raises(IndexError):
+        cached_getdata(filename, ext=3, cache_dir=tmp_path/'cache')
+
+
+def test_scaling(tmp_path):
+    # unsigned integers (BZERO) and scaled integers
+    data = np.arange(24, dtype=np.uint16).reshape(2, 3, 4)*1000
+    fits.writeto(tmp_path/'u16.fits', data)
+    assert np.array_equal(cached_getdata(tmp_path/'u16.fits', cache_dir=tmp_path), data)
+    assert cached_getdata(tmp_path/'u16.fits', cache_dir=tmp_path).dtype == np.uint16
+
+
+def test_to_native(cube):
+    native = to_native(cube, chunk_size=3)
+    assert native.dtype == np.float32 and native.dtype.isnative
+    assert np.array_equal(native, cube)
+    assert to_native(native) is native
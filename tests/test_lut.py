@@ -0,0 +1,53 @@
+from qacits.calibrate_qacits import calibrate_qacits, build_lut
+from qacits.run_qacits import run_qacits, invert_lut
+from qacits.util.vortex_psf import make_vortex_psfs
+import numpy as np
+import pytest
+
+img_sampling = 4.
+
+
+@pytest.fixture(scope='module')
+def calib():
+    rng = np.random.default_rng(0)
+    tt = rng.uniform(-0.6, 0.6, (400, 2))
+    psf_ON, psf_OFF = make_vortex_psfs(tt, img_sampling=img_sampling, nimg=33,
+                                       flux=1e7, seed=0)
+    return tt, psf_ON, psf_OFF
+
+
+def test_build_lut():
+    rng = np.random.default_rng(1)
+    tt = rng.uniform(-1, 1, (500, 2))
+    tt_mod = np.hypot(tt[:,0], tt[:,1])
+    # increasing, then decreasing beyond 1 l/D, with noise
+    di = np.sin(np.pi/2*tt_mod) + rng.normal(0, 0.01, 500)
+    lut = build_lut(tt, {'inner':di, 'outer':di, 'full':di}, nnodes=40)
+    for region in lut:
+        di_nodes, tt_nodes = lut[region]
+        assert di_nodes[0] == tt_nodes[0] == 0
+        assert np.all(np.diff(di_nodes) > 0)
+        assert len(di_nodes) <= 41
+        assert np.allclose(np.interp(np.sin(np.pi/2*0.5), di_nodes, tt_nodes), 0.5, atol=0.03)
+    # interpolated in the tables, one table per cube for a batch
+    assert np.allclose(invert_lut(lut['outer'][0], lut, 'outer'), lut['outer'][1])
+    est = invert_lut(np.stack([lut['outer'][0]]*2), [lut, lut], 'outer')
+    assert np.allclose(est, lut['outer'][1])
+
+
+def test_lut_estimates(calib):
+    # the tables are valid beyond the range of the linear model
+    tt, psf_ON, psf_OFF = calib
+    coeffs = calibrate_qacits(psf_ON, psf_OFF, img_sampling, tt, exact=False,
+                              plot_fig=False, lut=True)
+    linear = {region: coeffs[region] for region in ['inner', 'outer', 'full']}
+    tt_mod = np.hypot(tt[:,0], tt[:,1])
+    large = (tt_mod > 0.5) & (tt_mod < 0.7)
+    est_lut = run_qacits(psf_ON, psf_OFF, img_sampling, force='outer', coeffs=coeffs,
+                         exact=False)
+    est_linear = run_qacits(psf_ON, psf_OFF, img_sampling, force='outer', coeffs=linear,
+                            exact=False)
+    err_lut = np.hypot(*(est_lut[large,0:2] - tt[large]).T)
+    err_linear = np.hypot(*(est_linear[large,0:2] - tt[large]).T)
+    assert np.median(err_lut) < 0.5*np.median(err_linear)
+    assert np.median(err_lut) < 0.03
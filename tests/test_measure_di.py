@@ -0,0 +1,50 @@
+from qacits.run_qacits import run_qacits, measure_di, estimate_from_di, save_di, load_di
+from qacits.util.vortex_psf import make_vortex_psfs
+import numpy as np
+import pytest
+
+img_sampling = 4.
+coeffs = {'inner':0.08, 'outer':0.03, 'full':2.}
+
+
+@pytest.fixture(scope='module')
+def psfs():
+    rng = np.random.default_rng(0)
+    tt = rng.normal(0, 0.15, (60, 2))
+    return make_vortex_psfs(tt, img_sampling=img_sampling, nimg=33, flux=1e6, seed=0)
+
+
+@pytest.mark.parametrize('force', ['inner', 'outer', 'full', None])
+def test_two_stages(psfs, force):
+    # measure_di then estimate_from_di is run_qacits, the ratio being applied
+    # by the second stage
+    psf_ON, psf_OFF = psfs
+    di = measure_di(psf_ON, psf_OFF, img_sampling, nbin=20, exact=False)
+    assert di.shape == (20, 3, 2)
+    est = estimate_from_di(di, force=force, coeffs=coeffs, ratio=-0.2)
+    ref = run_qacits(psf_ON, psf_OFF, img_sampling, force=force, coeffs=coeffs,
+                     ratio=-0.2, nbin=20, exact=False)
+    assert np.allclose(est, ref, rtol=1e-5, atol=1e-8)
+
+
+def test_batch(psfs):
+    # one DI table per cube, with one set of coefficients per cube
+    psf_ON, psf_OFF = psfs
+    batch = np.stack([psf_ON, psf_ON[::-1]])
+    di = measure_di(batch, np.stack([psf_OFF, psf_OFF]), img_sampling, exact=False)
+    assert di.shape == (2, 60, 3, 2)
+    est = estimate_from_di(di, coeffs=[coeffs, dict(coeffs, outer=0.06)])
+    ref = run_qacits(psf_ON, psf_OFF, img_sampling, coeffs=coeffs, exact=False)
+    assert np.allclose(est[0], ref, rtol=1e-5, atol=1e-8)
+    assert np.allclose(est[1][::-1, 0], ref[:, 0]/2, rtol=1e-5, atol=1e-8)
+
+
+def test_save_load(psfs, tmp_path):
+    psf_ON, psf_OFF = psfs
+    di = measure_di(psf_ON, psf_OFF, img_sampling, exact=False)
+    save_di(tmp_path/'di.npz', di, img_sampling=img_sampling, nbin=np.int64(0),
+            radii={'inner':(0,1.7), 'outer':(1.7,2.3), 'full':(0,2.7)})
+    di_read, params = load_di(tmp_path/'di.npz')
+    assert np.array_equal(di_read, di)
+    assert params == {'img_sampling': 4., 'nbin': 0,
+                      'radii': {'inner':[0,1.7], 'outer':[1.7,2.3], 'full':[0,2.7]}}
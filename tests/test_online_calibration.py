@@ -0,0 +1,56 @@
+from qacits.calibrate_qacits import calibrate_qacits, OnlineCalibration
+from qacits.util.vortex_psf import make_vortex_psfs
+import numpy as np
+import pytest
+
+img_sampling = 4.
+regions = ['inner', 'outer', 'full']
+
+
+@pytest.fixture(scope='module')
+def calib():
+    rng = np.random.default_rng(0)
+    tt = rng.uniform(-0.4, 0.4, (200, 2))
+    psf_ON, psf_OFF = make_vortex_psfs(tt, img_sampling=img_sampling, nimg=33,
+                                       flux=1e6, seed=0)
+    return tt, psf_ON, psf_OFF
+
+
+def test_online_calibration(calib):
+    # same coefficients as calibrate_qacits on all the frames given so far
+    tt, psf_ON, psf_OFF = calib
+    ref = calibrate_qacits(psf_ON, psf_OFF, img_sampling, tt, exact=False, plot_fig=False)
+    online = OnlineCalibration(psf_OFF, img_sampling, exact=False)
+    for i0 in range(0, len(tt), 30):
+        online.update(psf_ON[i0:i0+30], tt[i0:i0+30])
+    coeffs = online.get_coeffs()
+    assert online.count == len(tt)
+    assert all(np.isclose(coeffs[region], ref[region]) for region in regions)
+
+
+def test_forgetting_and_prior():
+    # synthetic DI: the slopes change after 500 frames
+    rng = np.random.default_rng(1)
+    tt = rng.uniform(-0.4, 0.4, (1000, 2))
+    tt_mod = np.hypot(tt[:,0], tt[:,1])
+    slope = np.where(np.arange(1000) < 500, 0.03, 0.04)
+    di = {'inner':2*slope*tt_mod, 'outer':slope*tt_mod, 'full':(10*slope*tt_mod)**3}
+    online = OnlineCalibration(forgetting=0.98)
+    for i0 in range(0, 1000, 100):
+        online.update_di(tt[i0:i0+100], {r: di[r][i0:i0+100] for r in regions})
+    # weight of the first 500 frames: 0.98**500 = 4e-5
+    coeffs = online.get_coeffs()
+    assert np.isclose(coeffs['outer'], 0.04, rtol=1e-4)
+    assert np.isclose(coeffs['inner'], 0.08, rtol=1e-4)
+    assert np.isclose(coeffs['full'], 0.4**3, rtol=1e-3)
+    online = OnlineCalibration()
+    online.update_di(tt, di)
+    assert 0.033 < online.get_coeffs()['outer'] < 0.037
+    # prior only, then weighted with the frames
+    prior = {'inner':0.1, 'outer':0.02, 'full':1.}
+    online = OnlineCalibration(coeffs=prior, prior_weight=1.)
+    assert online.get_coeffs() == pytest.approx(prior)
+    online.update_di(tt, di)
+    assert 0.02 < online.get_coeffs()['outer'] < 0.04
+    # no frame in the tip-tilt range
+    assert np.isnan(OnlineCalibration().get_coeffs()['outer'])
@@ -0,0 +1,76 @@
+from qacits.run_qacits import run_qacits
+from qacits.util.vortex_psf import make_vortex_psfs
+import numpy as np
+import pytest
+
+img_sampling = 4.
+coeffs = {'inner':0.08, 'outer':0.03, 'full':2.}
+
+
+@pytest.fixture(scope='module')
+def psfs():
+    rng = np.random.default_rng(0)
+    tt = rng.normal(0, 0.1, (60, 2))
+    psf_ON, psf_OFF = make_vortex_psfs(tt, img_sampling=img_sampling, nimg=49,
+                                       flux=1e6, seed=0, dtype=np.float64)
+    return psf_ON, psf_OFF
+
+
+def correct_bad_pixels(cube, bad_pixels):
+    # each bad pixel replaced by the mean of its valid 4-connected neighbours
+    cube = cube.copy()
+    ny, nx = bad_pixels.shape
+    for y, x in zip(*np.nonzero(bad_pixels)):
+        neighbours = [(y + dy, x + dx) for dy, dx in [(-1,0), (1,0), (0,-1), (0,1)]
+                      if 0 <= y + dy < ny and 0 <= x + dx < nx and not bad_pixels[y + dy, x + dx]]
+        cube[:, y, x] = np.mean([cube[:, yn, xn] for yn, xn in neighbours], axis=0)
+    return cube
+
+
+def test_fused_preprocessing(psfs):
+    # raw frames: dark, background and bad pixels, reduced by run_qacits in
+    # the same pass vs explicitly beforehand
+    psf_ON, psf_OFF = psfs
+    rng = np.random.default_rng(1)
+    shape = psf_OFF.shape
+    dark = rng.uniform(0, 5, shape)
+    background = 2.
+    bad_pixels = rng.random(shape) < 0.02
+    raw = psf_ON + dark + background
+    raw[:, bad_pixels] = 1e9*rng.random(np.sum(bad_pixels))
+
+    cube = correct_bad_pixels(raw - dark - background, bad_pixels)
+    ref = run_qacits(cube, psf_OFF, img_sampling, force=None, coeffs=coeffs, exact=False)
+    est = run_qacits(raw, psf_OFF, img_sampling, force=None, coeffs=coeffs, exact=False,
+                     dark=dark, background=background, bad_pixels=bad_pixels)
+    assert np.allclose(est, ref, rtol=1e-8, atol=1e-10)
+
+
+@pytest.mark.parametrize('saturation_mode', ['clip', 'mask'])
+def test_saturation(psfs, saturation_mode):
+    # saturated pixels clipped to the level, or masked (set to the dark and
+    # background level), in the DI pass vs explicitly beforehand
+    psf_ON, psf_OFF = psfs
+    dark = np.random.default_rng(1).uniform(0, 5, psf_OFF.shape)
+    background = 2.
+    level = 0.5*np.max(psf_ON)
+    raw = psf_ON + dark + background
+    saturated = raw > level
+    if saturation_mode == 'clip':
+        cube = np.where(saturated, level, raw) - dark - background
+    else:
+        cube = np.where(saturated, dark + background, raw) - dark - background
+
+    ref = run_qacits(cube, psf_OFF, img_sampling, force=None, coeffs=coeffs, exact=False)
+    est, n_sat = run_qacits(raw, psf_OFF, img_sampling, force=None, coeffs=coeffs,
+                            exact=False, dark=dark, background=background,
+                            saturation_level=level, saturation_mode=saturation_mode,
+                            full_output=True)
+    assert np.allclose(est, ref, rtol=1e-8, atol=1e-10)
+    assert n_sat.shape == (len(raw),) and np.sum(n_sat) > 0
+    assert np.all(n_sat <= np.sum(saturated, axis=(1,2)))
+    # n_sat only with full_output
+    est = run_qacits(raw, psf_OFF, img_sampling, force=None, coeffs=coeffs, exact=False,
+                     dark=dark, background=background, saturation_level=level,
+                     saturation_mode=saturation_mode)
+    assert np.allclose(est, ref, rtol=1e-8, atol=1e-10)
@@ -0,0 +1,84 @@
+from qacits.run_qacits import run_qacits, estimate_from_di
+from qacits.util.bin_images import bin_images
+from qacits.util.psf_flux import get_di_xy, get_all_di_xy, get_psf_flux
+from qacits.util.vortex_psf import make_vortex_psfs
+import numpy as np
+import pytest
+
+img_sampling = 4.
+radii = {'inner':(0,1.7), 'outer':(1.7,2.3), 'full':(0,2.7)}
+
+
+def reference_di_xy(cube, radius, cx=None, cy=None):
+    # per-frame sampled photometry of the original get_di_xy, in float64
+    ncube, ny, nx = cube.shape
+    if cx is None:
+        cx = (nx - 1)/2
+    if cy is None:
+        cy = (ny - 1)/2
+    if radius == 0:
+        return np.zeros((ncube, 2))
+    x, y = np.meshgrid(np.arange(nx)-cx, np.arange(ny)-cy)
+    r = np.abs(x + 1j*y)
+    di_xy = []
+    for img in cube:
+        img_mask = img*(r <= radius)
+        Sxy = np.sum(img_mask)
+        Sx = np.cumsum(np.sum(img_mask, axis=0))
+        Sy = np.cumsum(np.sum(img_mask, axis=1))
+        Ix = Sxy - 2*np.interp(cx, np.arange(nx)+.5, Sx)
+        Iy = Sxy - 2*np.interp(cy, np.arange(ny)+.5, Sy)
+        di_xy.append([Ix, Iy])
+    return np.array(di_xy)
+
+
+def reference_all_di_xy(cube, ratio=0, cx=None, cy=None):
+    di = {}
+    for region in ['inner', 'outer', 'full']:
+        r0, r1 = radii[region]
+        di[region] = (reference_di_xy(cube, r1*img_sampling, cx, cy) -
+                      reference_di_xy(cube, r0*img_sampling, cx, cy))
+    di['full'] = di['full'] + ratio*di['outer']
+    return np.stack([di[region] for region in ['inner', 'outer', 'full']], axis=1)
+
+
+@pytest.fixture(scope='module')
+def psfs():
+    rng = np.random.default_rng(0)
+    tt = rng.normal(0, 0.1, (60, 2))
+    psf_ON, psf_OFF = make_vortex_psfs(tt, img_sampling=img_sampling, nimg=49,
+                                       flux=1e6, seed=0, dtype=np.float64)
+    return psf_ON, psf_OFF
+
+
+@pytest.mark.parametrize('center', [None, 23.7])
+@pytest.mark.parametrize('radius', [0, 3., 7.3, 10.8])
+def test_get_di_xy(psfs, radius, center):
+    psf_ON, _ = psfs
+    ref = reference_di_xy(psf_ON, radius, center, center)
+    di = get_di_xy(psf_ON, radius, cx=center, cy=center, exact=False)
+    assert np.allclose(di, ref, rtol=1e-5, atol=1e-6*np.max(np.abs(ref), initial=1))
+
+
+@pytest.mark.parametrize('ratio', [0, -0.3])
+def test_all_di_xy(psfs, ratio):
+    psf_ON, _ = psfs
+    ref = reference_all_di_xy(psf_ON, ratio=ratio, cx=24.2, cy=23.9)
+    di, n_sat = get_all_di_xy(psf_ON, radii, img_sampling, ratio=ratio, cx=24.2,
+                              cy=23.9, exact=False)
+    assert np.allclose(di, ref, rtol=1e-10, atol=1e-10*np.max(np.abs(ref)))
+    assert np.all(n_sat == 0)
+
+
+@pytest.mark.parametrize('force', ['inner', 'outer', 'full', None])
+def test_run_qacits(psfs, force):
+    # binned frames, per-frame photometry and estimation of the original path
+    psf_ON, psf_OFF = psfs
+    coeffs = {'inner':0.08, 'outer':0.03, 'full':2.}
+    nbin = 12
+    psf_flux = get_psf_flux(psf_OFF, img_sampling/2, exact=False)
+    ref = reference_all_di_xy(bin_images(psf_ON, nbin), ratio=-0.2)/psf_flux
+    ref = estimate_from_di(ref, force=force, coeffs=coeffs)
+    est = run_qacits(psf_ON, psf_OFF, img_sampling, force=force, coeffs=coeffs,
+                     nbin=nbin, ratio=-0.2, exact=False)
+    assert np.allclose(est, ref, rtol=1e-8, atol=1e-10)
@@ -0,0 +1,105 @@
+from qacits.run_qacits import run_qacits
+from qacits.util.ring_buffer import FrameRingBuffer, run_qacits_consumer
+from qacits.util.vortex_psf import make_vortex_psfs
+import numpy as np
+import multiprocessing
+import pytest
+import threading
+import time
+
+
+@pytest.fixture
+def ring():
+    ring = FrameRingBuffer(shape=(4, 5), nslots=8, dtype=np.float64, max_consumers=3)
+    yield ring
+    ring.detach()
+
+
+def frames(first, n):
+    return np.arange(first, first + n, dtype=float)[:,np.newaxis,np.newaxis]*np.ones((4, 5))
+
+
+def test_read(ring):
+    consumer = ring.register()
+    ring.write(frames(0, 6))
+    view, first = ring.get_frames(consumer, max_frames=4)
+    assert first == 0 and np.array_equal(view, frames(0, 4))
+    assert view.flags.writeable is False
+    assert ring.release(consumer, first, len(view))
+    ring.write(frames(6, 5))
+    # views stop at the end of the ring
+    view, first = ring.get_frames(consumer)
+    assert first == 4 and np.array_equal(view, frames(4, 4))
+    ring.release(consumer, first, len(view))
+    view, first = ring.get_frames(consumer)
+    assert first == 8 and np.array_equal(view, frames(8, 3))
+    ring.release(consumer, first, len(view))
+    assert ring.stats() == {consumer: dict(lag=0, overruns=0)}
+
+
+def test_overruns(ring):
+    consumer = ring.register()
+    late = ring.register(from_start=True)
+    ring.write(frames(0, 20))
+    assert ring.write_count == 20
+    # the 12 oldest frames are lost
+    view, first = ring.get_frames(consumer)
+    assert first == 12 and np.array_equal(view, frames(12, 4))
+    # frames overwritten while being processed
+    view, first = ring.get_frames(late, max_frames=2)
+    ring.write(frames(20, 8))
+    assert ring.is_valid(first, len(view)) is False
+    assert ring.release(late, first, len(view)) is False
+    stats = ring.stats()
+    assert stats[consumer]['overruns'] == 12
+    assert stats[late]['overruns'] >= 14
+
+
+def test_register(ring):
+    consumers = [ring.register() for i in range(3)]
+    assert consumers == [0, 1, 2]
+    with pytest.raises(AssertionError):
+        ring.register()
+    ring.unregister(1)
+    assert ring.register() == 1
+
+
+def _register(name, lock, queue):
+    ring = FrameRingBuffer(name=name, create=False, lock=lock)
+    queue.put(ring.register())
+    ring.detach()
+
+
+def test_processes(ring):
+    # concurrent registrations from other processes, under the ring lock
+    queue = multiprocessing.Queue()
+    workers = [multiprocessing.Process(target=_register, args=(ring.name, ring.lock, queue))
+               for i in range(3)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    assert sorted(queue.get() for i in range(3)) == [0, 1, 2]
+
+
+def test_consumer():
+    # QACITS worker started before the frames are written
+    tt = np.random.default_rng(0).normal(0, 0.1, (40, 2))
+    psf_ON, psf_OFF = make_vortex_psfs(tt, img_sampling=4., nimg=33)
+    ring = FrameRingBuffer(shape=psf_OFF.shape, nslots=64)
+    estimates = []
+    results = []
+    worker = threading.Thread(target=lambda: results.append(run_qacits_consumer(
+        ring.name, psf_OFF, 4., chunk_size=16, lock=ring.lock, exact=False,
+        callback=lambda est, first: estimates.append((first, est)))))
+    worker.start()
+    while len(ring.stats()) == 0:
+        time.sleep(1e-3)
+    ring.write(psf_ON)
+    ring.close()
+    worker.join()
+    ring.detach()
+    assert [first for first, est in estimates] == [0, 16, 32]
+    ref = run_qacits(psf_ON, psf_OFF, 4., exact=False)
+    assert np.allclose(np.concatenate([est for first, est in estimates]), ref)
+    assert results == [dict(lag=0, overruns=0)]
@@ -0,0 +1,32 @@
+from qacits.run_qacits import measure_di, estimate_from_di
+from qacits.util.sweep import sweep_selection
+from qacits.util.vortex_psf import make_vortex_psfs
+import numpy as np
+import itertools
+
+img_sampling = 4.
+
+
+def test_sweep_selection():
+    # same RMS pointing errors as estimate_from_di for each combination
+    rng = np.random.default_rng(0)
+    tt = rng.uniform(-0.4, 0.4, (150, 2))
+    psf_ON, psf_OFF = make_vortex_psfs(tt, img_sampling=img_sampling, nimg=33,
+                                       flux=1e6, seed=0)
+    di = measure_di(psf_ON, psf_OFF, img_sampling, exact=False)
+    ratio = [0, -0.2]
+    coeffs = [{'inner':0.08, 'outer':0.03, 'full':2.}, {'inner':0.08, 'outer':0.03, 'full':1.5}]
+    grid = dict(phase_tolerance=[30, 60], modul_tolerance=[0.2, 0.33, 0.5],
+                small_tt_regime=[0.2, 0.3])
+    rms, best = sweep_selection(di, tt, coeffs=coeffs, ratio=ratio, chunk_size=64, **grid)
+    assert rms.shape == (2, 2, 3, 2)
+    for index in itertools.product(*[range(n) for n in rms.shape]):
+        params = {name: grid[name][index[k+1]] for k, name in enumerate(grid)}
+        est = estimate_from_di(di, force=None, coeffs=coeffs[index[0]],
+                               ratio=ratio[index[0]], **params)
+        ref = np.sqrt(np.mean(np.sum((est[:,0:2] - tt)**2, axis=1)))
+        assert np.isclose(rms[index], ref)
+    assert best['rms'] == np.min(rms)
+    index = np.unravel_index(np.argmin(rms), rms.shape)
+    assert best['coeffs'] == coeffs[index[0]]
+    assert best['modul_tolerance'] == grid['modul_tolerance'][index[2]]
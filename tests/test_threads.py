@@ -0,0 +1,53 @@
+from qacits.run_qacits import run_qacits
+from qacits.util import psf_flux
+from qacits.util.psf_flux import get_all_di_xy, get_geometry
+from qacits.util.vortex_psf import make_vortex_psfs
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import pytest
+
+img_sampling = 4.
+radii = {'inner':(0,1.7), 'outer':(1.7,2.3), 'full':(0,2.7)}
+
+
+@pytest.fixture(scope='module')
+def psf_ON():
+    rng = np.random.default_rng(0)
+    tt = rng.normal(0, 0.1, (60, 2))
+    return make_vortex_psfs(tt, img_sampling=img_sampling, nimg=49, flux=1e6,
+                            seed=0, dtype=np.float64)[0]
+
+
+def test_chunks_and_workers(psf_ON):
+    ref = get_all_di_xy(psf_ON, radii, img_sampling, exact=False)[0]
+    for chunk_size, workers in [(7, 1), (1024, 4), (13, 3)]:
+        di = get_all_di_xy(psf_ON, radii, img_sampling, exact=False,
+                           chunk_size=chunk_size, workers=workers)[0]
+        assert np.allclose(di, ref, rtol=1e-12, atol=1e-12*np.max(np.abs(ref)))
+
+
+def test_geometry_cache():
+    # concurrent calls on a new geometry share the first inserted weights
+    psf_flux._geometry_cache.clear()
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        geometries = list(pool.map(lambda cx: get_geometry((49, 49), radii,
+            img_sampling, cx=cx, exact=False), [24.1]*16))
+    assert all(geometry[0] is geometries[0][0] for geometry in geometries)
+    assert geometries[0][0].flags.writeable is False
+    assert len(psf_flux._geometry_cache) == 1
+    # least recently used geometries are dropped
+    for i in range(psf_flux._geometry_cache_size + 1):
+        get_geometry((49, 49), radii, img_sampling, cx=20 + 0.1*i, exact=False)
+    assert len(psf_flux._geometry_cache) == psf_flux._geometry_cache_size
+
+
+def test_concurrent_estimators(psf_ON):
+    # one thread per channel, with different centers
+    coeffs = {'inner':0.08, 'outer':0.03, 'full':2.}
+    centers = [23.5, 24., 24.5, 25.]
+    ref = [run_qacits(psf_ON, psf_ON[0], img_sampling, coeffs=coeffs, cx=c, cy=c,
+                      exact=False) for c in centers]
+    with ThreadPoolExecutor(max_workers=4) as pool:
+        est = list(pool.map(lambda c: run_qacits(psf_ON, psf_ON[0], img_sampling,
+            coeffs=coeffs, cx=c, cy=c, exact=False), centers))
+    assert all(np.array_equal(e, r) for e, r in zip(est, ref))
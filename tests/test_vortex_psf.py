@@ -0,0 +1,75 @@
+from qacits.run_qacits import run_qacits
+from qacits.util.vortex_psf import make_vortex_psfs, circular_pupil
+import numpy as np
+import pytest
+
+img_sampling = 4.
+nimg = 49
+center = (nimg - 1)/2
+
+
+def centroid(img):
+    y, x = np.indices(img.shape)
+    return np.sum(x*img)/np.sum(img), np.sum(y*img)/np.sum(img)
+
+
+def test_pupil():
+    pupil = circular_pupil(64, obstruction=0.25, npad=128)
+    assert pupil.shape == (128, 128)
+    r = np.hypot(*np.indices(pupil.shape) - 64.)
+    assert np.all(pupil[r < 7.5] == 0) and np.all(pupil[(r > 8.5) & (r < 31.5)] == 1)
+    assert np.all(pupil[r > 32.5] == 0)
+
+
+def test_off_axis_psf():
+    # normalized to a unit total flux within the image, or to flux
+    _, psf_OFF = make_vortex_psfs(np.zeros((1, 2)), img_sampling=img_sampling,
+                                  nimg=nimg, dtype=np.float64)
+    assert np.isclose(np.sum(psf_OFF), 1)
+    assert np.unravel_index(np.argmax(psf_OFF), psf_OFF.shape) == (center, center)
+    assert np.allclose(psf_OFF, psf_OFF[::-1, ::-1])
+    _, psf_OFF_flux = make_vortex_psfs(np.zeros((1, 2)), img_sampling=img_sampling,
+                                       nimg=nimg, flux=1e6, seed=0, dtype=np.float64)
+    assert np.allclose(psf_OFF_flux, 1e6*psf_OFF)
+
+
+def test_rejection():
+    # on-axis starlight rejected by the vortex (unobstructed pupil), except
+    # the tip-tilt leakage
+    tt = np.array([[0, 0], [0.05, 0], [0.2, 0]])
+    psf_ON, psf_OFF = make_vortex_psfs(tt, img_sampling=img_sampling, nimg=nimg,
+                                       obstruction=0.)
+    flux = np.sum(psf_ON, axis=(1,2))
+    assert flux[0] < 1e-3
+    assert flux[0] < flux[1] < flux[2] < 0.5
+    assert np.max(psf_ON[0]) < 1e-4*np.max(psf_OFF)
+
+
+@pytest.mark.parametrize('tt', [(0.5, 0), (0, -0.5), (0.3, 0.4)])
+def test_tiptilt_sign(tt):
+    # non-coronagraphic PSF (leak=1) shifted by +tt_lamD*img_sampling [pix]
+    psf_ON, _ = make_vortex_psfs([tt], img_sampling=img_sampling, nimg=nimg, leak=1.,
+                                 dtype=np.float64)
+    cx, cy = centroid(psf_ON[0])
+    assert np.allclose([cx - center, cy - center], np.array(tt)*img_sampling, atol=0.1)
+
+
+def test_qacits_sign():
+    # the QACITS estimate of the coronagraphic PSFs is +tt_lamD
+    tt = np.array([[0.1, 0], [0, 0.1], [-0.07, 0.07], [0.05, -0.1]])
+    psf_ON, psf_OFF = make_vortex_psfs(tt, img_sampling=img_sampling, nimg=nimg)
+    for force in ['inner', 'outer']:
+        est = run_qacits(psf_ON, psf_OFF, img_sampling, force=force, exact=False)
+        cos = np.sum(est[:,0:2]*tt, axis=1)/np.hypot(*est[:,0:2].T)/np.hypot(*tt.T)
+        assert np.all(cos > 0.99)
+
+
+def test_chunks_and_dtype():
+    tt = np.random.default_rng(0).uniform(-0.2, 0.2, (10, 2))
+    ref, ref_OFF = make_vortex_psfs(tt, img_sampling=img_sampling, nimg=nimg,
+                                    dtype=np.float64)
+    psf_ON, psf_OFF = make_vortex_psfs(tt, img_sampling=img_sampling, nimg=nimg,
+                                       nchunk=3)
+    assert psf_ON.dtype == psf_OFF.dtype == np.float32
+    assert np.allclose(psf_ON, ref, atol=1e-6*np.max(ref_OFF))
+    assert np.allclose(psf_OFF, ref_OFF, atol=1e-6*np.max(ref_OFF))